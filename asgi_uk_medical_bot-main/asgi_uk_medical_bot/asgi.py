@@ -44,13 +44,15 @@ from django.core.asgi import get_asgi_application
 from channels.routing import ProtocolTypeRouter, URLRouter
 from channels.auth import AuthMiddlewareStack
 from starlette.staticfiles import StaticFiles
-import robot_management.routing
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'asgi_uk_medical_bot.settings')
 
 # Django ASGI application
 django_asgi_app = get_asgi_application()
 
+# the consumers import models, so they load once the app registry is ready
+import robot_management.routing
+
 # Get BASE_DIR from settings or calculate manually
 BASE_DIR = Path(__file__).resolve().parent.parent
 
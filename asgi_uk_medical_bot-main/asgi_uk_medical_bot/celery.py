@@ -6,4 +6,7 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE','asgi_uk_medical_bot.settings')
 app = Celery('asgi_uk_medical_bot')
 app.config_from_object('django.conf:settings',namespace='CELERY')
 # app.autodiscover_tasks()
-app.autodiscover_tasks(['mainapp', 'schedule_rounds'])
+app.autodiscover_tasks(['mainapp', 'schedule_rounds', 'robot_management'])
+
+# task duration metrics (Celery signal handlers)
+import utils.metrics  # noqa: E402,F401
@@ -63,6 +63,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'utils.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -279,6 +280,12 @@ CELERY_BEAT_SCHEDULE = {
         'schedule': crontab(hour=1, minute=0, day_of_month=1),  # 1 AM, 1st day of month
     },
 
+    # publishes outbox events left pending by the in-process relays
+    'relay-outbox-every-minute': {
+        'task': 'robot_management.tasks.relay_outbox',
+        'schedule': crontab(),
+    },
+
     # 'clear-log-file-every-2-minutes': {
     #     'task': 'schedule_rounds.tasks.clear_log_file',
     #     'schedule': crontab(minute='*/2'),  # every 2 minutes
@@ -336,5 +343,149 @@ CHANNEL_LAYERS = {
     },
 }
 
+# Shared cache for the RobotTelemetry hot state (robot_management/state.py).
+# Every ASGI and Celery process must see the same version counter, so it
+# is Redis (the compose "redis" service unless REDIS_CACHE_URL is set);
+# robot_management refuses to start with a process-local backend here.
+REDIS_CACHE_URL = os.environ.get("REDIS_CACHE_URL", "redis://redis:6379/1")
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "robot_state": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": REDIS_CACHE_URL,
+    },
+}
+ROBOT_STATE_CACHE = "robot_state"
+
+# Telemetry history: samples per stored chunk and max chunk span (seconds),
+# also how long a partial chunk stays in memory before it is flushed
+TELEMETRY_HISTORY_CHUNK_SIZE = 200
+TELEMETRY_HISTORY_CHUNK_SECONDS = 10
+
+# Max broadcast rate (messages/second, per process) for high-rate groups.
+# Only the newest payload is kept between flushes; unlisted groups are not throttled.
+TELEMETRY_BROADCAST_RATES = {
+    "arm_endpose_value_group": 10,
+    "joint_velocity_value_group": 10,
+    "joint_effort_value_group": 10,
+    "joint_position_value_group": 10,
+    "joint_heat_group": 10,
+    "telemetry_frame_group": 10,
+    "robot_movement": 10,
+}
+
+# Deadband per stream: a sample is stored and broadcast only when some
+# field moved more than epsilon (a number, or per-field dict with an
+# optional "default"), or TELEMETRY_KEYFRAME_SECONDS passed since the last
+# full sample. Streams not listed are never filtered.
+TELEMETRY_DEADBAND = {
+    "arm_endpose": {"x": 0.5, "y": 0.5, "z": 0.5, "rx": 0.2, "ry": 0.2, "rz": 0.2},
+    "joint_position": 0.1,
+    "joint_velocity": 0.1,
+    "joint_effort": 0.1,
+}
+TELEMETRY_KEYFRAME_SECONDS = 5
+
+# Anomaly detection on robot health values (robot_management/anomaly.py).
+# Rules: stream -> field ("*" = every field) -> limit and the direction it
+# is approached from. Alerts go to notification_group when a value hits
+# its limit, is forecast to within HORIZON_SECONDS (EWMA + slope over the
+# last WINDOW samples) or jumps towards its limit by more than Z_SCORE
+# deviations; each field/kind alerts at most once per COOLDOWN_SECONDS.
+TELEMETRY_ANOMALY_RULES = {
+    "joint_heat": {"*": {"limit": 65.0, "direction": "rising"}},
+    "battery_status": {
+        "temperature": {"limit": 50.0, "direction": "rising"},
+        "charge": {"limit": 15.0, "direction": "falling"},
+    },
+}
+TELEMETRY_ANOMALY_WINDOW = 120
+TELEMETRY_ANOMALY_EWMA_ALPHA = 0.1
+TELEMETRY_ANOMALY_Z_SCORE = 4.0
+TELEMETRY_ANOMALY_HORIZON_SECONDS = 600
+TELEMETRY_ANOMALY_MIN_SAMPLES = 10
+TELEMETRY_ANOMALY_COOLDOWN_SECONDS = 300
+
+# Battery runtime forecast (robot_management/battery.py). The discharge
+# rate is fitted over the charge samples of the last WINDOW_SECONDS since
+# the last recharge (at least MIN_SAMPLES); runtime is counted down to
+# RESERVE_CHARGE percent. The scheduler estimates a round as
+# ROUND_SECONDS_PER_SLOT per scheduled slot.
+BATTERY_FORECAST_WINDOW_SECONDS = 1800
+BATTERY_FORECAST_MIN_SAMPLES = 10
+BATTERY_RESERVE_CHARGE = 20.0
+BATTERY_ROUND_SECONDS_PER_SLOT = 120
+
+# Per-connection WebSocket outbound queue (messages) and how many frames a
+# client may drop in one backlog before it is disconnected.
+WEBSOCKET_SEND_QUEUE_SIZE = 256
+WEBSOCKET_MAX_BACKLOG_DROPS = 1000
+# How long the last payload of a state topic is kept for new subscribers (seconds).
+WEBSOCKET_SNAPSHOT_TTL = 86400
+
+# Transactional outbox relay (robot_management/outbox.py): events per
+# batch, retry interval (seconds), attempts before an event is given up,
+# and how long published events are kept (days).
+OUTBOX_BATCH_SIZE = 100
+OUTBOX_POLL_SECONDS = 5
+OUTBOX_MAX_ATTEMPTS = 20
+OUTBOX_RETENTION_DAYS = 7
+
+# Write-behind buffer for telemetry rows (robot_management/writebehind.py):
+# flush interval (seconds, 0 writes through; also how much of the journal
+# a machine crash can lose), buffered samples that force an early flush,
+# where the crash journal is kept, and the shared cache direct saves are
+# announced to every process through.
+WRITE_BEHIND_FLUSH_SECONDS = 1.0
+WRITE_BEHIND_MAX_PENDING = 500
+WRITE_BEHIND_JOURNAL_DIR = os.path.join(BASE_DIR, 'logs', 'journal')
+WRITE_BEHIND_CACHE = ROBOT_STATE_CACHE
+
+# Telemetry recorder (robot_management/recorder.py): directory incoming
+# robot messages are recorded to (unset disables recording) and the size
+# (bytes) after which a new recording file is started. Replay recordings
+# with `manage.py replay_telemetry`.
+TELEMETRY_RECORD_DIR = os.environ.get("TELEMETRY_RECORD_DIR")
+TELEMETRY_RECORD_SEGMENT_BYTES = 256 * 1024 * 1024
+
+# Prometheus metrics (utils/metrics.py): /metrics answers requests carrying
+# METRICS_TOKEN as a bearer token (unset refuses every scrape), and Celery
+# workers serve their own metrics on CELERY_METRICS_PORT (unset serves none).
+# With several processes per container, set the PROMETHEUS_MULTIPROC_DIR
+# environment variable to a directory of that container; entrypoint.sh
+# empties it before the processes start.
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
+CELERY_METRICS_PORT = int(os.environ.get("CELERY_METRICS_PORT", 0))
+
 MEDIA_URL = '/media/'
-MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
\ No newline at end of file
+MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+# Edge length in pixels of the map tiles served by the tile endpoint
+# (robot_management/tiles.py).
+MAP_TILE_SIZE = 256
+
+# Path cost engine over the active map (robot_management/pathing.py). The
+# STCM header stores origin and resolution as integers in
+# 1/MAP_UNITS_PER_METRE metres; room and slot coordinates are in metres,
+# with y pointing up the map image when MAP_Y_UP. Paths are searched on
+# PATH_CELL_METRES blocks: in full from room entry/exit points, within
+# PATH_LOCAL_METRES from bed slots (farther slot pairs are joined through
+# the entry/exit points). The costs are built by a Celery task; one still
+# building after PATH_COST_BUILD_TIMEOUT_SECONDS is queued again.
+# ROBOT_TRAVEL_SPEED (m/s) turns lengths into travel times.
+MAP_UNITS_PER_METRE = 1000
+MAP_Y_UP = True
+PATH_CELL_METRES = 0.25
+PATH_LOCAL_METRES = 20.0
+PATH_COST_BUILD_TIMEOUT_SECONDS = 15 * 60
+ROBOT_TRAVEL_SPEED = 0.5
+
+# Reorder the rooms of a batch, and the beds within each room, for the
+# shortest path over the active map each time the batch is dispatched
+# (schedule_rounds/optimizer.py). Slots marked order_pinned keep their
+# place, rooms with a room_pinned slot (swapped by hand) their position.
+# Off by default: orders are then only changed through the
+# optimize-room-order endpoint.
+SCHEDULE_OPTIMIZE_ROUTES = False
@@ -20,6 +20,8 @@ from django.http import HttpResponse
 from django.conf.urls.static import static
 from django.urls import path, include, re_path
 
+from utils.metrics import metrics_view
+
 from rest_framework import permissions
 # from drf_yasg.views import get_schema_view
 # from drf_yasg import openapi
@@ -77,6 +79,7 @@ urlpatterns = [
     path('api/medicalbot/vitals_management/',include('vitals_management.urls')),
     path('api/medicalbot/robot_management/',include('robot_management.urls')),
     
+    path('metrics', metrics_view),
     path('swagger/', schema_view.with_ui('swagger', cache_timeout=0)),
     path('redoc/', schema_view.with_ui('redoc', cache_timeout=0))
 
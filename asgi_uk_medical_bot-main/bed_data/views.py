@@ -5,6 +5,7 @@ from rest_framework import status
 import logging
 from .models import RoomDataModel, BedDataModel, SlotDataModel, RoomPositionModel
 from privilagecontroller.views import hasFeatureAccess
+from robot_management.pathing import engine as path_engine
 from .serializer import RoomDataSerializer, BedDataSerializer, SlotDataModelSerializer, RoomPositionModelSerializer
 from django.db import IntegrityError
 from django.db import connection
@@ -386,6 +387,8 @@ def create_slot_position(request):
                 yaw=yaw,
                 # updated_by=request.user
             )
+            # rebuild the path costs for the new position
+            path_engine.queue()
             return Response({'status': 'success', 'message': 'Slot created successfully.', 'data': None}, status=status.HTTP_201_CREATED)
 
         except IntegrityError:
@@ -569,6 +572,8 @@ def create_room_entry_point(request):
                 entry_point_yaw=yaw,
                 # updated_by=request.user
             )
+            # rebuild the path costs for the new position
+            path_engine.queue()
             return Response({'status': 'success', 'message': 'Room entry position created successfully.', 'data': None}, status=status.HTTP_201_CREATED)
 
         except Exception as e:
@@ -614,6 +619,8 @@ def create_room_exit_point(request):
                 exit_point_yaw=yaw,
                 # updated_by=request.user
             )
+            # rebuild the path costs for the new position
+            path_engine.queue()
             return Response({'status': 'success', 'message': 'Room exit position created successfully.', 'data': None}, status=status.HTTP_201_CREATED)
 
         except Exception as e:
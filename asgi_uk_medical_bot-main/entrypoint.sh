@@ -35,7 +35,13 @@ else
   echo "Skipping migrations."
 fi
 
-# 4. Execute CMD
+# 4. Start Prometheus multiprocess metrics from an empty directory
+if [ -n "$PROMETHEUS_MULTIPROC_DIR" ]; then
+  rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+  mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+fi
+
+# 5. Execute CMD
 exec "$@"
 
 
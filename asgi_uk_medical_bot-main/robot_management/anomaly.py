@@ -0,0 +1,214 @@
+import logging
+import math
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+
+from . import outbox
+from .robots import DEFAULT_ROBOT_ID
+
+logger = logging.getLogger(__name__)
+
+NOTIFICATION_GROUP = "notification_group"
+NOTIFICATION_MESSAGE = "notification_message"
+
+
+class RollingSeries:
+    """
+    Rolling statistics of one field: EWMA mean and variance, and the last
+    `size` (time, value) samples in a fixed NumPy ring buffer for the
+    least-squares slope.
+
+    The regression sums are updated per sample (add the new sample,
+    subtract the evicted one), so slope() is O(1). Once per window they
+    are recomputed from the buffer around the newest timestamp, which
+    keeps float error from building up.
+    """
+
+    __slots__ = ("times", "values", "count", "head", "mean", "var", "origin", "sums", "since_resync")
+
+    def __init__(self, size):
+        self.times = np.zeros(size)
+        self.values = np.zeros(size)
+        self.count = 0
+        self.head = 0
+        self.mean = None
+        self.var = 0.0
+        self.origin = None
+        # sum of t, v, t*t and t*v, with t relative to origin
+        self.sums = [0.0, 0.0, 0.0, 0.0]
+        self.since_resync = 0
+
+    def add(self, timestamp, value, alpha):
+        """Add a sample; returns its z-score against the statistics before it (None while flat)."""
+        z = None
+        if self.mean is None:
+            self.mean = value
+            self.origin = timestamp
+        else:
+            if self.var > 0:
+                z = (value - self.mean) / math.sqrt(self.var)
+            diff = value - self.mean
+            self.mean += alpha * diff
+            self.var = (1 - alpha) * (self.var + alpha * diff * diff)
+
+        size = len(self.values)
+        sums = self.sums
+        if self.count == size:
+            t, v = float(self.times[self.head]) - self.origin, float(self.values[self.head])
+            sums[0] -= t
+            sums[1] -= v
+            sums[2] -= t * t
+            sums[3] -= t * v
+        self.times[self.head] = timestamp
+        self.values[self.head] = value
+        self.head = (self.head + 1) % size
+        self.count = min(self.count + 1, size)
+
+        t = timestamp - self.origin
+        sums[0] += t
+        sums[1] += value
+        sums[2] += t * t
+        sums[3] += t * value
+        self.since_resync += 1
+        if self.since_resync >= size:
+            self._resync()
+        return z
+
+    def _resync(self):
+        times = self.times[:self.count]
+        values = self.values[:self.count]
+        self.origin = float(times.max())
+        times = times - self.origin
+        self.sums = [float(times.sum()), float(values.sum()), float(times @ times), float(times @ values)]
+        self.since_resync = 0
+
+    def slope(self):
+        """Units per second over the buffered window, or None with too few samples."""
+        n = self.count
+        if n < 3:
+            return None
+        sum_t, sum_v, sum_tt, sum_tv = self.sums
+        denom = n * sum_tt - sum_t * sum_t
+        if denom <= 1e-9 * n * max(sum_tt, 1.0):
+            return None
+        return (n * sum_tv - sum_t * sum_v) / denom
+
+
+class AnomalyDetector:
+    """
+    Streaming checks on slow-moving robot health values (joint heat,
+    battery), so the robot can be docked before a hard limit trips.
+
+    TELEMETRY_ANOMALY_RULES maps a stream to its fields ("*" for every
+    field) and each field to a "limit" and the "direction" it is
+    approached from ("rising" or "falling"). For every sample a field gets:
+      - "limit":    the value is at or past the limit
+      - "forecast": the EWMA, moving at the current slope, reaches the
+                    limit within TELEMETRY_ANOMALY_HORIZON_SECONDS
+      - "spike":    the z-score against the EWMA exceeds
+                    TELEMETRY_ANOMALY_Z_SCORE towards the limit
+    Forecasts and spikes need TELEMETRY_ANOMALY_MIN_SAMPLES samples
+    first. An alert goes to notification_group (through the outbox, off
+    the ingest path) at most once per field and kind every
+    TELEMETRY_ANOMALY_COOLDOWN_SECONDS. State is per process.
+    """
+
+    def __init__(self, rules=None, window=None, alpha=None, z_score=None, horizon=None,
+                 min_samples=None, cooldown=None):
+        self.rules = rules if rules is not None else getattr(settings, "TELEMETRY_ANOMALY_RULES", {})
+        self.window = window or getattr(settings, "TELEMETRY_ANOMALY_WINDOW", 120)
+        self.alpha = alpha or getattr(settings, "TELEMETRY_ANOMALY_EWMA_ALPHA", 0.1)
+        self.z_score = z_score or getattr(settings, "TELEMETRY_ANOMALY_Z_SCORE", 4.0)
+        self.horizon = horizon or getattr(settings, "TELEMETRY_ANOMALY_HORIZON_SECONDS", 600)
+        self.min_samples = min_samples or getattr(settings, "TELEMETRY_ANOMALY_MIN_SAMPLES", 10)
+        self.cooldown = cooldown or getattr(settings, "TELEMETRY_ANOMALY_COOLDOWN_SECONDS", 300)
+        self._lock = threading.Lock()
+        self._series = {}
+        self._alerted = {}
+
+    def observe(self, stream, values, robot_id=DEFAULT_ROBOT_ID, timestamp=None):
+        """
+        Feed one sample: a dict of the field values it carries, only the
+        fields that were measured. Returns the alerts raised.
+        """
+        rules = self.rules.get(stream)
+        if not rules:
+            return []
+        timestamp = time.time() if timestamp is None else timestamp
+
+        alerts = []
+        with self._lock:
+            for field, value in values.items():
+                rule = rules.get(field) or rules.get("*")
+                if rule is None:
+                    continue
+                try:
+                    value = float(value)
+                except (TypeError, ValueError):
+                    continue
+                key = (robot_id, stream, field)
+                series = self._series.get(key)
+                if series is None:
+                    series = self._series[key] = RollingSeries(self.window)
+                z = series.add(timestamp, value, self.alpha)
+
+                alert = self._evaluate(series, value, z, rule)
+                if alert is None:
+                    continue
+                kind = alert[0]
+                now = time.monotonic()
+                if now - self._alerted.get(key + (kind,), -math.inf) < self.cooldown:
+                    continue
+                self._alerted[key + (kind,)] = now
+                alerts.append({"robot_id": robot_id, "stream": stream, "field": field, "kind": kind,
+                               "value": value, "detail": alert[1]})
+
+        for alert in alerts:
+            self._notify(alert)
+        return alerts
+
+    def _evaluate(self, series, value, z, rule):
+        limit = rule["limit"]
+        rising = rule.get("direction", "rising") == "rising"
+        if (value >= limit) if rising else (value <= limit):
+            return "limit", None
+        if series.count < self.min_samples:
+            return None
+
+        slope = series.slope()
+        if slope is not None and (slope > 0 if rising else slope < 0):
+            seconds = (limit - series.mean) / slope
+            if 0 <= seconds <= self.horizon:
+                return "forecast", seconds
+        if z is not None and (z >= self.z_score if rising else z <= -self.z_score):
+            return "spike", z
+        return None
+
+    def _notify(self, alert):
+        robot = "" if alert["robot_id"] == DEFAULT_ROBOT_ID else f"Robot {alert['robot_id']}: "
+        name = f"{alert['stream'].replace('_', ' ')} {alert['field']}"
+        if alert["kind"] == "limit":
+            icon, text = "error", f"{robot}{name} reached {alert['value']:g}"
+        elif alert["kind"] == "forecast":
+            icon, text = "warning", f"{robot}{name} at {alert['value']:g}, limit expected in {alert['detail'] / 60:.0f} min"
+        else:
+            icon, text = "warning", f"{robot}{name} jumped to {alert['value']:g} (z={alert['detail']:.1f})"
+        logger.warning(f"Telemetry anomaly: {text}")
+        try:
+            outbox.enqueue(NOTIFICATION_GROUP, {
+                "type": NOTIFICATION_MESSAGE,
+                "payload": {"icon": icon, "notification": text},
+            })
+        except Exception as e:
+            logger.exception(f"Failed to queue anomaly notification: {e}")
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+            self._alerted.clear()
+
+
+detector = AnomalyDetector()
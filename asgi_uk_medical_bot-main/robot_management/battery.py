@@ -0,0 +1,209 @@
+import atexit
+import logging
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+from django.db import IntegrityError
+from django.db.models import F, Value
+from django.db.models.functions import Coalesce, Greatest, Least
+
+from .robots import DEFAULT_ROBOT_ID
+from .timeseries import BATTERY_FIELDS, _from_epoch, _to_epoch, history
+
+logger = logging.getLogger(__name__)
+
+BATTERY_STREAM = "battery"
+
+# rollup resolution -> bucket length in seconds
+RESOLUTIONS = {"minute": 60, "hour": 3600}
+
+# a charge step up of more than this (percent) is taken as a recharge
+RECHARGE_STEP = 0.5
+
+
+def parse_sample(instance):
+    """
+    Float values of the BatteryStatus fields in BATTERY_FIELDS order, or
+    None when one of them is not numeric (the columns are CharFields).
+    """
+    try:
+        return [float(getattr(instance, field)) for field in BATTERY_FIELDS]
+    except (TypeError, ValueError):
+        return None
+
+
+def record(instance, recorded_at=None, robot_id=DEFAULT_ROBOT_ID):
+    """
+    Append the state of a saved BatteryStatus to the battery history and
+    the rollups. Samples with a non-numeric field are skipped.
+    """
+    row = parse_sample(instance)
+    if row is None:
+        logger.warning(f"Skipping non-numeric battery sample for robot {robot_id}")
+        return
+    ts = _to_epoch(recorded_at)
+    history.record(BATTERY_STREAM, row, ts, robot_id=robot_id)
+    rollups.add(row, ts, robot_id)
+
+
+class BatteryRollups:
+    """
+    Minute and hour BatteryRollup rows, built incrementally.
+
+    Samples are summed per robot for the current minute in memory; when
+    the first sample of a later minute arrives, the closed minute is
+    merged into its minute and hour rows with one UPDATE each (sums added,
+    min/max widened), so each process writes twice a minute per robot and
+    several processes can feed the same bucket. The open minute is written
+    by flush(), which runs at exit.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # robot_id -> [minute start (epoch), samples, sums, mins, maxs]
+        self._open = {}
+
+    def add(self, row, timestamp, robot_id=DEFAULT_ROBOT_ID):
+        values = np.asarray(row, dtype=np.float64)
+        minute = timestamp - timestamp % RESOLUTIONS["minute"]
+        closed = None
+        with self._lock:
+            bucket = self._open.get(robot_id)
+            if bucket is not None and bucket[0] != minute:
+                closed = self._open.pop(robot_id)
+                bucket = None
+            if bucket is None:
+                self._open[robot_id] = [minute, 1, values.copy(), values.copy(), values.copy()]
+            else:
+                bucket[1] += 1
+                bucket[2] += values
+                np.minimum(bucket[3], values, out=bucket[3])
+                np.maximum(bucket[4], values, out=bucket[4])
+
+        if closed:
+            self._merge(robot_id, *closed)
+
+    def flush(self):
+        with self._lock:
+            pending = list(self._open.items())
+            self._open.clear()
+        for robot_id, bucket in pending:
+            self._merge(robot_id, *bucket)
+
+    def _merge(self, robot_id, minute, samples, sums, mins, maxs):
+        try:
+            for resolution, seconds in RESOLUTIONS.items():
+                start = _from_epoch(minute - minute % seconds)
+                self._upsert(robot_id, resolution, start, samples, sums, mins, maxs)
+        except Exception as e:
+            logger.exception(f"Failed to write battery rollup for robot {robot_id}: {e}")
+
+    def _upsert(self, robot_id, resolution, bucket_start, samples, sums, mins, maxs):
+        from .models import BatteryRollup
+
+        rows = BatteryRollup.objects.filter(robot_id=robot_id, resolution=resolution, bucket_start=bucket_start)
+        changes = {"samples": F("samples") + samples}
+        for i, field in enumerate(BATTERY_FIELDS):
+            low, high = Value(float(mins[i])), Value(float(maxs[i]))
+            changes[f"{field}_sum"] = F(f"{field}_sum") + float(sums[i])
+            # Least/Greatest return NULL on SQLite if any argument is NULL
+            changes[f"{field}_min"] = Least(Coalesce(F(f"{field}_min"), low), low)
+            changes[f"{field}_max"] = Greatest(Coalesce(F(f"{field}_max"), high), high)
+        if rows.update(**changes):
+            return
+
+        fields = {"samples": samples}
+        for i, field in enumerate(BATTERY_FIELDS):
+            fields[f"{field}_sum"] = float(sums[i])
+            fields[f"{field}_min"] = float(mins[i])
+            fields[f"{field}_max"] = float(maxs[i])
+        try:
+            BatteryRollup.objects.create(
+                robot_id=robot_id, resolution=resolution, bucket_start=bucket_start, **fields
+            )
+        except IntegrityError:
+            # another process created the bucket first
+            rows.update(**changes)
+
+
+class BatteryForecaster:
+    """
+    Runtime estimate from the recent battery history.
+
+    The charge samples of the last BATTERY_FORECAST_WINDOW_SECONDS since
+    the robot was last recharged are fitted with a weighted least-squares
+    line (weights decay with age, so the current round load dominates);
+    its slope is the discharge rate, and the runtime is the time for the
+    fitted charge to fall to BATTERY_RESERVE_CHARGE.
+    """
+
+    def __init__(self, window=None, reserve=None, min_samples=None):
+        self.window = window or getattr(settings, "BATTERY_FORECAST_WINDOW_SECONDS", 1800)
+        self.reserve = reserve if reserve is not None else getattr(settings, "BATTERY_RESERVE_CHARGE", 20.0)
+        self.min_samples = min_samples or getattr(settings, "BATTERY_FORECAST_MIN_SAMPLES", 10)
+
+    def estimate(self, robot_id=DEFAULT_ROBOT_ID, now=None):
+        """
+        Returns a dict with the latest "charge", "discharge_per_hour"
+        (percent), "runtime_seconds" until the reserve (None unless
+        discharging), "reserve", the "samples" fitted and "status":
+        "discharging", "charging", "steady" or "unknown" (too few samples).
+        """
+        now = time.time() if now is None else _to_epoch(now)
+        stamps, values = history.load(BATTERY_STREAM, now - self.window, now, robot_id=robot_id)
+        charge = values[:, BATTERY_FIELDS.index("charge")].astype(np.float64)
+
+        forecast = {
+            "charge": round(float(charge[-1]), 2) if len(charge) else None,
+            "discharge_per_hour": None,
+            "runtime_seconds": None,
+            "reserve": self.reserve,
+            "samples": 0,
+            "status": "unknown",
+        }
+
+        rises = np.flatnonzero(np.diff(charge) > RECHARGE_STEP)
+        if len(rises):
+            if rises[-1] + 1 >= len(charge) - 1:
+                # charge went up on the latest samples
+                forecast["status"] = "charging"
+                return forecast
+            stamps, charge = stamps[rises[-1] + 1:], charge[rises[-1] + 1:]
+
+        forecast["samples"] = len(charge)
+        if len(charge) < self.min_samples or stamps[-1] - stamps[0] <= 0:
+            return forecast
+
+        t = stamps - stamps[-1]
+        # polyfit weights multiply the residuals, not their squares
+        weights = np.sqrt(np.exp(t / (self.window / 3.0)))
+        slope, level = np.polyfit(t, charge, 1, w=weights)
+
+        per_hour = -slope * 3600.0
+        forecast["discharge_per_hour"] = round(float(per_hour), 3)
+        if slope < 0:
+            forecast["status"] = "discharging"
+            forecast["runtime_seconds"] = max(0, int((level - self.reserve) / -slope))
+        else:
+            forecast["status"] = "charging" if per_hour < -RECHARGE_STEP else "steady"
+        return forecast
+
+    def can_run(self, seconds, robot_id=DEFAULT_ROBOT_ID):
+        """
+        Returns (verdict, forecast). verdict is whether the robot can run
+        for `seconds` before reaching the reserve, or None if unknown.
+        """
+        forecast = self.estimate(robot_id)
+        if forecast["status"] == "discharging":
+            return forecast["runtime_seconds"] >= seconds, forecast
+        if forecast["status"] in ("charging", "steady") and forecast["charge"] is not None:
+            return forecast["charge"] > self.reserve, forecast
+        return None, forecast
+
+
+rollups = BatteryRollups()
+forecaster = BatteryForecaster()
+
+atexit.register(rollups.flush)
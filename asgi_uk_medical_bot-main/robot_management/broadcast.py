@@ -0,0 +1,174 @@
+import asyncio
+import logging
+import threading
+import time
+
+from django.conf import settings
+
+from channels.layers import get_channel_layer
+from asgiref.sync import async_to_sync, sync_to_async, SyncToAsync
+
+from utils import metrics
+
+from . import snapshots
+from .robots import base_group
+
+logger = logging.getLogger(__name__)
+
+
+class _GroupState:
+    __slots__ = ("last_sent", "pending", "flush_scheduled")
+
+    def __init__(self):
+        self.last_sent = 0.0
+        self.pending = None
+        self.flush_scheduled = False
+
+
+def _encoded(message):
+    # topics -> telemetry -> broadcast, so import on use
+    from .topics import encode_event
+    return encode_event(message)
+
+
+def _merge_changed(old, new):
+    # None means "everything changed" (keyframe)
+    if old is None or new is None:
+        return None
+    return list(dict.fromkeys([*old, *new]))
+
+
+def merge_pending(old, new):
+    """
+    Fold `new` into a still-pending `old` message. The newest payload wins,
+    but the "changed" field lists of delta messages are unioned so delta
+    clients never miss a change that was coalesced away. Frame messages
+    (where "changed" is keyed by stream) also keep sections the newer
+    frame does not carry.
+    """
+    if old is None or "changed" not in new or "changed" not in old:
+        return new
+    old_changed, new_changed = old["changed"], new["changed"]
+    if isinstance(new_changed, dict) and isinstance(old_changed, dict):
+        changed = dict(old_changed)
+        for key, fields in new_changed.items():
+            changed[key] = _merge_changed(old_changed[key], fields) if key in old_changed else fields
+        payload = {**old["payload"], **new["payload"]}
+        return {**new, "payload": payload, "changed": changed}
+    return {**new, "changed": _merge_changed(old_changed, new_changed)}
+
+
+class CoalescingBroadcaster:
+    """
+    Latest-value-wins throttle in front of channel_layer.group_send.
+
+    Groups listed in `rates` (messages per second) are sent at most once
+    per interval: the first sample in a quiet period goes out at once,
+    later ones overwrite a single pending slot that is flushed when the
+    interval ends. Groups without a rate are passed straight through.
+    Per-robot groups use the rate of their shared group name. Rates apply
+    per process. Messages that are actually sent on topics
+    with a snapshot are retained as the group's last value (snapshots.py).
+    Payloads are JSON-encoded once here, not once per subscriber.
+    """
+
+    def __init__(self, rates=None):
+        self.rates = dict(rates if rates is not None else getattr(settings, "TELEMETRY_BROADCAST_RATES", {}))
+        self._lock = threading.Lock()
+        self._groups = {}
+
+    def _offer(self, group, message, loop=None):
+        """
+        Returns the message if it may be sent now, otherwise parks it as
+        the group's pending value and makes sure a flush is scheduled.
+        """
+        rate = self.rates.get(group) or self.rates.get(base_group(group))
+        if not rate:
+            return message
+
+        interval = 1.0 / rate
+        with self._lock:
+            state = self._groups.setdefault(group, _GroupState())
+            if state.flush_scheduled:
+                state.pending = merge_pending(state.pending, message)
+                return None
+
+            now = time.monotonic()
+            wait = state.last_sent + interval - now
+            if wait <= 0:
+                state.last_sent = now
+                return message
+
+            state.pending = message
+            state.flush_scheduled = True
+
+        self._schedule_flush(group, wait, loop)
+        return None
+
+    def _take_pending(self, group):
+        with self._lock:
+            state = self._groups[group]
+            message, state.pending = state.pending, None
+            state.flush_scheduled = False
+            state.last_sent = time.monotonic()
+            return message
+
+    def _schedule_flush(self, group, delay, loop):
+        if loop is not None:
+            loop.call_later(delay, lambda: loop.create_task(self._flush(group)))
+            return
+        # sync views under ASGI run in a worker thread of the server loop;
+        # flush there so the send shares the loop of the channel layer
+        server_loop = getattr(SyncToAsync.threadlocal, "main_event_loop", None)
+        if server_loop is not None and server_loop.is_running():
+            server_loop.call_soon_threadsafe(
+                server_loop.call_later, delay, lambda: server_loop.create_task(self._flush(group))
+            )
+            return
+        timer = threading.Timer(delay, self._flush_sync, args=(group,))
+        timer.daemon = True
+        timer.start()
+
+    async def _flush(self, group):
+        message = self._take_pending(group)
+        if message is None:
+            return
+        try:
+            await self.asend(group, message)
+        except Exception as e:
+            logger.exception(f"Coalesced group_send to {group} failed: {e}")
+
+    def _flush_sync(self, group):
+        async_to_sync(self._flush)(group)
+
+    def publish(self, group, message):
+        """group_send from sync code (views, tasks)."""
+        message = self._offer(group, message)
+        if message is not None:
+            message = _encoded(message)
+            start = time.perf_counter()
+            async_to_sync(get_channel_layer().group_send)(group, message)
+            metrics.observe_group_send(group, time.perf_counter() - start)
+            if snapshots.wanted(group, message):
+                snapshots.remember(group, message)
+
+    async def apublish(self, group, message):
+        """group_send from async code (consumers)."""
+        message = self._offer(group, message, loop=asyncio.get_running_loop())
+        if message is not None:
+            await self.asend(group, message)
+
+    async def asend(self, group, message):
+        """
+        Encode and send `message` now, bypassing the rate limit (used
+        when every message has to go out, e.g. by the outbox relay).
+        """
+        message = _encoded(message)
+        start = time.perf_counter()
+        await get_channel_layer().group_send(group, message)
+        metrics.observe_group_send(group, time.perf_counter() - start)
+        if snapshots.wanted(group, message):
+            await sync_to_async(snapshots.remember, thread_sensitive=False)(group, message)
+
+
+broadcaster = CoalescingBroadcaster()
@@ -1,7 +1,25 @@
 from channels.generic.websocket import AsyncWebsocketConsumer
 from asgiref.sync import sync_to_async
 from channels.db import database_sync_to_async
+from rest_framework import serializers
+from urllib.parse import parse_qs
+from django.conf import settings
+import asyncio
 import json
+import logging
+
+from . import snapshots
+from utils import metrics
+
+from .broadcast import broadcaster
+from .outbound import SendQueue
+from .recorder import recorder
+from .robots import scope_robot_id
+from .encoding import FrameEncoder, negotiate, SUBPROTOCOLS, MSGPACK_PROTOCOL
+from .timeseries import STREAM_FIELDS
+from .topics import TOPICS, EVENT_TOPICS, topic_groups, topic_payload
+
+logger = logging.getLogger(__name__)
 
 
 # # ---------------------- Slot Patient Return ----------------------
@@ -106,381 +124,362 @@ import json
 
 
 
-# ---------------------- Help Return ----------------------
-class HelpReturn(AsyncWebsocketConsumer):
-    group_name = "help_group"
+# ---------------------- Topic Subscriptions ----------------------
+class TopicConsumer(AsyncWebsocketConsumer):
+    """
+    Base for the server-to-client sockets. A connection subscribes to
+    named topics (see topics.py); each topic maps to a channel layer
+    group, and dispatch() routes group events to the subscribed topics
+    instead of to one handler method per event type. Groups shared by
+    several topics (the telemetry frame group) are joined once.
+
+    Subclasses with a fixed `topics` tuple are the legacy single-topic
+    endpoints and keep the legacy {"payload": ...} framing.
+
+    Clients may offer the "medbot.msgpack" or "medbot.f32" subprotocol
+    to receive samples as binary frames (see encoding.py); JSON text is
+    the default.
+
+    Clients connecting with ?delta=1 get {"payload": {...}, "delta": true}
+    messages carrying only the fields that moved past the deadband;
+    keyframes still arrive as full {"payload": ...} messages. medbot.f32
+    always sends full samples.
+
+    Topic messages go through a bounded per-connection queue drained by
+    a writer task, so a slow client never holds up the channel layer.
+    Topics marked "drop": "oldest" lose their oldest queued frames when
+    the queue is full; other topics never drop, and a client whose queue
+    is full of those, or that keeps dropping, is disconnected. A ?delta=1
+    client gets full frames while its queue is full and after it lost a
+    frame of a topic, so it never applies deltas to a value it did not
+    receive.
+
+    Right after subscribing, the last retained payload of each state
+    topic is sent with "snapshot": true (see snapshots.py), so a fresh
+    dashboard can render without polling the REST endpoints.
+
+    Per-robot topics follow the robot named by ?robot_id= (or the
+    X-Robot-Id header), so a dashboard only receives the traffic of the
+    robot it shows; without one it gets the default robot.
+    """
+    topics = ()
+    connection_message = None
+    # topic a client message is published on (legacy endpoints only)
+    publish_topic = None
+    subprotocols = SUBPROTOCOLS
 
     async def connect(self):
-        await self.accept()
-        await self.channel_layer.group_add(self.group_name, self.channel_name)
-        await self.send(text_data=json.dumps({
-            "type": "connection_established",
-            "message": "you are connected to help"
-        }))
+        subprotocol = negotiate(self.scope, self.subprotocols)
+        self.encoder = FrameEncoder(subprotocol)
+        self.query = parse_qs(self.scope.get("query_string", b"").decode())
+        try:
+            self.robot_id = scope_robot_id(self.scope, self.query)
+        except serializers.ValidationError:
+            await self.close(code=4400)
+            return
+        self.delta = self.query.get("delta", ["0"])[0] in ("1", "true")
+        self.subscriptions = set()
+        self.group_refs = {}
+        self.outbox = SendQueue(getattr(settings, "WEBSOCKET_SEND_QUEUE_SIZE", 256))
+        self.closing = False
+        await self.accept(subprotocol=subprotocol)
+        metrics.socket_opened(type(self).__name__)
+        self.writer = asyncio.create_task(self.write_loop())
+        if self.connection_message:
+            await self.send(text_data=json.dumps({
+                "type": "connection_established",
+                "message": self.connection_message
+            }))
+        await self.subscribe(*self.initial_topics())
 
     async def disconnect(self, close_code):
-        await self.channel_layer.group_discard(self.group_name, self.channel_name)
+        for group in getattr(self, "group_refs", {}):
+            await self.channel_layer.group_discard(group, self.channel_name)
+        self.group_refs = {}
+        self.subscriptions = set()
+        if getattr(self, "writer", None):
+            self.writer.cancel()
+            metrics.socket_closed(type(self).__name__, self.outbox.dropped)
+            if self.outbox.dropped:
+                logger.warning(f"[Slow Consumer][{type(self).__name__}] dropped {self.outbox.dropped} messages")
+
+    async def write_loop(self):
+        while True:
+            frame = await self.outbox.get()
+            try:
+                await self.send(**frame)
+            except Exception as e:
+                logger.exception(f"[Server Error][{type(self).__name__}] {e}")
+                return
+
+    async def enqueue(self, name, frame):
+        if self.closing:
+            return
+        droppable = TOPICS[name].get("drop") == "oldest"
+        # a delta client that misses a frame of a topic gets a full one next
+        resync = name if self.delta and droppable else None
+        max_drops = getattr(settings, "WEBSOCKET_MAX_BACKLOG_DROPS", 1000)
+        if not self.outbox.put(frame, droppable, resync) or self.outbox.backlog_drops > max_drops:
+            logger.warning(f"[Slow Consumer][{type(self).__name__}] closing: {len(self.outbox)} queued, "
+                           f"{self.outbox.dropped} dropped")
+            self.closing = True
+            await self.close(code=1013)
+
+    def initial_topics(self):
+        return self.topics
+
+    async def subscribe(self, *names):
+        added = []
+        for name in names:
+            if name in self.subscriptions:
+                continue
+            self.subscriptions.add(name)
+            added.append(name)
+            for group in topic_groups(name, self.robot_id):
+                self.group_refs[group] = self.group_refs.get(group, 0) + 1
+                if self.group_refs[group] == 1:
+                    await self.channel_layer.group_add(group, self.channel_name)
+
+        recall = sync_to_async(snapshots.recall, thread_sensitive=False)
+        for name, payload in await recall(added, self.robot_id):
+            await self.send_topic(name, payload, snapshot=True)
+
+    async def unsubscribe(self, *names):
+        for name in names:
+            if name not in self.subscriptions:
+                continue
+            self.subscriptions.discard(name)
+            for group in topic_groups(name, self.robot_id):
+                self.group_refs[group] -= 1
+                if not self.group_refs[group]:
+                    del self.group_refs[group]
+                    await self.channel_layer.group_discard(group, self.channel_name)
+
+    async def dispatch(self, message):
+        names = EVENT_TOPICS.get(message.get("type"))
+        if names is None:
+            # websocket.connect / receive / disconnect
+            return await super().dispatch(message)
+        # ---- Prevent echo to sender ----
+        if message.get("sender") == self.channel_name:
+            return
+        for name in names:
+            if name not in self.subscriptions:
+                continue
+            routed = topic_payload(name, message)
+            if routed is not None:
+                await self.send_topic(name, *routed)
+
+    async def send_topic(self, name, payload, changed=None, payload_json=None, snapshot=False):
+        # a full queue drops a frame to make room, maybe a delta of this topic
+        wants_delta = (
+            self.delta and changed is not None and not self.encoder.fixed_layout
+            and name not in self.outbox.stale and not self.outbox.full()
+        )
+        if payload_json is not None and not wants_delta and not snapshot and self.encoder.subprotocol is None:
+            # the publisher already encoded the payload once for all subscribers
+            self.outbox.stale.discard(name)
+            await self.enqueue(name, {"text_data": self.build_text(name, payload_json)})
+            return
+        if payload is None and payload_json is not None:
+            payload = json.loads(payload_json)
+        delta = wants_delta and isinstance(payload, dict)
+        if not delta:
+            # a full payload brings a client that lost frames back in sync
+            self.outbox.stale.discard(name)
+        body = {f: payload[f] for f in changed if f in payload} if delta else payload
+        message = self.build_message(name, body)
+        if delta:
+            message["delta"] = True
+        if snapshot and isinstance(message, dict):
+            message = {**message, "snapshot": True}
+        await self.enqueue(name, self.encoder.encode(message, values=payload, fields=STREAM_FIELDS.get(name)))
+
+    def build_message(self, name, payload):
+        return {"payload": payload}
+
+    def build_text(self, name, payload_json):
+        """build_message() as JSON text around an already encoded payload."""
+        return '{"payload": ' + payload_json + '}'
+
+    async def publish(self, name, data):
+        spec = TOPICS[name]
+        await broadcaster.apublish(
+            topic_groups(name, self.robot_id)[0],
+            {
+                "type": spec["message"],
+                "payload": spec["client_payload"](data)
+            }
+        )
 
-    async def receive(self, text_data):
+    async def receive(self, text_data=None, bytes_data=None):
+        if not self.publish_topic:
+            return
         try:
             data = json.loads(text_data)
-            room = data.get("room")
-            bed = data.get("bed")
-
-            await self.channel_layer.group_send(
-                self.group_name,
-                {
-                    "type": "help_message",
-                    "payload": f"Immediate attention required at {bed} in {room}"
-                }
-            )
+            await self.publish(self.publish_topic, data)
         except Exception as e:
-            print(f"[Server Error][HelpReturn] {e}")
+            logger.exception(f"[Server Error][{type(self).__name__}] {e}")
             await self.close(code=1011)
 
-    async def help_message(self, event):
-        payload = event.get("payload")
-        await self.send(text_data=json.dumps({"payload": payload}))
+# ---------------------- Multiplexed Topics ----------------------
+class MultiplexConsumer(TopicConsumer):
+    """
+    One socket for any number of topics. Subscribe on connect with
+    ?topics=help,joint_position or at any time by sending
+        {"action": "subscribe", "topics": ["emergency"]}
+        {"action": "unsubscribe", "topics": ["emergency"]}
+        {"action": "publish", "topic": "help", "data": {...}}
+    Every message is tagged: {"topic": "joint_position", "payload": {...}}.
+    medbot.f32 frames carry no topic, so only msgpack is offered here.
+    """
+    connection_message = "you are connected to multiplexed topics"
+    subprotocols = (MSGPACK_PROTOCOL,)
+
+    def initial_topics(self):
+        requested = ",".join(self.query.get("topics", [])).split(",")
+        return [name for name in requested if name in TOPICS]
+
+    def build_message(self, name, payload):
+        return {"topic": name, "payload": payload}
+
+    def build_text(self, name, payload_json):
+        return '{"topic": "' + name + '", "payload": ' + payload_json + '}'
+
+    async def receive(self, text_data=None, bytes_data=None):
+        try:
+            message = json.loads(text_data or "")
+        except json.JSONDecodeError:
+            await self.send_error("Invalid JSON.")
+            return
+        if not isinstance(message, dict):
+            await self.send_error("Message must be a JSON object.")
+            return
 
+        action = message.get("action")
+        names = message.get("topics") or ([message["topic"]] if message.get("topic") else [])
+        unknown = [name for name in names if name not in TOPICS]
+        if not names or unknown:
+            await self.send_error(f"Unknown or missing topics: {', '.join(map(str, unknown)) or '-'}.")
+            return
 
-# # ---------------------- Notification ----------------------
-class Notification(AsyncWebsocketConsumer):
-    
-    group_name = "notification_group"
+        if action == "subscribe":
+            await self.subscribe(*names)
+        elif action == "unsubscribe":
+            await self.unsubscribe(*names)
+        elif action == "publish":
+            name = names[0]
+            if "client_payload" not in TOPICS[name]:
+                await self.send_error(f"Topic '{name}' does not accept client messages.")
+                return
+            await self.publish(name, message.get("data") or {})
+            return
+        else:
+            await self.send_error(f"Unknown action '{action}'.")
+            return
 
-    async def connect(self):
-        await self.accept()
-        await self.channel_layer.group_add(self.group_name, self.channel_name)
         await self.send(text_data=json.dumps({
-            "type": "connection_established",
-            "message": "you are connected to notifications"
+            "type": "subscriptions",
+            "topics": sorted(self.subscriptions)
         }))
 
-    async def disconnect(self, close_code):
-        await self.channel_layer.group_discard(self.group_name, self.channel_name)
-
-    async def receive(self, text_data):
-        try:
-            data = json.loads(text_data)
-            icon = data.get("icon")
-            notification = data.get("notification")
-            
-
-            await self.channel_layer.group_send(
-                self.group_name,
-                {
-                    "type": "notification_message",
-                    "payload": {
-                        "icon": icon,
-                        "notification": notification
-                    }
-                }
-            )
-            
-        
-        except Exception as e:
-            print(f"[Server Error][Notification] {e}")
-            await self.close(code=1011)
-
-    async def notification_message(self, event):
-        payload = event.get("payload")
-        await self.send(text_data=json.dumps({"payload": payload}))
+    async def send_error(self, error):
+        await self.send(text_data=json.dumps({"type": "error", "message": error}))
 
+# ---------------------- Help Return ----------------------
+class HelpReturn(TopicConsumer):
+    topics = ("help",)
+    publish_topic = "help"
+    connection_message = "you are connected to help"
 
+# # ---------------------- Notification ----------------------
+class Notification(TopicConsumer):
+    topics = ("notification",)
+    publish_topic = "notification"
+    connection_message = "you are connected to notifications"
 
 # ---------------------- Apparatus ----------------------
-class ApparatusValue(AsyncWebsocketConsumer):
-    group_name = "apparatus_value_group"
-
-    async def connect(self):
-        await self.accept()
-        await self.channel_layer.group_add(self.group_name, self.channel_name)
-        await self.send(text_data=json.dumps({
-            "type": "connection_established",
-            "message": "you are connected to apparatus value"
-        }))
-
-    async def disconnect(self, close_code):
-        await self.channel_layer.group_discard(self.group_name, self.channel_name)
-
-    async def receive(self, text_data):
-        try:
-            data = json.loads(text_data)
-            req_data = data.get("data")
-
-            await self.channel_layer.group_send(
-                self.group_name,
-                {
-                    "type": "apparatus_value_message",
-                    "payload": {
-                        "apparatus": req_data
-                    }
-                }
-            )
-        except Exception as e:
-            print(f"[Server Error][apparatus] {e}")
-            await self.close(code=1011)
-
-    async def apparatus_value_message(self, event):
-        payload = event.get("payload")
-        await self.send(text_data=json.dumps({"payload": payload}))
+class ApparatusValue(TopicConsumer):
+    topics = ("apparatus",)
+    publish_topic = "apparatus"
+    connection_message = "you are connected to apparatus value"
 
 # ---------------------- Scheduler ----------------------
-class SchedulerValue(AsyncWebsocketConsumer):
-    group_name = "scheduler_value_group"
-
-    async def connect(self):
-        await self.accept()
-        await self.channel_layer.group_add(self.group_name, self.channel_name)
-        await self.send(text_data=json.dumps({
-            "type": "connection_established",
-            "message": "you are connected to scheduler value"
-        }))
-
-    async def disconnect(self, close_code):
-        await self.channel_layer.group_discard(self.group_name, self.channel_name)
+class SchedulerValue(TopicConsumer):
+    topics = ("scheduler",)
+    connection_message = "you are connected to scheduler value"
 
+    def build_message(self, name, payload):
+        # scheduler events are sent unwrapped
+        return payload
 
-
-    async def scheduler_value_message(self, event):
-        payload = event.get("payload")
-        await self.send(text_data=json.dumps(payload))
+    def build_text(self, name, payload_json):
+        return payload_json
 
 # ---------------------- Emergency ----------------------
-class EmergencyValue(AsyncWebsocketConsumer):
-    group_name = "emergency_value_group"
-
-    async def connect(self):
-        await self.accept()
-        await self.channel_layer.group_add(self.group_name, self.channel_name)
-        await self.send(text_data=json.dumps({
-            "type": "connection_established",
-            "message": "you are connected to emergency value"
-        }))
-
-    async def disconnect(self, close_code):
-        await self.channel_layer.group_discard(self.group_name, self.channel_name)
-
-
-    async def emergency_value_message(self, event):
-        payload = event.get("payload")
-        await self.send(text_data=json.dumps({"payload": payload}))
+class EmergencyValue(TopicConsumer):
+    topics = ("emergency",)
+    connection_message = "you are connected to emergency value"
 
 # ---------------------- Robot entry exit arm accuracy and distance ----------------------
-class RobotEntryExitAccDis(AsyncWebsocketConsumer):
-    group_name = "robot_entry_exit_acc_dis_value_group"
-
-    async def connect(self):
-        await self.accept()
-        await self.channel_layer.group_add(self.group_name, self.channel_name)
-        await self.send(text_data=json.dumps({
-            "type": "connection_established",
-            "message": "you are connected to emergency value"
-        }))
-
-    async def disconnect(self, close_code):
-        await self.channel_layer.group_discard(self.group_name, self.channel_name)
-
-    async def receive(self, text_data):
-        try:
-            data = json.loads(text_data)
-            req_data = data.get("data", text_data)
-
-            await self.channel_layer.group_send(
-                self.group_name,
-                {
-                    "type": "robot_entry_exit_acc_dis_value_message",
-                    "payload": data
-                }
-            )
-        except Exception as e:
-            print(f"[Server Error][robot_entry_exit_acc_dis] {e}")
-            await self.close(code=1011)
-
-    async def robot_entry_exit_acc_dis_value_message(self, event):
-        payload = event.get("payload")
-        await self.send(text_data=json.dumps({"payload": payload}))
+class RobotEntryExitAccDis(TopicConsumer):
+    topics = ("robot_distance_accuracy",)
+    publish_topic = "robot_distance_accuracy"
+    connection_message = "you are connected to emergency value"
 
 # ---------------------- Arm Endpose ----------------------
-class ArmEndposeValue(AsyncWebsocketConsumer):
-    group_name = "arm_endpose_value_group"
-
-    async def connect(self):
-        await self.accept()
-        await self.channel_layer.group_add(self.group_name, self.channel_name)
-        await self.send(text_data=json.dumps({
-            "type": "connection_established",
-            "message": "you are connected to arm endpose value"
-        }))
-
-    async def disconnect(self, close_code):
-        await self.channel_layer.group_discard(self.group_name, self.channel_name)
-
-   
-    async def arm_endpose_value_message(self, event):
-        payload = event.get("payload")
-        await self.send(text_data=json.dumps({"payload": payload}))
+class ArmEndposeValue(TopicConsumer):
+    topics = ("arm_endpose",)
+    connection_message = "you are connected to arm endpose value"
 
 # ---------------------- Joint Velocity ----------------------
-class JointVelocityValue(AsyncWebsocketConsumer):
-    group_name = "joint_velocity_value_group"
-
-    async def connect(self):
-        await self.accept()
-        await self.channel_layer.group_add(self.group_name, self.channel_name)
-        await self.send(text_data=json.dumps({
-            "type": "connection_established",
-            "message": "you are connected to arm endpose value"
-        }))
-
-    async def disconnect(self, close_code):
-        await self.channel_layer.group_discard(self.group_name, self.channel_name)
-
-
-    async def joint_velocity_value_message(self, event):
-        payload = event.get("payload")
-        await self.send(text_data=json.dumps({"payload": payload}))
+class JointVelocityValue(TopicConsumer):
+    topics = ("joint_velocity",)
+    connection_message = "you are connected to arm endpose value"
 
 # ---------------------- Joint Effort ----------------------
-class JointEffortValue(AsyncWebsocketConsumer):
-    group_name = "joint_effort_value_group"
-
-    async def connect(self):
-        await self.accept()
-        await self.channel_layer.group_add(self.group_name, self.channel_name)
-        await self.send(text_data=json.dumps({
-            "type": "connection_established",
-            "message": "you are connected to arm endpose value"
-        }))
-
-    async def disconnect(self, close_code):
-        await self.channel_layer.group_discard(self.group_name, self.channel_name)
-
-
-    async def joint_effort_value_message(self, event):
-        payload = event.get("payload")
-        await self.send(text_data=json.dumps({"payload": payload}))
+class JointEffortValue(TopicConsumer):
+    topics = ("joint_effort",)
+    connection_message = "you are connected to arm endpose value"
 
 # ---------------------- Joint Position ----------------------
-class JointPositionValue(AsyncWebsocketConsumer):
-    group_name = "joint_position_value_group"
-
-    async def connect(self):
-        await self.accept()
-        await self.channel_layer.group_add(self.group_name, self.channel_name)
-        await self.send(text_data=json.dumps({
-            "type": "connection_established",
-            "message": "you are connected to arm endpose value"
-        }))
-
-    async def disconnect(self, close_code):
-        await self.channel_layer.group_discard(self.group_name, self.channel_name)
-
-   
-    async def joint_position_value_message(self, event):
-        payload = event.get("payload")
-        await self.send(text_data=json.dumps({"payload": payload}))
+class JointPositionValue(TopicConsumer):
+    topics = ("joint_position",)
+    connection_message = "you are connected to arm endpose value"
 
 # ---------------------- Refresh Arm Data ----------------------
-class RefreshArmDataValue(AsyncWebsocketConsumer):
-    group_name = "refresh_arm_data_value_group"
-
-    async def connect(self):
-        await self.accept()
-        await self.channel_layer.group_add(self.group_name, self.channel_name)
-        await self.send(text_data=json.dumps({
-            "type": "connection_established",
-            "message": "you are connected to arm endpose value"
-        }))
-
-    async def disconnect(self, close_code):
-        await self.channel_layer.group_discard(self.group_name, self.channel_name)
-
-
-    async def refresh_arm_data_value_message(self, event):
-        payload = event.get("payload")
-        await self.send(text_data=json.dumps({"payload": payload}))
+class RefreshArmDataValue(TopicConsumer):
+    topics = ("refresh_arm_data",)
+    connection_message = "you are connected to arm endpose value"
 
 # ---------------------- Refresh joint Data ----------------------
-class RefreshJointDataValue(AsyncWebsocketConsumer):
-    group_name = "refresh_joint_data_value_group"
-
-    async def connect(self):
-        await self.accept()
-        await self.channel_layer.group_add(self.group_name, self.channel_name)
-        await self.send(text_data=json.dumps({
-            "type": "connection_established",
-            "message": "you are connected to arm endpose value"
-        }))
-
-    async def disconnect(self, close_code):
-        await self.channel_layer.group_discard(self.group_name, self.channel_name)
-
-   
-    async def refresh_joint_data_value_message(self, event):
-        payload = event.get("payload")
-        await self.send(text_data=json.dumps({"payload": payload}))
+class RefreshJointDataValue(TopicConsumer):
+    topics = ("refresh_joint_data",)
+    connection_message = "you are connected to arm endpose value"
 
 # ---------------------- Joint Heat Return ----------------------
-class JointHeatConsumer(AsyncWebsocketConsumer):
-    group_name = "joint_heat_group"
-
-    async def connect(self):
-        await self.accept()
-        await self.channel_layer.group_add(self.group_name, self.channel_name)
-        await self.send(text_data=json.dumps({
-            "type": "connection_established",
-            "message": "you are connected to help"
-        }))
-
-    async def disconnect(self, close_code):
-        await self.channel_layer.group_discard(self.group_name, self.channel_name)
+class JointHeatConsumer(TopicConsumer):
+    topics = ("joint_heat",)
+    connection_message = "you are connected to help"
 
-    async def joint_heat_message(self, event):
-        payload = event.get("payload")
-        await self.send(text_data=json.dumps({"payload": payload}))
+# ---------------------- Telemetry Frame ----------------------
+class TelemetryFrameValue(TopicConsumer):
+    topics = ("telemetry_frame",)
+    connection_message = "you are connected to telemetry frame"
 
 # ---------------------- Slot position Return ----------------------
-class SlotPatientReturn(AsyncWebsocketConsumer):
-    group_name = "slot_group"
+class SlotPatientReturn(TopicConsumer):
+    topics = ("slot",)
+    connection_message = "you are connected to help"
 
-    async def connect(self):
-        await self.accept()
-        await self.channel_layer.group_add(self.group_name, self.channel_name)
-        await self.send(text_data=json.dumps({
-            "type": "connection_established",
-            "message": "you are connected to help"
-        }))
-
-    async def disconnect(self, close_code):
-        await self.channel_layer.group_discard(self.group_name, self.channel_name)
 
-    async def slot_message(self, event):
-        payload = event.get("payload")
-        await self.send(text_data=json.dumps({"payload": payload}))
-        
+class RobotConsumer(TopicConsumer):
+    """
+    One robot → one group
+    """
+    topics = ("arm_moment",)
 
-
-class RobotConsumer(AsyncWebsocketConsumer):
-    async def connect(self):
-        """
-        One robot → one group
-        """
-        self.group_name = "robot_movement"
-
-        await self.channel_layer.group_add(
-            self.group_name,
-            self.channel_name
-        )
-        await self.accept()
-
-    async def disconnect(self, close_code):
-        await self.channel_layer.group_discard(
-            self.group_name,
-            self.channel_name
-        )
-
-    async def receive(self, text_data):
+    async def receive(self, text_data=None, bytes_data=None):
         """
         Receive data from Robot
         """
@@ -489,6 +488,8 @@ class RobotConsumer(AsyncWebsocketConsumer):
             data = json.loads(text_data)
         except json.JSONDecodeError:
             return
+        if not isinstance(data, dict):
+            return
 
         role = data.get("role")
         if role != "robot":
@@ -497,6 +498,7 @@ class RobotConsumer(AsyncWebsocketConsumer):
         joints = data.get("joints")
         if not joints:
             return
+        recorder.record("arm_moment", joints, self.robot_id)
 
         # 🔥 1. INSTANT response to sender (NO Redis, NO delay)
         await self.send(
@@ -507,9 +509,9 @@ class RobotConsumer(AsyncWebsocketConsumer):
             })
         )
 
-        # 🔥 2. Broadcast to other connected clients
-        await self.channel_layer.group_send(
-            self.group_name,
+        # 🔥 2. Broadcast to other connected clients (coalesced to the configured rate)
+        await broadcaster.apublish(
+            topic_groups("arm_moment", self.robot_id)[0],
             {
                 "type": "joint_update",
                 "joints": joints,
@@ -517,18 +519,139 @@ class RobotConsumer(AsyncWebsocketConsumer):
             }
         )
 
-    async def joint_update(self, event):
+    def build_message(self, name, payload):
         """
         Send joint data to other UI clients
         """
-        # ---- Prevent echo to sender ----
-        if event.get("sender") == self.channel_name:
+        return {
+            "type": "joint_update",
+            "urdfJoints": payload,
+            "source": "broadcast"
+        }
+
+    def build_text(self, name, payload_json):
+        return '{"type": "joint_update", "urdfJoints": ' + payload_json + ', "source": "broadcast"}'
+
+# ---------------------- Robot Telemetry Ingest ----------------------
+class RobotIngestConsumer(AsyncWebsocketConsumer):
+    """
+    Long-lived, authenticated ingest socket for one robot.
+
+    Authenticate with a JWT access token, either as ?token=<jwt> or an
+    "Authorization: Bearer <jwt>" header. The robot is named by
+    ?robot_id= or an X-Robot-Id header (the default robot otherwise).
+    Each message is
+        {"seq": 12, "type": "joint_position", "data": {...}}
+    with a type from telemetry.INGEST_TYPES, and is written through the
+    same persistence path as the HTTP views. Every message is answered
+    with {"type": "ack", "seq": 12, "status": ...}.
+    """
+
+    async def connect(self):
+        self.user = await self.authenticate()
+        if self.user is None:
+            await self.close(code=4401)
+            return
+        query = parse_qs(self.scope.get("query_string", b"").decode())
+        try:
+            self.robot_id = scope_robot_id(self.scope, query)
+        except serializers.ValidationError:
+            await self.close(code=4400)
+            return
+        await self.accept()
+        self.accepted = True
+        metrics.socket_opened(type(self).__name__)
+        await self.send(text_data=json.dumps({
+            "type": "connection_established",
+            "message": "you are connected to robot ingest"
+        }))
+
+    async def disconnect(self, close_code):
+        if getattr(self, "accepted", False):
+            metrics.socket_closed(type(self).__name__)
+            # a robot going offline (or a replay ending) leaves no samples waiting
+            try:
+                await self.flush_pending()
+            except Exception as e:
+                logger.exception(f"[Server Error][RobotIngestConsumer] flush on disconnect failed: {e}")
+
+    @database_sync_to_async
+    def flush_pending(self):
+        from . import battery
+        from .timeseries import history
+        from .writebehind import buffer
+
+        buffer.flush()
+        history.flush()
+        battery.rollups.flush()
+
+    async def authenticate(self):
+        user = self.scope.get("user")
+        if user is not None and user.is_authenticated:
+            return user
+
+        raw_token = None
+        query = parse_qs(self.scope.get("query_string", b"").decode())
+        if query.get("token"):
+            raw_token = query["token"][0]
+        else:
+            headers = dict(self.scope.get("headers", []))
+            auth = headers.get(b"authorization", b"").decode()
+            if auth.lower().startswith("bearer "):
+                raw_token = auth[7:].strip()
+        if not raw_token:
+            return None
+        return await self.get_token_user(raw_token)
+
+    @database_sync_to_async
+    def get_token_user(self, raw_token):
+        from rest_framework_simplejwt.authentication import JWTAuthentication
+        from rest_framework_simplejwt.exceptions import InvalidToken, AuthenticationFailed
+
+        auth = JWTAuthentication()
+        try:
+            return auth.get_user(auth.get_validated_token(raw_token))
+        except (InvalidToken, AuthenticationFailed):
+            return None
+
+    async def receive(self, text_data=None, bytes_data=None):
+        try:
+            message = json.loads(text_data or "")
+        except json.JSONDecodeError:
+            await self.send_ack(None, "error", errors="Invalid JSON.")
+            return
+        if not isinstance(message, dict):
+            await self.send_ack(None, "error", errors="Message must be a JSON object.")
             return
 
-        await self.send(
-            text_data=json.dumps({
-                "type": "joint_update",
-                "urdfJoints": event["joints"],
-                "source": "broadcast"
-            })
-        )
\ No newline at end of file
+        seq = message.get("seq")
+        message_type = message.get("type")
+        data = message.get("data")
+        if data is None:
+            await self.send_ack(seq, "error", errors="data is required.")
+            return
+
+        recorder.record(message_type, data, self.robot_id)
+        try:
+            await self.persist(message_type, data)
+        except serializers.ValidationError as e:
+            await self.send_ack(seq, "error", errors=e.detail)
+            return
+        except Exception as e:
+            logger.exception(f"[Server Error][RobotIngestConsumer] {e}")
+            await self.send_ack(seq, "error", errors="Internal server error.")
+            return
+
+        await self.send_ack(seq, "ok")
+
+    @database_sync_to_async
+    def persist(self, message_type, data):
+        from . import telemetry
+
+        telemetry.ingest(message_type, data, self.robot_id)
+
+    async def send_ack(self, seq, ack_status, errors=None):
+        ack = {"type": "ack", "seq": seq, "status": ack_status}
+        if errors is not None:
+            ack["errors"] = errors
+        await self.send(text_data=json.dumps(ack))
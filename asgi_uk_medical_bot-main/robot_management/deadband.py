@@ -0,0 +1,76 @@
+import threading
+import time
+
+from django.conf import settings
+
+from .robots import DEFAULT_ROBOT_ID
+from .timeseries import STREAM_FIELDS
+
+
+class DeadbandFilter:
+    """
+    Per-stream deadband on the arm/joint telemetry, tracked per robot.
+
+    A sample passes when any field moved more than its epsilon away from
+    the last value that was passed on, or when `keyframe_seconds` have
+    elapsed since the last keyframe. Streams without a configured epsilon
+    always pass.
+
+    Reference values are only moved for the fields that were passed on,
+    so slow drift below epsilon still adds up and eventually goes out.
+    State is per process.
+    """
+
+    def __init__(self, deadbands=None, keyframe_seconds=None):
+        self.deadbands = deadbands if deadbands is not None else getattr(settings, "TELEMETRY_DEADBAND", {})
+        self.keyframe_seconds = keyframe_seconds or getattr(settings, "TELEMETRY_KEYFRAME_SECONDS", 5)
+        self._lock = threading.Lock()
+        self._last = {}
+        self._last_keyframe = {}
+
+    def epsilon(self, stream, field):
+        band = self.deadbands.get(stream)
+        if isinstance(band, dict):
+            return band.get(field, band.get("default", 0.0))
+        return band or 0.0
+
+    def check(self, stream, values, now=None, robot_id=DEFAULT_ROBOT_ID):
+        """
+        `values` is the full merged sample as a dict. Returns None when the
+        sample should be dropped, else (changed_fields, is_keyframe).
+        """
+        fields = STREAM_FIELDS[stream]
+        if stream not in self.deadbands:
+            return list(fields), False
+
+        now = time.monotonic() if now is None else now
+        key = (robot_id, stream)
+        with self._lock:
+            last = self._last.get(key)
+            if last is None or now - self._last_keyframe[key] >= self.keyframe_seconds:
+                self._last[key] = {f: values[f] for f in fields}
+                self._last_keyframe[key] = now
+                return list(fields), True
+
+            changed = [
+                f for f in fields
+                if abs(float(values[f]) - float(last[f])) > self.epsilon(stream, f)
+            ]
+            if not changed:
+                return None
+            for f in changed:
+                last[f] = values[f]
+            return changed, False
+
+    def reset(self, stream=None):
+        with self._lock:
+            if stream is None:
+                self._last.clear()
+                self._last_keyframe.clear()
+            else:
+                for key in [key for key in self._last if key[1] == stream]:
+                    self._last.pop(key, None)
+                    self._last_keyframe.pop(key, None)
+
+
+deadband = DeadbandFilter()
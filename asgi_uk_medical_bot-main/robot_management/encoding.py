@@ -0,0 +1,87 @@
+import json
+import struct
+from numbers import Real
+
+import msgpack
+
+try:
+    import orjson
+except ImportError:  # optional, faster encoder
+    orjson = None
+
+# WebSocket subprotocols a client may offer in Sec-WebSocket-Protocol.
+# Without one (or with an unknown one) frames stay JSON text.
+MSGPACK_PROTOCOL = "medbot.msgpack"
+FLOAT32_PROTOCOL = "medbot.f32"
+SUBPROTOCOLS = (MSGPACK_PROTOCOL, FLOAT32_PROTOCOL)
+
+# medbot.f32 frame: little-endian uint32 sequence number, uint8 value
+# count, then `count` float32 values (stream field order, e.g. j1..j6 or
+# x, y, z, rx, ry, rz).
+FLOAT32_HEADER = struct.Struct("<IB")
+
+
+def dumps(obj):
+    """JSON text for a wire frame; uses orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(obj, default=str).decode()
+    return json.dumps(obj, default=str)
+
+
+def negotiate(scope, supported=SUBPROTOCOLS):
+    """Return the first supported subprotocol offered by the client, or None."""
+    for offered in scope.get("subprotocols") or []:
+        if offered in supported:
+            return offered
+    return None
+
+
+def _float_values(values, fields=None):
+    if isinstance(values, dict):
+        values = [values.get(f) for f in fields] if fields else list(values.values())
+    if not isinstance(values, (list, tuple)) or len(values) > 255:
+        return None
+    if not all(isinstance(v, Real) and not isinstance(v, bool) for v in values):
+        return None
+    return values
+
+
+class FrameEncoder:
+    """
+    Per-connection encoder for outgoing sample frames.
+
+    `encode` returns the kwargs for AsyncWebsocketConsumer.send:
+    text_data for JSON, bytes_data for the binary subprotocols. Payloads
+    that are not a flat list of numbers (refresh signals and the like)
+    are sent as JSON text under medbot.f32.
+    """
+
+    def __init__(self, subprotocol=None):
+        self.subprotocol = subprotocol
+        self.seq = 0
+
+    @property
+    def fixed_layout(self):
+        """True when frames carry a fixed value layout (no field names)."""
+        return self.subprotocol == FLOAT32_PROTOCOL
+
+    def _next_seq(self):
+        self.seq = (self.seq + 1) & 0xFFFFFFFF
+        return self.seq
+
+    def encode(self, message, values=None, fields=None):
+        """
+        `message` is the full JSON-mode message; `values` the numeric
+        sample inside it that medbot.f32 packs (ordered by `fields` when
+        it is a dict).
+        """
+        if self.subprotocol == MSGPACK_PROTOCOL:
+            return {"bytes_data": msgpack.packb(message, use_bin_type=True)}
+
+        if self.subprotocol == FLOAT32_PROTOCOL:
+            floats = _float_values(values, fields)
+            if floats is not None:
+                header = FLOAT32_HEADER.pack(self._next_seq(), len(floats))
+                return {"bytes_data": header + struct.pack(f"<{len(floats)}f", *floats)}
+
+        return {"text_data": dumps(message)}
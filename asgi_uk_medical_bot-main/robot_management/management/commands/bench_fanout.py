@@ -0,0 +1,274 @@
+import asyncio
+import atexit
+import json
+import platform
+import resource
+import shutil
+import tempfile
+import time
+
+import numpy as np
+from channels.db import database_sync_to_async
+from channels.testing import HttpCommunicator, WebsocketCommunicator
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings, setup_databases, teardown_databases
+
+from robot_management import battery
+from robot_management.broadcast import broadcaster
+from robot_management.models import JointPosition
+from robot_management.outbox import relay
+from robot_management.telemetry import get_single_instance
+from robot_management.timeseries import history
+from robot_management.writebehind import buffer
+
+JOINT_POSITION_URL = "/api/medicalbot/robot_management/joint-position/"
+MEMORY_LAYER = {
+    "default": {"BACKEND": "channels.layers.InMemoryChannelLayer", "CONFIG": {"capacity": 10000}},
+}
+# the bench runs in one process, so process-local caches stand in for Redis
+MEMORY_CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    "robot_state": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "robot-state"},
+}
+
+
+def _cpu():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime, usage.ru_stime
+
+
+class FanoutBench:
+    """
+    K robots publish numbered samples, through the joint-position view
+    ("http") and/or the arm-moment socket ("socket"), while M multiplex
+    subscribers spread over the robots receive them. Latency is measured
+    from just before a sample is published to its arrival at each
+    subscriber.
+    """
+
+    def __init__(self, application, robots, subscribers, messages, rate, via, drain):
+        self.application = application
+        self.robot_ids = [f"bench-{k}" for k in range(robots)]
+        self.subscribers = subscribers
+        self.messages = messages
+        self.rate = rate
+        self.topics = {"http": ["joint_position"], "socket": ["arm_moment"]}.get(via, ["joint_position", "arm_moment"])
+        self.drain = drain
+        self.sent = {}
+        self.latencies = []
+        self.errors = 0
+        self.done = asyncio.Event()
+
+    def prepare(self):
+        # create the robots' rows up front, outside the measurement
+        for robot_id in self.robot_ids:
+            get_single_instance(JointPosition, robot_id)
+
+    async def run(self):
+        await database_sync_to_async(self.prepare)()
+
+        readers, sockets = [], []
+        per_robot = dict.fromkeys(self.robot_ids, 0)
+        for i in range(self.subscribers):
+            robot_id = self.robot_ids[i % len(self.robot_ids)]
+            per_robot[robot_id] += 1
+            comm = WebsocketCommunicator(
+                self.application,
+                f"/ws/socket-server/multiplex/?robot_id={robot_id}&topics={','.join(self.topics)}",
+            )
+            await self._connect(comm)
+            sockets.append(comm)
+            readers.append(asyncio.create_task(self.read(comm, robot_id)))
+        self.expected = sum(per_robot.values()) * self.messages * len(self.topics)
+
+        publishers = []
+        for robot_id in self.robot_ids:
+            if "joint_position" in self.topics:
+                publishers.append(self.publish_http(robot_id))
+            if "arm_moment" in self.topics:
+                comm = WebsocketCommunicator(self.application, f"/ws/socket-server/arm-moment/?robot_id={robot_id}")
+                await self._connect(comm)
+                sockets.append(comm)
+                readers.append(asyncio.create_task(self.discard(comm)))
+                publishers.append(self.publish_socket(comm, robot_id))
+
+        cpu_start, wall_start = _cpu(), time.perf_counter()
+        await asyncio.gather(*publishers)
+        publish_seconds = time.perf_counter() - wall_start
+        if self.expected:
+            try:
+                await asyncio.wait_for(self.done.wait(), self.drain)
+            except asyncio.TimeoutError:
+                pass
+        wall = time.perf_counter() - wall_start
+        cpu_end = _cpu()
+
+        for task in readers:
+            task.cancel()
+        await asyncio.gather(*readers, return_exceptions=True)
+        for comm in sockets:
+            await comm.disconnect()
+
+        return self.report(publish_seconds, wall, cpu_start, cpu_end)
+
+    async def _connect(self, comm):
+        connected, _ = await comm.connect()
+        if not connected:
+            raise CommandError(f"WebSocket {comm.scope['path']} was rejected.")
+
+    async def pace(self, started, seq):
+        if self.rate:
+            delay = started + seq / self.rate - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+    async def publish_http(self, robot_id):
+        started = time.perf_counter()
+        for seq in range(1, self.messages + 1):
+            body = json.dumps({"j1": seq}).encode()
+            comm = HttpCommunicator(
+                self.application, "PUT", f"{JOINT_POSITION_URL}?robot_id={robot_id}", body=body,
+                headers=[(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+            )
+            self.sent[(robot_id, "joint_position", seq)] = time.perf_counter()
+            response = await comm.get_response(timeout=30)
+            if response["status"] != 200:
+                self.errors += 1
+            await comm.send_input({"type": "http.disconnect"})
+            await comm.wait()
+            await self.pace(started, seq)
+
+    async def publish_socket(self, comm, robot_id):
+        started = time.perf_counter()
+        for seq in range(1, self.messages + 1):
+            self.sent[(robot_id, "arm_moment", seq)] = time.perf_counter()
+            await comm.send_to(text_data=json.dumps({"role": "robot", "joints": {"seq": seq}}))
+            await self.pace(started, seq)
+
+    async def read(self, comm, robot_id):
+        while True:
+            message = json.loads(await comm.receive_from(timeout=3600))
+            topic = message.get("topic")
+            if topic is None or message.get("snapshot"):
+                continue
+            payload = message.get("payload") or {}
+            seq = payload.get("j1" if topic == "joint_position" else "seq")
+            sent = self.sent.get((robot_id, topic, int(seq or 0)))
+            if sent is None:
+                continue
+            self.latencies.append(time.perf_counter() - sent)
+            if len(self.latencies) >= self.expected:
+                self.done.set()
+
+    async def discard(self, comm):
+        # the publishing socket's own echo and connection messages
+        while True:
+            await comm.receive_from(timeout=3600)
+
+    def report(self, publish_seconds, wall, cpu_start, cpu_end):
+        latencies = np.array(self.latencies) * 1000.0
+        published = len(self.sent)
+        user, system = cpu_end[0] - cpu_start[0], cpu_end[1] - cpu_start[1]
+        return {
+            "published": published,
+            "publish_errors": self.errors,
+            "expected_deliveries": self.expected,
+            "delivered": len(latencies),
+            "delivery_ratio": round(len(latencies) / self.expected, 4) if self.expected else None,
+            "latency_ms": {
+                "p50": round(float(np.percentile(latencies, 50)), 3),
+                "p95": round(float(np.percentile(latencies, 95)), 3),
+                "p99": round(float(np.percentile(latencies, 99)), 3),
+                "mean": round(float(latencies.mean()), 3),
+                "max": round(float(latencies.max()), 3),
+            } if len(latencies) else None,
+            "throughput": {
+                "published_per_second": round(published / publish_seconds, 1) if publish_seconds else None,
+                "delivered_per_second": round(len(latencies) / wall, 1) if wall else None,
+            },
+            "cpu": {
+                "user_seconds": round(user, 3),
+                "system_seconds": round(system, 3),
+                "percent": round(100.0 * (user + system) / wall, 1) if wall else None,
+                "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            },
+            "wall_seconds": round(wall, 3),
+        }
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark publish-to-receive latency of the telemetry fan-out through the ASGI "
+        "application and print the results as JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--robots", type=int, default=2, help="Publishing robots.")
+        parser.add_argument("--subscribers", type=int, default=10, help="WebSocket subscribers, spread over the robots.")
+        parser.add_argument("--messages", type=int, default=200, help="Samples each robot publishes per path.")
+        parser.add_argument("--rate", type=float, default=50.0, help="Samples per second per robot and path; 0 is unpaced.")
+        parser.add_argument("--via", choices=("http", "socket", "both"), default="both",
+                            help="Publish through the joint-position view, the arm-moment socket or both.")
+        parser.add_argument("--layer", choices=("memory", "configured"), default="memory",
+                            help="Use an in-memory channel layer and caches, or the configured "
+                                 "CHANNEL_LAYERS and CACHES.")
+        parser.add_argument("--unthrottled", action="store_true",
+                            help="Ignore TELEMETRY_BROADCAST_RATES, so every sample is delivered.")
+        parser.add_argument("--drain", type=float, default=5.0,
+                            help="Seconds to wait for outstanding deliveries after publishing.")
+        parser.add_argument("--output", help="Write the JSON results to this file instead of stdout.")
+
+    def handle(self, *args, **options):
+        if options["robots"] < 1 or options["subscribers"] < 1 or options["messages"] < 1:
+            raise CommandError("--robots, --subscribers and --messages must be at least 1.")
+
+        if options["layer"] == "memory":
+            layers, cache_settings = MEMORY_LAYER, MEMORY_CACHES
+        else:
+            layers, cache_settings = settings.CHANNEL_LAYERS, settings.CACHES
+        rates = broadcaster.rates
+        # bench rows live in a throwaway test database; keep their journal apart
+        buffer.journal_dir = tempfile.mkdtemp(prefix="bench-journal-")
+        # runs after the buffer's own exit flush, which is registered later
+        atexit.register(shutil.rmtree, buffer.journal_dir, True)
+        databases = setup_databases(verbosity=0, interactive=False)
+        try:
+            with override_settings(CHANNEL_LAYERS=layers, CACHES=cache_settings):
+                from asgi_uk_medical_bot.asgi import application
+
+                if options["unthrottled"]:
+                    broadcaster.rates = {}
+                bench = FanoutBench(
+                    application, options["robots"], options["subscribers"], options["messages"],
+                    options["rate"], options["via"], options["drain"],
+                )
+                results = asyncio.run(bench.run())
+        finally:
+            broadcaster.rates = rates
+            try:
+                # everything still buffered belongs in the bench database; the
+                # exit flushes would run after teardown, against the real one
+                buffer.flush()
+                history.flush()
+                battery.rollups.flush()
+                relay.drain()
+            finally:
+                teardown_databases(databases, verbosity=0)
+
+        results["config"] = {
+            key: options[key]
+            for key in ("robots", "subscribers", "messages", "rate", "via", "layer", "unthrottled")
+        }
+        results["environment"] = {
+            "python": platform.python_version(),
+            "channel_layer": layers["default"]["BACKEND"],
+            "caches": {alias: config["BACKEND"] for alias, config in cache_settings.items()},
+            "broadcast_rates": {} if options["unthrottled"] else rates,
+        }
+        text = json.dumps(results, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(text + "\n")
+        else:
+            self.stdout.write(text)
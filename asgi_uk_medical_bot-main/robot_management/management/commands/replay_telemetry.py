@@ -0,0 +1,163 @@
+import asyncio
+import heapq
+import json
+import time
+from operator import attrgetter
+from urllib.parse import urlencode
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework import serializers
+from websockets.asyncio.client import connect
+from websockets.exceptions import WebSocketException
+
+from robot_management.recorder import read_recording
+from robot_management.robots import clean_robot_id
+
+INGEST_PATH = "/ws/socket-server/robot-ingest/"
+ARM_MOMENT_PATH = "/ws/socket-server/arm-moment/"
+
+
+class Replay:
+    """
+    Sends recorded messages to a running server the way the robots did:
+    telemetry over one robot-ingest socket per robot, joint moves over
+    one arm-moment socket per robot. Ingest messages are numbered and
+    counted off as their acks arrive.
+    """
+
+    def __init__(self, url, token, speed, robot_id, types, ack_timeout):
+        self.url = url.rstrip("/")
+        self.token = token
+        self.speed = speed
+        self.robot_id = robot_id
+        self.types = types
+        self.ack_timeout = ack_timeout
+        self.sockets = {}
+        self.readers = []
+        self.unacked = {}
+        self.acked = asyncio.Event()
+        self.seq = 0
+        self.replayed = self.rejected = 0
+        self.errors = []
+
+    async def run(self, records):
+        first = started = None
+        try:
+            for record in records:
+                if self.types and record.message_type not in self.types:
+                    continue
+                if self.speed:
+                    if first is None:
+                        first, started = record.timestamp, time.monotonic()
+                    delay = started + (record.timestamp - first) / self.speed - time.monotonic()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                await self.send(record, self.robot_id or record.robot_id)
+
+            if self.unacked:
+                self.acked.clear()
+                try:
+                    await asyncio.wait_for(self.acked.wait(), self.ack_timeout)
+                except asyncio.TimeoutError:
+                    self.errors.append(f"{len(self.unacked)} messages were not acknowledged in {self.ack_timeout}s")
+        finally:
+            # the server flushes the robot's buffered writes when its ingest socket closes
+            for socket in self.sockets.values():
+                await socket.close()
+            for task in self.readers:
+                task.cancel()
+            await asyncio.gather(*self.readers, return_exceptions=True)
+
+    async def send(self, record, robot_id):
+        if record.message_type == "arm_moment":
+            socket = await self.socket(ARM_MOMENT_PATH, robot_id)
+            await socket.send(json.dumps({"role": "robot", "joints": record.data}))
+            self.replayed += 1
+            return
+        socket = await self.socket(INGEST_PATH, robot_id)
+        self.seq += 1
+        self.unacked[self.seq] = record
+        await socket.send(json.dumps({"seq": self.seq, "type": record.message_type, "data": record.data}))
+
+    async def socket(self, path, robot_id):
+        socket = self.sockets.get((path, robot_id))
+        if socket is None:
+            query = {"robot_id": robot_id}
+            if path == INGEST_PATH and self.token:
+                query["token"] = self.token
+            socket = await connect(f"{self.url}{path}?{urlencode(query)}", max_size=None)
+            if path == INGEST_PATH:
+                # connection_established; a rejected token closes the socket instead
+                await socket.recv()
+            self.sockets[(path, robot_id)] = socket
+            self.readers.append(asyncio.create_task(self.read(socket, path == INGEST_PATH)))
+        return socket
+
+    async def read(self, socket, ingest):
+        async for text in socket:
+            if not ingest:
+                continue  # the arm-moment socket's own echo
+            message = json.loads(text)
+            if message.get("type") != "ack":
+                continue
+            record = self.unacked.pop(message.get("seq"), None)
+            if record is not None:
+                if message["status"] == "ok":
+                    self.replayed += 1
+                else:
+                    # rejected when recorded as well, unless the server failed
+                    self.rejected += 1
+                    if message.get("errors") == "Internal server error.":
+                        self.errors.append(f"{record.message_type} at {record.timestamp:.3f} failed on the server")
+            if not self.unacked:
+                self.acked.set()
+
+
+class Command(BaseCommand):
+    help = (
+        "Replay telemetry recordings (see recorder.py) against a running server over its "
+        "robot WebSocket endpoints, in recorded time order at --speed times real time."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("paths", nargs="+", help="Recording files; records of all files are merged by time.")
+        parser.add_argument("--url", default="ws://localhost:8000", help="WebSocket base URL of the server.")
+        parser.add_argument("--token", help="JWT access token the ingest socket authenticates with.")
+        parser.add_argument(
+            "--speed", type=float, default=1.0,
+            help="Playback speed: 1 is real time, 10 ten times faster, 0 as fast as possible.",
+        )
+        parser.add_argument("--robot-id", help="Replay every message as this robot instead of the recorded one.")
+        parser.add_argument("--types", help="Comma separated message types to replay (default: all).")
+        parser.add_argument("--ack-timeout", type=float, default=30.0,
+                            help="Seconds to wait for outstanding acks after the last message.")
+
+    def handle(self, *args, **options):
+        speed = options["speed"]
+        if speed < 0:
+            raise CommandError("--speed must be 0 or positive.")
+        robot_id = None
+        if options["robot_id"]:
+            try:
+                robot_id = clean_robot_id(options["robot_id"])
+            except serializers.ValidationError:
+                raise CommandError(f"Invalid robot id '{options['robot_id']}'.")
+        types = set(options["types"].split(",")) if options["types"] else None
+
+        # each file is in arrival order; recordings of several processes interleave
+        records = heapq.merge(*(read_recording(path) for path in options["paths"]), key=attrgetter("timestamp"))
+        replay = Replay(options["url"], options["token"], speed, robot_id, types, options["ack_timeout"])
+        clock = time.monotonic()
+        try:
+            asyncio.run(replay.run(records))
+        except (OSError, ValueError, WebSocketException) as e:
+            raise CommandError(str(e))
+
+        for error in replay.errors:
+            self.stderr.write(error)
+        elapsed = time.monotonic() - clock
+        self.stdout.write(self.style.SUCCESS(
+            f"Replayed {replay.replayed} messages in {elapsed:.2f}s "
+            f"({replay.replayed / elapsed if elapsed else 0:.0f}/s), {replay.rejected} rejected, "
+            f"{len(replay.errors)} errors."
+        ))
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.8 on 2026-10-18 04:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('robot_management', '0036_robottelemetry_robot_qvalue'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TelemetryChunk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stream', models.CharField(choices=[('arm_endpose', 'Arm Endpose'), ('joint_velocity', 'Joint Velocity'), ('joint_effort', 'Joint Effort'), ('joint_position', 'Joint Position'), ('joint_heat', 'Joint Heat')], max_length=32)),
+                ('started_at', models.DateTimeField()),
+                ('ended_at', models.DateTimeField()),
+                ('sample_count', models.PositiveIntegerField(default=0)),
+                ('offsets', models.BinaryField()),
+                ('values', models.BinaryField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['stream', 'started_at'], name='robot_manag_stream_9c3bca_idx')],
+            },
+        ),
+    ]
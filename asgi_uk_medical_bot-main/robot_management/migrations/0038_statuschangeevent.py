@@ -0,0 +1,28 @@
+# Generated by Django 5.2.8 on 2026-10-18 05:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('robot_management', '0037_telemetrychunk'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatusChangeEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=32)),
+                ('object_id', models.PositiveIntegerField()),
+                ('field', models.CharField(max_length=50)),
+                ('old_value', models.CharField(blank=True, max_length=50, null=True)),
+                ('new_value', models.CharField(blank=True, max_length=50, null=True)),
+                ('changed_at', models.DateTimeField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['model', 'field', 'changed_at'], name='robot_manag_model_09a903_idx'), models.Index(fields=['model', 'object_id', 'field', 'changed_at'], name='robot_manag_model_33cb2d_idx')],
+            },
+        ),
+    ]
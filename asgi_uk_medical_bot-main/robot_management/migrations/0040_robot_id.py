@@ -0,0 +1,71 @@
+# Generated by Django 5.2.8 on 2026-10-18 05:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('robot_management', '0039_outboxevent'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='telemetrychunk',
+            name='robot_manag_stream_9c3bca_idx',
+        ),
+        migrations.AddField(
+            model_name='armendpose',
+            name='robot_id',
+            field=models.CharField(db_index=True, default='default', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='armstatus',
+            name='robot_id',
+            field=models.CharField(db_index=True, default='default', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='batterystatus',
+            name='robot_id',
+            field=models.CharField(db_index=True, default='default', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='jointeffort',
+            name='robot_id',
+            field=models.CharField(db_index=True, default='default', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='jointheat',
+            name='robot_id',
+            field=models.CharField(db_index=True, default='default', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='jointposition',
+            name='robot_id',
+            field=models.CharField(db_index=True, default='default', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='jointstatus',
+            name='robot_id',
+            field=models.CharField(db_index=True, default='default', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='jointvelocity',
+            name='robot_id',
+            field=models.CharField(db_index=True, default='default', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='robottelemetry',
+            name='robot_id',
+            field=models.CharField(db_index=True, default='default', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='telemetrychunk',
+            name='robot_id',
+            field=models.CharField(default='default', max_length=64),
+        ),
+        migrations.AddIndex(
+            model_name='telemetrychunk',
+            index=models.Index(fields=['robot_id', 'stream', 'started_at'], name='robot_manag_robot_i_8efed4_idx'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.8 on 2026-10-18 05:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('robot_management', '0040_robot_id'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='telemetrychunk',
+            name='stream',
+            field=models.CharField(choices=[('arm_endpose', 'Arm Endpose'), ('joint_velocity', 'Joint Velocity'), ('joint_effort', 'Joint Effort'), ('joint_position', 'Joint Position'), ('joint_heat', 'Joint Heat'), ('battery', 'Battery')], max_length=32),
+        ),
+        migrations.CreateModel(
+            name='BatteryRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('robot_id', models.CharField(default='default', max_length=64)),
+                ('resolution', models.CharField(choices=[('minute', 'Minute'), ('hour', 'Hour')], max_length=8)),
+                ('bucket_start', models.DateTimeField()),
+                ('samples', models.PositiveIntegerField(default=0)),
+                ('charge_sum', models.FloatField(default=0.0)),
+                ('charge_min', models.FloatField(blank=True, null=True)),
+                ('charge_max', models.FloatField(blank=True, null=True)),
+                ('voltage_sum', models.FloatField(default=0.0)),
+                ('voltage_min', models.FloatField(blank=True, null=True)),
+                ('voltage_max', models.FloatField(blank=True, null=True)),
+                ('current_sum', models.FloatField(default=0.0)),
+                ('current_min', models.FloatField(blank=True, null=True)),
+                ('current_max', models.FloatField(blank=True, null=True)),
+                ('power_sum', models.FloatField(default=0.0)),
+                ('power_min', models.FloatField(blank=True, null=True)),
+                ('power_max', models.FloatField(blank=True, null=True)),
+                ('temperature_sum', models.FloatField(default=0.0)),
+                ('temperature_min', models.FloatField(blank=True, null=True)),
+                ('temperature_max', models.FloatField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('robot_id', 'resolution', 'bucket_start'), name='unique_battery_rollup_bucket')],
+            },
+        ),
+    ]
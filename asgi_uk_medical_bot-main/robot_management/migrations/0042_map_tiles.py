@@ -0,0 +1,33 @@
+# Generated by Django 5.2.8 on 2026-10-18 05:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('robot_management', '0041_battery_rollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mapmanagement',
+            name='map_height',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='mapmanagement',
+            name='map_width',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='mapmanagement',
+            name='tiles_max_zoom',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='mapmanagement',
+            name='tiles_version',
+            field=models.CharField(blank=True, default='', max_length=32),
+        ),
+    ]
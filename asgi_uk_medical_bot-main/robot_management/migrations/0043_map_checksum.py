@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-18 05:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('robot_management', '0042_map_tiles'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mapmanagement',
+            name='checksum',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.8 on 2026-10-18 06:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('robot_management', '0043_map_checksum'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboxLease',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('owner', models.CharField(blank=True, default='', max_length=32)),
+                ('claimed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.8 on 2026-10-18 06:53
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('robot_management', '0044_outbox_lease'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PathCostMatrix',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('map_version', models.CharField(max_length=64)),
+                ('digest', models.CharField(max_length=64, unique=True)),
+                ('keys', models.JSONField(default=list)),
+                ('coordinates', models.JSONField(default=list)),
+                ('distances', models.BinaryField(blank=True, null=True)),
+                ('cell_metres', models.FloatField(blank=True, null=True)),
+                ('status', models.CharField(choices=[('building', 'Building'), ('ready', 'Ready'), ('failed', 'Failed')], default='building', max_length=8)),
+                ('error', models.TextField(blank=True, default='')),
+                ('requested_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('built_at', models.DateTimeField(blank=True, null=True)),
+                ('map', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='path_costs', to='robot_management.mapmanagement')),
+            ],
+        ),
+    ]
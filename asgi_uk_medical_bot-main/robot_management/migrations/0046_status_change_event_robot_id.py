@@ -0,0 +1,35 @@
+# Generated by Django 5.2.8 on 2026-10-18 07:06
+
+from django.db import migrations, models
+
+
+def backfill_robot_id(apps, schema_editor):
+    StatusChangeEvent = apps.get_model("robot_management", "StatusChangeEvent")
+    for model_name in ("armstatus", "jointstatus"):
+        Model = apps.get_model("robot_management", model_name)
+        for pk, robot_id in Model.objects.exclude(robot_id="default").values_list("pk", "robot_id"):
+            StatusChangeEvent.objects.filter(model=model_name, object_id=pk).update(robot_id=robot_id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('robot_management', '0045_path_cost_matrix'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='statuschangeevent',
+            name='robot_manag_model_09a903_idx',
+        ),
+        migrations.AddField(
+            model_name='statuschangeevent',
+            name='robot_id',
+            field=models.CharField(default='default', max_length=64),
+        ),
+        migrations.RunPython(backfill_robot_id, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='statuschangeevent',
+            index=models.Index(fields=['robot_id', 'model', 'field', 'changed_at'], name='robot_manag_robot_i_c5d2f5_idx'),
+        ),
+    ]
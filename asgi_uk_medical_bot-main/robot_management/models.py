@@ -1,7 +1,10 @@
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
 from django.utils import timezone
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .robots import DEFAULT_ROBOT_ID
 
 class RobotTelemetry(models.Model):
 
@@ -47,6 +50,7 @@ class RobotTelemetry(models.Model):
         default=BatchRefreshWeek.MONDAY,
     )
 
+    robot_id = models.CharField(max_length=64, default=DEFAULT_ROBOT_ID, db_index=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
@@ -60,6 +64,7 @@ class ArmEndpose(models.Model):
     ry = models.FloatField(default=0.0)
     rz = models.FloatField(default=0.0)
 
+    robot_id = models.CharField(max_length=64, default=DEFAULT_ROBOT_ID, db_index=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
@@ -73,6 +78,7 @@ class JointVelocity(models.Model):
     j5 = models.FloatField(default=0.0)
     j6 = models.FloatField(default=0.0)
 
+    robot_id = models.CharField(max_length=64, default=DEFAULT_ROBOT_ID, db_index=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
@@ -86,6 +92,7 @@ class JointEffort(models.Model):
     j5 = models.FloatField(default=0.0)
     j6 = models.FloatField(default=0.0)
 
+    robot_id = models.CharField(max_length=64, default=DEFAULT_ROBOT_ID, db_index=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
@@ -99,6 +106,7 @@ class JointPosition(models.Model):
     j5 = models.FloatField(default=0.0)
     j6 = models.FloatField(default=0.0)
 
+    robot_id = models.CharField(max_length=64, default=DEFAULT_ROBOT_ID, db_index=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
@@ -112,12 +120,102 @@ class JointHeat(models.Model):
     j5 = models.FloatField(default=0.0)
     j6 = models.FloatField(default=0.0)
 
+    robot_id = models.CharField(max_length=64, default=DEFAULT_ROBOT_ID, db_index=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"JointHeat(j1={self.j1}, j2={self.j2}, j3={self.j3}, j4={self.j4}, j5={self.j5}, j6={self.j6})"
 
-class ArmStatus(models.Model):
+class StatusChangeTrackedModel(models.Model):
+    """
+    Base for status rows whose `tracked_fields` each carry a
+    `<field>_timestamp` column.
+
+    Values are snapshotted when a row is loaded, so save() can tell which
+    fields changed without re-reading the row: only the changed columns
+    (plus their timestamps and auto_now fields) are written, and every
+    transition is logged as a StatusChangeEvent.
+    """
+    tracked_fields = ()
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._snapshot()
+        return instance
+
+    def _snapshot(self):
+        deferred = self.get_deferred_fields()
+        self._loaded_values = {
+            f.attname: getattr(self, f.attname)
+            for f in self._meta.concrete_fields
+            if f.attname not in deferred
+        }
+
+    def changed_fields(self):
+        """Concrete fields whose value differs from the loaded snapshot."""
+        loaded = getattr(self, "_loaded_values", None)
+        if loaded is None:
+            return None
+        return [name for name, value in loaded.items() if getattr(self, name) != value]
+
+    def save(self, *args, **kwargs):
+        now = timezone.now()
+        adding = self.pk is None
+        loaded = getattr(self, "_loaded_values", None)
+
+        if adding:
+            # On create, initialize all timestamps
+            old_values = {}
+            transitions = list(self.tracked_fields)
+        else:
+            if loaded is not None and all(f in loaded for f in self.tracked_fields):
+                old_values = loaded
+            else:
+                # built by hand or loaded with .only(): read the stored values once
+                old_values = type(self).objects.filter(pk=self.pk).values(*self.tracked_fields).first() or {}
+            transitions = [f for f in self.tracked_fields if getattr(self, f) != old_values.get(f)]
+
+        for field in transitions:
+            setattr(self, f"{field}_timestamp", now)
+
+        if not adding and loaded is not None and kwargs.get("update_fields") is None:
+            update_fields = set(self.changed_fields())
+            update_fields.update(f"{field}_timestamp" for field in transitions)
+            update_fields.update(
+                f.name for f in self._meta.concrete_fields if getattr(f, "auto_now", False)
+            )
+            kwargs["update_fields"] = update_fields
+
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if transitions:
+                StatusChangeEvent.objects.bulk_create([
+                    StatusChangeEvent(
+                        robot_id=self.robot_id,
+                        model=self._meta.model_name,
+                        object_id=self.pk,
+                        field=field,
+                        old_value=old_values.get(field),
+                        new_value=getattr(self, field),
+                        changed_at=now,
+                    )
+                    for field in transitions
+                ])
+        self._snapshot()
+
+
+class ArmStatus(StatusChangeTrackedModel):
+    tracked_fields = (
+        "ctrl_mode", "arm_status", "mode_feed", "teach_mode", "motion_status",
+        "trajectory_num", "voltage_too_low", "motor_overheating", "driver_overcurrent",
+        "driver_overheating", "sensor_status", "driver_error_status", "driver_enable_status",
+        "homing_status",
+    )
+
     ctrl_mode = models.CharField(max_length=50, blank=True)
     ctrl_mode_timestamp = models.DateTimeField(null=True, blank=True)
 
@@ -162,35 +260,15 @@ class ArmStatus(models.Model):
     homing_status = models.CharField(max_length=50, blank=True)
     homing_status_timestamp = models.DateTimeField(null=True, blank=True)
 
+    robot_id = models.CharField(max_length=64, default=DEFAULT_ROBOT_ID, db_index=True)
     created_at = models.DateTimeField(auto_now=True)
 
-    def save(self, *args, **kwargs):
-        if self.pk:
-            old = ArmStatus.objects.get(pk=self.pk)
-            for field in [
-                "ctrl_mode", "arm_status", "mode_feed", "teach_mode", "motion_status",
-                "trajectory_num", "voltage_too_low", "motor_overheating", "driver_overcurrent",
-                "driver_overheating", "sensor_status", "driver_error_status", "driver_enable_status",
-                "homing_status"
-            ]:
-                if getattr(old, field) != getattr(self, field):
-                    setattr(self, f"{field}_timestamp", timezone.now())
-        else:
-            # On create, initialize all timestamps
-            for field in [
-                "ctrl_mode", "arm_status", "mode_feed", "teach_mode", "motion_status",
-                "trajectory_num", "voltage_too_low", "motor_overheating", "driver_overcurrent",
-                "driver_overheating", "sensor_status", "driver_error_status", "driver_enable_status",
-                "homing_status"
-            ]:
-                setattr(self, f"{field}_timestamp", timezone.now())
-
-        super().save(*args, **kwargs)
-
     def __str__(self):
         return f"Arm {self.arm_number} - {self.arm_status}"
 
-class JointStatus(models.Model):
+class JointStatus(StatusChangeTrackedModel):
+    tracked_fields = ("limit", "comms", "motor")
+
     JOINT_CHOICES = [(str(i), f"Joint {i}") for i in range(1, 6)]
     joint_number = models.CharField(max_length=1, choices=JOINT_CHOICES)
 
@@ -203,25 +281,9 @@ class JointStatus(models.Model):
     motor = models.CharField(max_length=50, blank=True)
     motor_timestamp = models.DateTimeField(null=True, blank=True)
 
+    robot_id = models.CharField(max_length=64, default=DEFAULT_ROBOT_ID, db_index=True)
     created_at = models.DateTimeField(auto_now=True)
 
-    def save(self, *args, **kwargs):
-        if self.pk:
-            old = JointStatus.objects.get(pk=self.pk)
-            for field in [
-                "limit", "comms", "motor"
-            ]:
-                if getattr(old, field) != getattr(self, field):
-                    setattr(self, f"{field}_timestamp", timezone.now())
-        else:
-            # On create, initialize all timestamps
-            for field in [
-                "limit", "comms", "motor"
-            ]:
-                setattr(self, f"{field}_timestamp", timezone.now())
-
-        super().save(*args, **kwargs)
-
     def __str__(self):
         return f"Arm {self.joint_number} - Joint {self.joint_number}"
     
@@ -244,6 +306,7 @@ class BatteryStatus(models.Model):
     temperature = models.CharField(default=0.0)
     time_left = models.CharField(default=0.0)
     count = models.CharField(default=0.0)
+    robot_id = models.CharField(max_length=64, default=DEFAULT_ROBOT_ID, db_index=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
@@ -255,9 +318,177 @@ class MapManagement(models.Model):
     robot_map_url = models.URLField(null=True, blank=True)
     robot_map_image_file = models.FileField(null=True, blank=True, upload_to="robot_maps_image/")
     robot_map_image_url = models.URLField(null=True, blank=True)
+    # sha256 of robot_map_file, computed while it was uploaded
+    checksum = models.CharField(max_length=64, blank=True, default="")
+    # tile pyramid of the map (see tiles.py); tiles_version is the content
+    # hash the tile URLs are keyed by, empty until the tiles are built
+    tiles_version = models.CharField(max_length=32, blank=True, default="")
+    tiles_max_zoom = models.PositiveIntegerField(null=True, blank=True)
+    map_width = models.PositiveIntegerField(null=True, blank=True)
+    map_height = models.PositiveIntegerField(null=True, blank=True)
     is_active = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
-        return f"{self.map_name} ({'Active' if self.is_active else 'Inactive'}) - Created on {self.created_at.strftime('%Y-%m-%d')}"
\ No newline at end of file
+        return f"{self.map_name} ({'Active' if self.is_active else 'Inactive'}) - Created on {self.created_at.strftime('%Y-%m-%d')}"
+
+class TelemetryChunk(models.Model):
+    STREAM_CHOICES = [
+        ("arm_endpose", "Arm Endpose"),
+        ("joint_velocity", "Joint Velocity"),
+        ("joint_effort", "Joint Effort"),
+        ("joint_position", "Joint Position"),
+        ("joint_heat", "Joint Heat"),
+        ("battery", "Battery"),
+    ]
+
+    stream = models.CharField(max_length=32, choices=STREAM_CHOICES)
+    robot_id = models.CharField(max_length=64, default=DEFAULT_ROBOT_ID)
+    started_at = models.DateTimeField()
+    ended_at = models.DateTimeField()
+    sample_count = models.PositiveIntegerField(default=0)
+    # int32 millisecond offsets from started_at, one per sample
+    offsets = models.BinaryField()
+    # float32 matrix (sample_count x fields) in the stream's field order
+    values = models.BinaryField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["robot_id", "stream", "started_at"]),
+        ]
+
+    def __str__(self):
+        return f"{self.stream} [{self.started_at} - {self.ended_at}] ({self.sample_count} samples)"
+
+class StatusChangeEvent(models.Model):
+    """One transition of a tracked ArmStatus / JointStatus field."""
+    robot_id = models.CharField(max_length=64, default=DEFAULT_ROBOT_ID)
+    model = models.CharField(max_length=32)
+    object_id = models.PositiveIntegerField()
+    field = models.CharField(max_length=50)
+    old_value = models.CharField(max_length=50, null=True, blank=True)
+    new_value = models.CharField(max_length=50, null=True, blank=True)
+    changed_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["robot_id", "model", "field", "changed_at"]),
+            models.Index(fields=["model", "object_id", "field", "changed_at"]),
+        ]
+
+    def __str__(self):
+        return f"{self.model}#{self.object_id}.{self.field}: {self.old_value} -> {self.new_value} at {self.changed_at}"
+
+class OutboxEvent(models.Model):
+    """
+    Channel layer message written in the same transaction as the data it
+    announces; published afterwards by the outbox relay (see outbox.py).
+    """
+    group = models.CharField(max_length=100)
+    message = models.JSONField(encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+    published_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True, default="")
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["published_at", "id"]),
+        ]
+
+    def __str__(self):
+        state = f"published {self.published_at}" if self.published_at else f"pending ({self.attempts} attempts)"
+        return f"{self.group} #{self.pk}: {self.message.get('type')} {state}"
+
+class OutboxLease(models.Model):
+    """
+    Claim on draining the outbox. A relay takes it with a conditional
+    UPDATE (claimed_at unset or older than the lease) so exactly one relay
+    across all processes publishes at a time; see OutboxRelay.drain.
+    """
+    name = models.CharField(max_length=50, unique=True)
+    owner = models.CharField(max_length=32, blank=True, default="")
+    claimed_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.name}: {self.owner or 'free'}"
+
+class BatteryRollup(models.Model):
+    """
+    Per-minute / per-hour aggregate of the battery samples of one robot,
+    merged incrementally as minutes close (see battery.py).
+    """
+    RESOLUTION_CHOICES = [
+        ("minute", "Minute"),
+        ("hour", "Hour"),
+    ]
+
+    robot_id = models.CharField(max_length=64, default=DEFAULT_ROBOT_ID)
+    resolution = models.CharField(max_length=8, choices=RESOLUTION_CHOICES)
+    bucket_start = models.DateTimeField()
+    samples = models.PositiveIntegerField(default=0)
+
+    charge_sum = models.FloatField(default=0.0)
+    charge_min = models.FloatField(null=True, blank=True)
+    charge_max = models.FloatField(null=True, blank=True)
+
+    voltage_sum = models.FloatField(default=0.0)
+    voltage_min = models.FloatField(null=True, blank=True)
+    voltage_max = models.FloatField(null=True, blank=True)
+
+    current_sum = models.FloatField(default=0.0)
+    current_min = models.FloatField(null=True, blank=True)
+    current_max = models.FloatField(null=True, blank=True)
+
+    power_sum = models.FloatField(default=0.0)
+    power_min = models.FloatField(null=True, blank=True)
+    power_max = models.FloatField(null=True, blank=True)
+
+    temperature_sum = models.FloatField(default=0.0)
+    temperature_min = models.FloatField(null=True, blank=True)
+    temperature_max = models.FloatField(null=True, blank=True)
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["robot_id", "resolution", "bucket_start"], name="unique_battery_rollup_bucket"
+            ),
+        ]
+
+    def mean(self, field):
+        return getattr(self, f"{field}_sum") / self.samples if self.samples else None
+
+    def __str__(self):
+        return f"{self.robot_id} {self.resolution} {self.bucket_start} ({self.samples} samples)"
+
+class PathCostMatrix(models.Model):
+    """
+    Path lengths between the route points of a map, built by the
+    build_path_costs task (see pathing.py). `digest` identifies the map
+    version and point coordinates the matrix was built for.
+    """
+    STATUS_CHOICES = [
+        ("building", "Building"),
+        ("ready", "Ready"),
+        ("failed", "Failed"),
+    ]
+
+    map = models.ForeignKey(MapManagement, on_delete=models.CASCADE, related_name="path_costs")
+    map_version = models.CharField(max_length=64)
+    digest = models.CharField(max_length=64, unique=True)
+    keys = models.JSONField(default=list)
+    coordinates = models.JSONField(default=list)
+    # .npy bytes of the float32 distance matrix, inf where no path exists
+    distances = models.BinaryField(null=True, blank=True)
+    cell_metres = models.FloatField(null=True, blank=True)
+    status = models.CharField(max_length=8, choices=STATUS_CHOICES, default="building")
+    error = models.TextField(blank=True, default="")
+    requested_at = models.DateTimeField(default=timezone.now)
+    built_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Map {self.map_id} path costs ({len(self.keys)} points, {self.status})"
@@ -0,0 +1,71 @@
+import asyncio
+from collections import deque
+
+
+class SendQueue:
+    """
+    Bounded per-connection outbound queue.
+
+    Each item is flagged droppable or not. When the queue is full the
+    oldest droppable item is discarded to make room; if there is none, a
+    droppable newcomer is discarded instead, and a non-droppable newcomer
+    is refused (put() returns False) so the caller can cut the client off.
+    `backlog_drops` counts drops since the queue last ran empty.
+
+    Items put with a `resync` key belong to a stream the client keeps as
+    deltas; when one is dropped its key lands in `stale`, and the caller
+    must send a full value for that key before any further delta.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        # (droppable, resync key, item)
+        self._items = deque()
+        self._droppable = 0
+        self._ready = asyncio.Event()
+        self.dropped = 0
+        self.backlog_drops = 0
+        self.stale = set()
+
+    def __len__(self):
+        return len(self._items)
+
+    def full(self):
+        """True when the next put() has to drop or refuse an item."""
+        return len(self._items) >= self.maxsize
+
+    def _drop_oldest(self):
+        for index, (droppable, resync, _) in enumerate(self._items):
+            if droppable:
+                del self._items[index]
+                self._droppable -= 1
+                self._count_drop(resync)
+                return True
+        return False
+
+    def put(self, item, droppable=False, resync=None):
+        if self.full() and not (self._droppable and self._drop_oldest()):
+            if not droppable:
+                return False
+            self._count_drop(resync)
+            return True
+
+        self._items.append((droppable, resync, item))
+        self._droppable += droppable
+        self._ready.set()
+        return True
+
+    def _count_drop(self, resync):
+        self.dropped += 1
+        self.backlog_drops += 1
+        if resync is not None:
+            self.stale.add(resync)
+
+    async def get(self):
+        while not self._items:
+            self.backlog_drops = 0
+            self._ready.clear()
+            await self._ready.wait()
+        droppable, _, item = self._items.popleft()
+        self._droppable -= droppable
+        return item
@@ -0,0 +1,195 @@
+import asyncio
+import logging
+import threading
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from asgiref.sync import async_to_sync, SyncToAsync
+
+from .broadcast import broadcaster
+
+logger = logging.getLogger(__name__)
+
+LEASE_NAME = "outbox-relay"
+
+
+def enqueue(group, message):
+    """
+    Record `message` for `group` in the current transaction. It is
+    published by the relay once the transaction commits, and never if it
+    rolls back. Call inside transaction.atomic() together with the write
+    it announces.
+    """
+    from .models import OutboxEvent
+
+    event = OutboxEvent.objects.create(group=group, message=message)
+    transaction.on_commit(relay.wake)
+    return event
+
+
+class OutboxRelay:
+    """
+    Publishes pending OutboxEvent rows to the channel layer.
+
+    Events go out in id order, so per group they arrive in commit order.
+    When a send fails, later events of the same group wait for the next
+    pass (the event's attempts are counted and it is retried) so a group
+    never skips ahead; other groups carry on. Delivery is at-least-once:
+    an event whose send succeeded but whose row could not be marked is
+    sent again.
+
+    Each process runs the relay in a background thread, woken after every
+    commit that enqueued an event and otherwise every OUTBOX_POLL_SECONDS
+    to retry failures. The Celery `relay_outbox` task sweeps up whatever
+    is left, e.g. after a process exited with events still pending.
+    """
+
+    def __init__(self, batch_size=None, poll_seconds=None, max_attempts=None):
+        self.batch_size = batch_size or getattr(settings, "OUTBOX_BATCH_SIZE", 100)
+        self.poll_seconds = poll_seconds or getattr(settings, "OUTBOX_POLL_SECONDS", 5)
+        self.max_attempts = max_attempts or getattr(settings, "OUTBOX_MAX_ATTEMPTS", 20)
+        # a relay that dies mid-drain holds the lease for at most this long;
+        # it is renewed before every batch
+        self.lease_seconds = 60
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._loop = None
+
+    def wake(self):
+        # sync views under ASGI run in a worker thread of the server loop;
+        # publish on that loop so the sends reuse its channel layer connection
+        loop = getattr(SyncToAsync.threadlocal, "main_event_loop", None)
+        with self._lock:
+            if loop is not None and loop.is_running():
+                self._loop = loop
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="outbox-relay", daemon=True)
+                self._thread.start()
+        self._wakeup.set()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.poll_seconds)
+            self._wakeup.clear()
+            try:
+                self.drain()
+            except Exception as e:
+                logger.exception(f"Outbox relay failed: {e}")
+            finally:
+                close_old_connections()
+
+    def drain(self):
+        """
+        Relay batches until the outbox is empty or a send fails (failed
+        events wait for the next poll). Only the relay holding the
+        OutboxLease row drains, so across all processes a group is never
+        published out of order. Returns the count sent.
+        """
+        token = uuid.uuid4().hex
+        if not self._claim(token):
+            return 0
+        total = 0
+        try:
+            while True:
+                sent, failed, fetched = self.relay_batch()
+                total += sent
+                if failed or fetched < self.batch_size or not self._claim(token):
+                    return total
+        finally:
+            self._release(token)
+
+    def _claim(self, token):
+        """
+        Take (or renew) the lease for `token`. The claim is a single
+        conditional UPDATE, atomic on every database backend, so two
+        relays racing for an expired lease cannot both win.
+        """
+        from .models import OutboxLease
+
+        OutboxLease.objects.get_or_create(name=LEASE_NAME)
+        now = timezone.now()
+        claimable = (
+            Q(owner=token)
+            | Q(claimed_at__isnull=True)
+            | Q(claimed_at__lt=now - timedelta(seconds=self.lease_seconds))
+        )
+        return OutboxLease.objects.filter(claimable, name=LEASE_NAME).update(owner=token, claimed_at=now) == 1
+
+    def _release(self, token):
+        from .models import OutboxLease
+
+        try:
+            OutboxLease.objects.filter(name=LEASE_NAME, owner=token).update(owner="", claimed_at=None)
+        except Exception as e:
+            # the lease expires on its own
+            logger.exception(f"Failed to release outbox lease: {e}")
+
+    def relay_batch(self):
+        """
+        Publish one batch of pending events. Returns the number of events
+        sent, failed and fetched. No transaction is held while sending, so
+        writers are not blocked on the channel layer.
+        """
+        from .models import OutboxEvent
+
+        events = list(
+            OutboxEvent.objects
+            .filter(published_at__isnull=True, attempts__lt=self.max_attempts)
+            .order_by("id")[:self.batch_size]
+        )
+        if not events:
+            return 0, 0, 0
+
+        sent, failed = self._publish(events)
+        with transaction.atomic():
+            if sent:
+                OutboxEvent.objects.filter(id__in=sent).update(published_at=timezone.now())
+            for event in failed:
+                event.attempts += 1
+                if event.attempts >= self.max_attempts:
+                    logger.error(
+                        f"Outbox event {event.pk} for {event.group} dropped after {event.attempts} attempts: {event.last_error}"
+                    )
+            if failed:
+                OutboxEvent.objects.bulk_update(failed, ["attempts", "last_error"])
+        return len(sent), len(failed), len(events)
+
+    def _publish(self, events):
+        loop = self._loop
+        if loop is not None and loop.is_running():
+            future = asyncio.run_coroutine_threadsafe(self._send_batch(events), loop)
+            return future.result()
+        return async_to_sync(self._send_batch)(events)
+
+    async def _send_batch(self, events):
+        sent, failed, blocked = [], [], set()
+        for event in events:
+            if event.group in blocked:
+                continue
+            try:
+                await broadcaster.asend(event.group, event.message)
+            except Exception as e:
+                event.last_error = str(e)
+                failed.append(event)
+                blocked.add(event.group)
+                continue
+            sent.append(event.pk)
+        return sent, failed
+
+    def prune(self, days=None):
+        """Delete events published more than `days` ago."""
+        from .models import OutboxEvent
+
+        days = days or getattr(settings, "OUTBOX_RETENTION_DAYS", 7)
+        cutoff = timezone.now() - timedelta(days=days)
+        deleted, _ = OutboxEvent.objects.filter(published_at__lt=cutoff).delete()
+        return deleted
+
+
+relay = OutboxRelay()
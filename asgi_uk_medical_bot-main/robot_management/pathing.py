@@ -0,0 +1,445 @@
+import hashlib
+import io
+import logging
+import math
+import threading
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from scipy import ndimage
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+
+from .stcm import load_map_grid
+
+logger = logging.getLogger(__name__)
+
+# rows of the full-resolution grid coarsened per pass, in coarse cells
+BAND_CELLS = 256
+
+# path lengths computed per dijkstra() call (float64 each)
+DIJKSTRA_CELLS = 4_000_000
+
+# (row step, column step, length in cells) of the 8-connected moves; each
+# undirected edge is listed once
+MOVES = ((0, 1, 1.0), (1, 0, 1.0), (1, 1, math.sqrt(2)), (1, -1, math.sqrt(2)))
+
+
+def _shifted(array, dr, dc):
+    """(source, target) views of `array` for the move (dr, dc), dr >= 0."""
+    height, width = array.shape
+    if dc >= 0:
+        return array[:height - dr, :width - dc], array[dr:, dc:]
+    return array[:height - dr, -dc:], array[dr:, :width + dc]
+
+
+class PathGrid:
+    """
+    Coarse 8-connected graph of a map's free space.
+
+    The occupancy grid is cut into blocks of `factor` x `factor` cells
+    (PATH_CELL_METRES across). A block is passable when it holds at least
+    one free cell and no occupied one, so narrow obstacles are never
+    smoothed away and unexplored space is never crossed. Diagonal moves
+    may not cut the corner of a blocked block.
+    """
+
+    def __init__(self, header, grid, cell_metres=None, units_per_metre=None, y_up=None):
+        cell_metres = cell_metres or getattr(settings, "PATH_CELL_METRES", 0.25)
+        units_per_metre = units_per_metre or getattr(settings, "MAP_UNITS_PER_METRE", 1000)
+        self.y_up = getattr(settings, "MAP_Y_UP", True) if y_up is None else y_up
+        if header.resolution <= 0:
+            raise ValueError(f"Map resolution must be positive, got {header.resolution}.")
+
+        resolution = header.resolution / units_per_metre
+        self.factor = max(1, round(cell_metres / resolution))
+        self.cell = self.factor * resolution
+        self.origin = (header.origin_x / units_per_metre, header.origin_y / units_per_metre)
+        self.height = grid.shape[0] * resolution
+
+        self.free = self._coarsen(grid, self.factor)
+        self.nodes = np.full(self.free.shape, -1, dtype=np.int64)
+        self.nodes[self.free] = np.arange(int(self.free.sum()))
+        self.graph = self._graph()
+        self._nearest = None
+
+    @staticmethod
+    def _coarsen(grid, factor):
+        height, width = grid.shape
+        rows, cols = -(-height // factor), -(-width // factor)
+        free = np.zeros((rows, cols), dtype=bool)
+        step = BAND_CELLS * factor
+        # band by band, so a memory-mapped grid is never loaded whole
+        for start in range(0, height, step):
+            band = np.asarray(grid[start:start + step])
+            pad = ((0, -len(band) % factor), (0, -width % factor))
+            shape = (-(-len(band) // factor), factor, cols, factor)
+            has_free = np.pad(band == 0, pad).reshape(shape).any(axis=(1, 3))
+            occupied = np.pad((band != 0) & (band != -1), pad).reshape(shape).any(axis=(1, 3))
+            free[start // factor:start // factor + shape[0]] = has_free & ~occupied
+        return free
+
+    def _graph(self):
+        count = int(self.free.sum())
+        sources, targets, weights = [], [], []
+        for dr, dc, length in MOVES:
+            a, b = _shifted(self.free, dr, dc)
+            ok = a & b
+            if dr and dc:
+                ok &= self._corner(dr, dc)
+            na, nb = _shifted(self.nodes, dr, dc)
+            sources.append(na[ok])
+            targets.append(nb[ok])
+            weights.append(np.full(int(ok.sum()), length * self.cell))
+        return csr_matrix(
+            (np.concatenate(weights), (np.concatenate(sources), np.concatenate(targets))),
+            shape=(count, count),
+        )
+
+    def _corner(self, dr, dc):
+        """Whether both blocks beside each diagonal move (dr, dc) are passable."""
+        free = self.free
+        height, width = free.shape
+        if dc > 0:
+            across = free[:height - dr, dc:]       # (r, c + 1)
+            down = free[dr:, :width - dc]          # (r + 1, c)
+        else:
+            across = free[:height - dr, :width + dc]  # (r, c - 1)
+            down = free[dr:, -dc:]                    # (r + 1, c)
+        return across & down
+
+    def cell_of(self, x, y):
+        """Coarse (row, col) of world coordinates in metres."""
+        col = math.floor((x - self.origin[0]) / self.cell)
+        up = (y - self.origin[1]) / self.cell
+        row = math.floor((self.height / self.cell - up) if self.y_up else up)
+        return row, col
+
+    def snap(self, x, y):
+        """
+        (node, metres) for the passable cell nearest to (x, y) and the
+        straight distance to its centre; node is None off the map or in a
+        map without free space.
+        """
+        rows, cols = self.free.shape
+        row, col = self.cell_of(x, y)
+        if not (0 <= row < rows and 0 <= col < cols) or not self.free.any():
+            return None, None
+        if self._nearest is None:
+            self._nearest = ndimage.distance_transform_edt(~self.free, return_distances=False, return_indices=True)
+        near_row, near_col = self._nearest[0][row, col], self._nearest[1][row, col]
+        return int(self.nodes[near_row, near_col]), math.hypot(near_row - row, near_col - col) * self.cell
+
+    def distances(self, coordinates, anchors=None, local=None):
+        """
+        Shortest path lengths in metres between every pair of (x, y)
+        coordinates, as an n x n matrix; inf where no path exists.
+
+        Without `anchors` every point gets a full search. Otherwise only
+        the points flagged in `anchors` (room entry/exit points) do; the
+        others are searched up to `local` metres (PATH_LOCAL_METRES), and
+        farther pairs of them are joined through the anchor that gives the
+        shortest total, which is exact whenever the path leaves through
+        one (beds reached through their room's door).
+        """
+        size = len(coordinates)
+        matrix = np.full((size, size), np.inf)
+        snapped = [self.snap(x, y) for x, y in coordinates]
+        placed = np.array([i for i, (node, _) in enumerate(snapped) if node is not None], dtype=np.int64)
+        if len(placed):
+            nodes = np.array([snapped[i][0] for i in placed])
+            offsets = np.array([snapped[i][1] for i in placed])
+            if anchors is None or not any(anchors[i] for i in placed):
+                exact = np.ones(len(placed), dtype=bool)
+            else:
+                exact = np.array([bool(anchors[i]) for i in placed])
+            local = local or getattr(settings, "PATH_LOCAL_METRES", 20.0)
+
+            paths = np.full((len(placed), len(placed)), np.inf)
+            paths[exact] = self._search(nodes[exact], nodes)
+            paths[~exact] = self._search(nodes[~exact], nodes, limit=local)
+            paths = np.minimum(paths, paths.T)
+            if (~exact).any() and exact.any():
+                near = paths[np.ix_(~exact, exact)]
+                # one anchor at a time keeps this at slots x slots floats
+                via = paths[np.ix_(~exact, ~exact)]
+                for column in near.T:
+                    np.minimum(via, column[:, None] + column[None, :], out=via)
+                paths[np.ix_(~exact, ~exact)] = via
+            matrix[np.ix_(placed, placed)] = paths + offsets[:, None] + offsets[None, :]
+        np.fill_diagonal(matrix, 0.0)
+        return matrix
+
+    def _search(self, sources, targets, limit=np.inf):
+        """Path lengths (len(sources) x len(targets)) from dijkstra()."""
+        if not len(sources):
+            return np.empty((0, len(targets)))
+        # dijkstra returns a row over every node per source; run the
+        # sources in chunks so that stays around DIJKSTRA_CELLS values
+        chunk = max(1, DIJKSTRA_CELLS // max(1, self.graph.shape[0]))
+        return np.vstack([
+            dijkstra(self.graph, directed=False, indices=sources[i:i + chunk], limit=limit)[:, targets]
+            for i in range(0, len(sources), chunk)
+        ])
+
+
+def route_points():
+    """
+    (keys, coordinates) of every room entry and exit point and every bed
+    slot with coordinates set. Keys are "entry:<room>", "exit:<room>" and
+    "slot:<slot id>".
+    """
+    from bed_data.models import RoomPositionModel, SlotDataModel
+
+    keys, coordinates = [], []
+    rooms = (
+        RoomPositionModel.objects.filter(is_active=True, room_name__isnull=False)
+        .order_by("id")
+        .values_list("room_name__room_name", "entry_point_x", "entry_point_y", "exit_point_x", "exit_point_y")
+    )
+    for room, entry_x, entry_y, exit_x, exit_y in rooms:
+        if entry_x is not None and entry_y is not None:
+            keys.append(f"entry:{room}")
+            coordinates.append((entry_x, entry_y))
+        if exit_x is not None and exit_y is not None:
+            keys.append(f"exit:{room}")
+            coordinates.append((exit_x, exit_y))
+    slots = (
+        SlotDataModel.objects.filter(is_active=True, x__isnull=False, y__isnull=False)
+        .order_by("id")
+        .values_list("id", "x", "y")
+    )
+    for slot_id, x, y in slots:
+        keys.append(f"slot:{slot_id}")
+        coordinates.append((x, y))
+    return keys, coordinates
+
+
+class PathCostsPending(Exception):
+    """No path costs have been built for the active map yet; a build is queued."""
+
+
+class PathCosts:
+    """
+    Shortest path lengths (metres) between the route points of a map.
+    `stale` is set when the map or a position has changed since they were
+    built (the rebuild is queued).
+    """
+
+    def __init__(self, map_id, version, keys, coordinates, distances, cell, stale=False):
+        self.map_id = map_id
+        self.version = version
+        self.keys = keys
+        self.coordinates = coordinates
+        self.distances = distances
+        self.cell = cell
+        self.stale = stale
+        self.index = {key: i for i, key in enumerate(keys)}
+
+    def distance(self, a, b):
+        """Path length between two route point keys; inf when unreachable, KeyError when unknown."""
+        return float(self.distances[self.index[a], self.index[b]])
+
+    def travel_seconds(self, a, b):
+        return self.distance(a, b) / getattr(settings, "ROBOT_TRAVEL_SPEED", 0.5)
+
+    def as_dict(self):
+        rounded = np.round(self.distances, 3)
+        return {
+            "map_id": self.map_id,
+            "map_version": self.version,
+            "cell_metres": round(self.cell, 4),
+            "stale": self.stale,
+            "points": [
+                {"key": key, "x": x, "y": y} for key, (x, y) in zip(self.keys, self.coordinates)
+            ],
+            # null where no path exists
+            "distances": [
+                [value if np.isfinite(value) else None for value in row] for row in rounded.tolist()
+            ],
+        }
+
+
+def _pack(distances):
+    buffer = io.BytesIO()
+    np.save(buffer, distances.astype(np.float32))
+    return buffer.getvalue()
+
+
+def _unpack(data):
+    return np.load(io.BytesIO(bytes(data))).astype(np.float64)
+
+
+class PathCostEngine:
+    """
+    Builds and serves PathCosts for the active map.
+
+    Matrices are computed by the build_path_costs task and stored as
+    PathCostMatrix rows, keyed by a digest of the map version and the
+    route point coordinates; requests only read them. A change to the map
+    file or to a room or slot position gives a new digest, whichever
+    process made it (the bed_data views update coordinates with
+    QuerySet.update(), which sends no signals): the first costs() call
+    that sees it queues the build and serves the previous matrix of the
+    map, marked stale, until the new one is ready. The coarse graph of
+    the map being built is kept per process, and the last matrix read.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._grid_key = None
+        self._grid = None
+        self._loaded = None
+
+    def grid(self, instance):
+        key = (instance.pk, instance.checksum or instance.updated_at.isoformat())
+        with self._lock:
+            if self._grid_key != key:
+                header, grid = load_map_grid(instance.robot_map_file)
+                self._grid = PathGrid(header, grid)
+                self._grid_key = key
+            return self._grid
+
+    def _current(self):
+        """(map, version, keys, coordinates, digest) of the active map, or None."""
+        from .models import MapManagement
+
+        instance = MapManagement.objects.filter(is_active=True).first()
+        if instance is None or not instance.robot_map_file:
+            return None
+        version = instance.checksum or instance.updated_at.isoformat()
+        keys, coordinates = route_points()
+        digest = hashlib.sha256(repr((instance.pk, version, keys, coordinates)).encode()).hexdigest()
+        return instance, version, keys, coordinates, digest
+
+    def queue(self):
+        """
+        Make sure the path costs of the active map's current points are
+        built or being built; returns their PathCostMatrix row, or None
+        when no map with a file is active. A build that has not finished
+        within PATH_COST_BUILD_TIMEOUT_SECONDS is queued again.
+        """
+        from .models import PathCostMatrix
+
+        current = self._current()
+        if current is None:
+            return None
+        instance, version, keys, coordinates, digest = current
+        row, created = PathCostMatrix.objects.get_or_create(digest=digest, defaults={
+            "map": instance, "map_version": version, "keys": keys, "coordinates": coordinates,
+        })
+        if not created and row.status == "building":
+            timeout = timedelta(seconds=getattr(settings, "PATH_COST_BUILD_TIMEOUT_SECONDS", 900))
+            now = timezone.now()
+            # conditional, so only one of several callers requeues it
+            created = PathCostMatrix.objects.filter(
+                pk=row.pk, status="building", requested_at__lt=now - timeout
+            ).update(requested_at=now) == 1
+        if created:
+            self._send(row.pk)
+        return row
+
+    @staticmethod
+    def _send(matrix_id):
+        from .tasks import build_path_costs
+
+        def send():
+            try:
+                build_path_costs.delay(matrix_id)
+            except Exception as e:
+                logger.exception(f"Failed to queue path cost build {matrix_id}: {e}")
+
+        transaction.on_commit(send)
+
+    def costs(self):
+        """
+        PathCosts for the active map, or None when no map with a file is
+        active. Never computes anything: when the current points have no
+        matrix yet, a build is queued and the map's previous matrix is
+        returned as stale, or PathCostsPending raised if it has none.
+        Raises ValueError when the active map cannot be used.
+        """
+        from .models import PathCostMatrix
+
+        row = self.queue()
+        if row is None:
+            return None
+        if row.status == "failed":
+            raise ValueError(row.error)
+        stale = row.status != "ready"
+        if stale:
+            row = (
+                PathCostMatrix.objects.filter(map_id=row.map_id, status="ready")
+                .defer("distances").order_by("-built_at").first()
+            )
+            if row is None:
+                raise PathCostsPending()
+        return self._load(row, stale)
+
+    def _load(self, row, stale):
+        from .models import PathCostMatrix
+
+        with self._lock:
+            loaded = self._loaded
+        if loaded is None or loaded[0] != row.pk:
+            data = PathCostMatrix.objects.filter(pk=row.pk).values_list("distances", flat=True).first()
+            if data is None:
+                raise PathCostsPending()
+            loaded = (row.pk, _unpack(data))
+            with self._lock:
+                self._loaded = loaded
+        coordinates = [tuple(point) for point in row.coordinates]
+        return PathCosts(row.map_id, row.map_version, row.keys, coordinates, loaded[1], row.cell_metres, stale)
+
+    def build(self, matrix_id):
+        """
+        Compute a queued PathCostMatrix (the build_path_costs task). An
+        unusable map marks it failed; a build for points that are no longer
+        current is dropped, and so are the map's older matrices once the
+        new one is ready.
+        """
+        from .models import PathCostMatrix
+
+        row = PathCostMatrix.objects.select_related("map").filter(pk=matrix_id, status="building").first()
+        if row is None:
+            return False
+        current = self._current()
+        if current is None or current[4] != row.digest:
+            # the map or a position changed again while this was queued
+            row.delete()
+            return False
+        try:
+            grid = self.grid(row.map)
+        except ValueError as e:
+            PathCostMatrix.objects.filter(pk=row.pk).update(status="failed", error=str(e))
+            logger.error(f"Path costs of map {row.map_id} could not be built: {e}")
+            return False
+
+        anchors = [not key.startswith("slot:") for key in row.keys]
+        distances = grid.distances([tuple(point) for point in row.coordinates], anchors=anchors)
+        built_at = timezone.now()
+        with transaction.atomic():
+            PathCostMatrix.objects.filter(pk=row.pk).update(
+                distances=_pack(distances), cell_metres=grid.cell, status="ready", built_at=built_at,
+            )
+            PathCostMatrix.objects.filter(map_id=row.map_id, status="ready").exclude(pk=row.pk).delete()
+        logger.info(f"Computed path costs for {len(row.keys)} points on map {row.map_id}")
+        return True
+
+    def abandon(self, matrix_id):
+        """Forget a build that kept failing, so the next costs() call queues it again."""
+        from .models import PathCostMatrix
+
+        PathCostMatrix.objects.filter(pk=matrix_id, status="building").delete()
+
+    def reset(self):
+        with self._lock:
+            self._grid_key = None
+            self._grid = None
+            self._loaded = None
+
+
+engine = PathCostEngine()
@@ -0,0 +1,153 @@
+import atexit
+import logging
+import mmap
+import os
+import queue
+import struct
+import threading
+import time
+from collections import namedtuple
+
+import msgpack
+from django.conf import settings
+
+from .robots import DEFAULT_ROBOT_ID
+
+logger = logging.getLogger(__name__)
+
+# Recording file: FILE_HEADER (magic, format version), then one record per
+# message: RECORD_HEADER (float64 epoch seconds it arrived, uint32 body
+# length) followed by the msgpack body [robot_id, message_type, data].
+# message_type is one of telemetry.INGEST_TYPES or "arm_moment".
+MAGIC = b"MBTELREC"
+VERSION = 1
+FILE_HEADER = struct.Struct("<8sH")
+RECORD_HEADER = struct.Struct("<dI")
+
+Record = namedtuple("Record", "timestamp robot_id message_type data")
+
+
+def _plain(data):
+    # request.data may be a QueryDict for form posts
+    return data.dict() if hasattr(data, "dict") else data
+
+
+class TelemetryRecorder:
+    """
+    Appends every telemetry message that reaches the ingest endpoints
+    and RobotConsumer to a recording in TELEMETRY_RECORD_DIR (off when
+    unset). Each process writes its own file and starts a new one after
+    TELEMETRY_RECORD_SEGMENT_BYTES. Read recordings with read_recording()
+    and replay them with the replay_telemetry command.
+
+    record() only packs the message and queues it, so it is safe to call
+    from the event loop; a background thread writes the queue out in
+    batches. When the writer falls `queue_size` messages behind, new
+    messages are dropped (and counted) rather than held in memory.
+
+    Recording never fails the request: errors are logged and the message
+    is skipped.
+    """
+
+    def __init__(self, directory=None, segment_bytes=None, queue_size=10000):
+        self.directory = directory if directory is not None else getattr(settings, "TELEMETRY_RECORD_DIR", None)
+        self.segment_bytes = segment_bytes or getattr(settings, "TELEMETRY_RECORD_SEGMENT_BYTES", 256 * 1024 * 1024)
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(queue_size)
+        self._thread = None
+        self._file = None
+        self._segment = 0
+        self.dropped = 0
+
+    @property
+    def enabled(self):
+        return bool(self.directory)
+
+    def record(self, message_type, data, robot_id=DEFAULT_ROBOT_ID):
+        if not self.directory:
+            return
+        try:
+            body = msgpack.packb([robot_id, message_type, _plain(data)], default=str)
+            self._start()
+            self._queue.put_nowait(RECORD_HEADER.pack(time.time(), len(body)) + body)
+        except queue.Full:
+            self.dropped += 1
+        except Exception as e:
+            logger.exception(f"Failed to record {message_type} message: {e}")
+
+    def flush(self):
+        """Block until every message queued so far is written."""
+        if self._thread is not None:
+            self._queue.join()
+
+    def _start(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="telemetry-recorder", daemon=True)
+                self._thread.start()
+                atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._write(batch)
+            except Exception as e:
+                logger.exception(f"Failed to write {len(batch)} recorded messages: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write(self, records):
+        for record in records:
+            if self._file is None or self._file.tell() >= self.segment_bytes:
+                self._open()
+            self._file.write(record)
+        self._file.flush()
+        if self.dropped:
+            dropped, self.dropped = self.dropped, 0
+            logger.warning(f"Telemetry recorder fell behind and dropped {dropped} messages")
+
+    def _open(self):
+        if self._file is not None:
+            self._file.close()
+        os.makedirs(self.directory, exist_ok=True)
+        self._segment += 1
+        name = f"telemetry-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{self._segment:04d}.mbrec"
+        self._file = open(os.path.join(self.directory, name), "ab")
+        self._file.write(FILE_HEADER.pack(MAGIC, VERSION))
+
+
+def read_recording(path):
+    """
+    Yield the Records of a recording in file order. The file is memory
+    mapped, so large recordings are not read into memory; a record torn
+    by a crash at the end of the file is skipped.
+    """
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size < FILE_HEADER.size:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            magic, version = FILE_HEADER.unpack_from(data, 0)
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f"{path} is not a version {VERSION} telemetry recording.")
+            offset, size = FILE_HEADER.size, len(data)
+            while offset + RECORD_HEADER.size <= size:
+                timestamp, length = RECORD_HEADER.unpack_from(data, offset)
+                start = offset + RECORD_HEADER.size
+                end = start + length
+                if end > size:
+                    break
+                robot_id, message_type, body = msgpack.unpackb(data[start:end], raw=False)
+                yield Record(timestamp, robot_id, message_type, body)
+                offset = end
+
+
+recorder = TelemetryRecorder()
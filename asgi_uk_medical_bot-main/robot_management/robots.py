@@ -0,0 +1,75 @@
+import re
+from functools import wraps
+
+from rest_framework import serializers, status
+from rest_framework.response import Response
+
+# Robot the single-robot deployment ran as. Its rows are the legacy
+# singletons and its channel layer groups keep the legacy names, so
+# existing robots and dashboards keep working without a robot id.
+DEFAULT_ROBOT_ID = "default"
+
+# channel layer group names allow ASCII letters, digits, "-", "_" and "."
+ROBOT_ID_RE = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+def clean_robot_id(robot_id):
+    """Validated robot id; empty means the default robot."""
+    if robot_id in (None, ""):
+        return DEFAULT_ROBOT_ID
+    robot_id = str(robot_id)
+    if not ROBOT_ID_RE.match(robot_id):
+        raise serializers.ValidationError(
+            {"robot_id": ["Use 1-64 letters, digits, '-' or '_'."]}
+        )
+    return robot_id
+
+
+def request_robot_id(request):
+    """
+    Robot a request is about: ?robot_id=, "robot_id" in the body or the
+    X-Robot-Id header, in that order. Raises ValidationError when invalid.
+    """
+    robot_id = request.query_params.get("robot_id")
+    if not robot_id and hasattr(request.data, "get"):
+        robot_id = request.data.get("robot_id")
+    if not robot_id:
+        robot_id = request.headers.get("X-Robot-Id")
+    return clean_robot_id(robot_id)
+
+
+def with_robot_id(view):
+    """
+    Pass the request's robot (see request_robot_id) to a function view as
+    the `robot_id` keyword argument; an invalid id is answered with 400.
+    Goes below @api_view and @permission_classes.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        try:
+            robot_id = request_robot_id(request)
+        except serializers.ValidationError as e:
+            return Response({"status": "error", "errors": e.detail}, status=status.HTTP_400_BAD_REQUEST)
+        return view(request, *args, robot_id=robot_id, **kwargs)
+    return wrapper
+
+
+def scope_robot_id(scope, query):
+    """Robot of a WebSocket connection: ?robot_id= or the X-Robot-Id header."""
+    robot_id = (query.get("robot_id") or [None])[0]
+    if not robot_id:
+        headers = dict(scope.get("headers", []))
+        robot_id = headers.get(b"x-robot-id", b"").decode() or None
+    return clean_robot_id(robot_id)
+
+
+def robot_group(group, robot_id=DEFAULT_ROBOT_ID):
+    """Channel layer group of `group` for one robot, e.g. joint_position_value_group.r2."""
+    if robot_id == DEFAULT_ROBOT_ID:
+        return group
+    return f"{group}.{robot_id}"
+
+
+def base_group(group):
+    """Inverse of robot_group: the shared group name a robot group derives from."""
+    return group.split(".", 1)[0]
@@ -23,5 +23,8 @@ websocket_urlpatterns = [
     re_path(r'ws/socket-server/refresh-joint-data-value/', consumers.RefreshJointDataValue.as_asgi()),
     re_path(r'ws/socket-server/joint-heat-value/', consumers.JointHeatConsumer.as_asgi()),
     re_path(r'ws/socket-server/arm-moment/', consumers.RobotConsumer.as_asgi()),
+    re_path(r'ws/socket-server/telemetry-frame/', consumers.TelemetryFrameValue.as_asgi()),
+    re_path(r'ws/socket-server/robot-ingest/', consumers.RobotIngestConsumer.as_asgi()),
+    re_path(r'ws/socket-server/multiplex/', consumers.MultiplexConsumer.as_asgi()),
 
 ]
\ No newline at end of file
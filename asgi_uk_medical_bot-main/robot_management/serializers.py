@@ -1,6 +1,7 @@
+from django.urls import reverse
 from rest_framework import serializers
 from .models import ( RobotTelemetry, ArmEndpose, JointVelocity, JointEffort, JointPosition, ArmStatus, JointStatus, FailedScheduledModel,
-                        BatteryStatus, MapManagement, JointHeat
+                        BatteryStatus, MapManagement, JointHeat, StatusChangeEvent
                     )
 
 class RobotTelemetryLastSlotSerializer(serializers.ModelSerializer):
@@ -32,36 +33,49 @@ class RobotTelemetrySerializer(serializers.ModelSerializer):
     class Meta:
         model = RobotTelemetry
         fields = "__all__"
+        # set from the request's robot, never from the payload
+        read_only_fields = ["robot_id"]
 
 class ArmEndposeSerializer(serializers.ModelSerializer):
     class Meta:
         model = ArmEndpose
         fields = "__all__"
+        read_only_fields = ["robot_id"]
 
 class JointVelocitySerializer(serializers.ModelSerializer):
     class Meta:
         model = JointVelocity
         fields = "__all__"
+        read_only_fields = ["robot_id"]
 
 class JointEffortSerializer(serializers.ModelSerializer):
     class Meta:
         model = JointEffort
         fields = "__all__"
+        read_only_fields = ["robot_id"]
 
 class JointPositionSerializer(serializers.ModelSerializer):
     class Meta:
         model = JointPosition
         fields = "__all__"
+        read_only_fields = ["robot_id"]
 
 class ArmStatusSerializer(serializers.ModelSerializer):
     class Meta:
         model = ArmStatus
         fields = "__all__"
+        read_only_fields = ["robot_id"]
 
 class JointStatusSerializer(serializers.ModelSerializer):
     class Meta:
         model = JointStatus
         fields = "__all__"
+        read_only_fields = ["robot_id"]
+
+class StatusChangeEventSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = StatusChangeEvent
+        fields = ["id", "model", "object_id", "field", "old_value", "new_value", "changed_at"]
 
 class FailedScheduledModelSerializer(serializers.ModelSerializer):
     class Meta:
@@ -77,11 +91,24 @@ class BatteryStatusSerializer(serializers.ModelSerializer):
     class Meta:
         model = BatteryStatus
         fields = "__all__"
+        read_only_fields = ["robot_id"]
 
 class MapManagementSerializer(serializers.ModelSerializer):
+    tiles_url = serializers.SerializerMethodField()
+
     class Meta:
         model = MapManagement
         fields = "__all__"
+        read_only_fields = ["checksum", "tiles_version", "tiles_max_zoom", "map_width", "map_height"]
+
+    def get_tiles_url(self, obj):
+        """URL template of the map tiles ({z}/{x}/{y}), or None until they are built."""
+        if not obj.tiles_version:
+            return None
+        url = reverse("map tile", args=[obj.pk, obj.tiles_version, 0, 0, 0])
+        url = url.replace("/0/0/0.png", "/{z}/{x}/{y}.png")
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
 
     def get_image_url(self, obj):
         request = self.context.get('request')
@@ -93,4 +120,39 @@ class MapManagementSerializer(serializers.ModelSerializer):
 class JointHeatSerializer(serializers.ModelSerializer):
     class Meta:
         model = JointHeat
-        fields = "__all__"
\ No newline at end of file
+        fields = "__all__"
+        read_only_fields = ["robot_id"]
+
+class EndposeValuesSerializer(serializers.Serializer):
+    x = serializers.FloatField(required=False)
+    y = serializers.FloatField(required=False)
+    z = serializers.FloatField(required=False)
+    rx = serializers.FloatField(required=False)
+    ry = serializers.FloatField(required=False)
+    rz = serializers.FloatField(required=False)
+
+class JointValuesSerializer(serializers.Serializer):
+    j1 = serializers.FloatField(required=False)
+    j2 = serializers.FloatField(required=False)
+    j3 = serializers.FloatField(required=False)
+    j4 = serializers.FloatField(required=False)
+    j5 = serializers.FloatField(required=False)
+    j6 = serializers.FloatField(required=False)
+
+class TelemetryFrameSerializer(serializers.Serializer):
+    """
+    One arm control tick. Every section is optional; only the sections
+    present in the frame are persisted and broadcast.
+    """
+    timestamp = serializers.DateTimeField(required=False)
+    arm_endpose = EndposeValuesSerializer(required=False)
+    joint_velocity = JointValuesSerializer(required=False)
+    joint_effort = JointValuesSerializer(required=False)
+    joint_position = JointValuesSerializer(required=False)
+    joint_heat = JointValuesSerializer(required=False)
+    arm_status = ArmStatusSerializer(required=False)
+
+    def validate(self, attrs):
+        if not any(key in attrs for key in self.fields if key != "timestamp"):
+            raise serializers.ValidationError("Frame does not contain any telemetry section.")
+        return attrs
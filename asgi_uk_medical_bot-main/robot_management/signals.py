@@ -0,0 +1,24 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import RobotTelemetry
+from .state import robot_state
+from .writebehind import flushed
+
+
+@receiver(post_save, sender=RobotTelemetry)
+def robot_telemetry_saved(sender, instance, update_fields=None, **kwargs):
+    fields = list(update_fields) if update_fields else None
+    transaction.on_commit(lambda: robot_state.set(instance, update_fields=fields))
+
+
+@receiver(post_delete, sender=RobotTelemetry)
+def robot_telemetry_deleted(sender, instance, **kwargs):
+    transaction.on_commit(lambda: robot_state.invalidate(instance.robot_id))
+
+
+@receiver(flushed, sender=RobotTelemetry)
+def robot_telemetry_flushed(sender, instances, fields, **kwargs):
+    for instance in instances:
+        robot_state.set(instance, update_fields=fields)
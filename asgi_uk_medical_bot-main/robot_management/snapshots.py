@@ -0,0 +1,111 @@
+import json
+import logging
+import time
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .robots import DEFAULT_ROBOT_ID, base_group
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "ws_last"
+
+
+def _cache():
+    # snapshots are written by whichever process publishes (ASGI, Celery,
+    # the outbox relay) and read by the ASGI process, so they live in the
+    # shared robot_state cache (checked at startup, see state.py)
+    return caches[getattr(settings, "ROBOT_STATE_CACHE", "default")]
+
+
+def _key(group, message_type):
+    return f"{KEY_PREFIX}:{group}:{message_type}"
+
+
+def _topic_events(name, robot_id=DEFAULT_ROBOT_ID):
+    from .topics import TOPICS, topic_groups
+    from .telemetry import FRAME_MESSAGE
+
+    groups = topic_groups(name, robot_id)
+    events = [(groups[0], TOPICS[name]["message"])]
+    if len(groups) > 1:
+        events.append((groups[1], FRAME_MESSAGE))
+    return events
+
+
+@lru_cache(maxsize=None)
+def snapshot_events():
+    """(group, event type) pairs whose last message is retained."""
+    from .topics import TOPICS
+
+    return frozenset(
+        event
+        for name, spec in TOPICS.items() if spec.get("snapshot")
+        for event in _topic_events(name)
+    )
+
+
+def wanted(group, message):
+    return (base_group(group), message.get("type")) in snapshot_events()
+
+
+def remember(group, message):
+    """
+    Store `message` (as sent, see topics.encode_event) as the last value
+    published on `group`. Telemetry frames only carry the streams that
+    moved, so their sections are merged into the retained frame instead
+    of replacing it.
+    """
+    from .telemetry import FRAME_MESSAGE
+
+    key = _key(group, message.get("type"))
+    try:
+        if message.get("type") == FRAME_MESSAGE and "sections_json" in message:
+            previous = _cache().get(key)
+            sections = dict(message["sections_json"])
+            if previous and "sections_json" in previous["message"]:
+                sections = {**previous["message"]["sections_json"], **sections}
+            message = {"type": FRAME_MESSAGE, "sections_json": sections}
+        _cache().set(
+            key,
+            {"at": time.time(), "message": message},
+            timeout=getattr(settings, "WEBSOCKET_SNAPSHOT_TTL", 86400),
+        )
+    except Exception as e:
+        logger.exception(f"Failed to store snapshot for {group}: {e}")
+
+
+def recall(names, robot_id=DEFAULT_ROBOT_ID):
+    """
+    Last retained payload per topic in `names` (of robot `robot_id` for
+    per-robot topics), as (topic, payload) pairs. Topics fed by more than
+    one group (stream topics also get telemetry frames) use the newest
+    message that carries the topic.
+    """
+    from .topics import TOPICS, topic_payload
+
+    names = [name for name in names if TOPICS[name].get("snapshot")]
+    keys = {name: [_key(*event) for event in _topic_events(name, robot_id)] for name in names}
+    try:
+        stored = _cache().get_many([key for name_keys in keys.values() for key in name_keys])
+    except Exception as e:
+        logger.exception(f"Failed to read snapshots: {e}")
+        return []
+
+    found = []
+    for name in names:
+        entries = sorted(
+            (stored[key] for key in keys[name] if key in stored),
+            key=lambda entry: entry["at"], reverse=True,
+        )
+        for entry in entries:
+            routed = topic_payload(name, entry["message"])
+            if routed is not None:
+                payload, _, payload_json = routed
+                if payload is None and payload_json is not None:
+                    payload = json.loads(payload_json)
+                found.append((name, payload))
+                break
+    return found
@@ -0,0 +1,173 @@
+import copy
+import logging
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+
+from .robots import DEFAULT_ROBOT_ID
+
+logger = logging.getLogger(__name__)
+
+
+# backends whose contents only the current process sees
+PROCESS_LOCAL_CACHES = (
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+)
+
+
+def check_shared_cache():
+    """
+    Raise ImproperlyConfigured when the ROBOT_STATE_CACHE alias is not
+    shared between processes: a write made by Celery or another worker
+    would never reach the ASGI process, which would keep serving stale
+    state.
+    """
+    alias = getattr(settings, "ROBOT_STATE_CACHE", "default")
+    backend = settings.CACHES.get(alias, {}).get("BACKEND")
+    if backend in PROCESS_LOCAL_CACHES:
+        raise ImproperlyConfigured(
+            f"CACHES['{alias}'] uses {backend}, which is not shared between processes; "
+            f"point it at Redis (REDIS_CACHE_URL)."
+        )
+
+
+def _keys(robot_id):
+    """(version key, row key) of one robot."""
+    return f"robot_state:{robot_id}:version", f"robot_state:{robot_id}:row"
+
+
+class RobotStateCache:
+    """
+    Read-through cache of the latest RobotTelemetry row of each robot.
+
+    Each process keeps its own copy of the row together with the version
+    it was read at. A per-robot version counter in the shared cache
+    (ROBOT_STATE_CACHE alias) is bumped on every write, so a read costs one
+    cache lookup and only reloads the row, from the shared cache or as a
+    last resort the database, when another process wrote in between.
+    Writes come in through the RobotTelemetry post_save/post_delete
+    signals (see signals.py).
+    """
+
+    def __init__(self, alias=None):
+        self.alias = alias or getattr(settings, "ROBOT_STATE_CACHE", "default")
+        self._lock = threading.Lock()
+        # robot_id -> (version, instance)
+        self._local = {}
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def get(self, robot_id=DEFAULT_ROBOT_ID):
+        """
+        Return a copy of the robot's latest RobotTelemetry (or None).
+        Callers may modify and save() it; the signal handlers write it back.
+        """
+        version_key, row_key = _keys(robot_id)
+        try:
+            version = self.cache.get(version_key)
+            with self._lock:
+                local = self._local.get(robot_id)
+                if version is not None and local is not None and version == local[0]:
+                    return copy.copy(local[1])
+
+            cached = self.cache.get(row_key)
+            if version is not None and cached is not None and cached[0] == version:
+                instance = cached[1]
+            else:
+                instance, version = self._load(robot_id, version)
+        except Exception as e:
+            logger.exception(f"Robot state cache unavailable, reading database: {e}")
+            return self._query(robot_id)
+
+        with self._lock:
+            self._local[robot_id] = (version, instance)
+        return copy.copy(instance)
+
+    def _query(self, robot_id):
+        from .models import RobotTelemetry
+        return RobotTelemetry.objects.filter(robot_id=robot_id).order_by('-id').first()
+
+    def _load(self, robot_id, version):
+        version_key, row_key = _keys(robot_id)
+        instance = self._query(robot_id)
+        if version is None:
+            self.cache.add(version_key, 0, timeout=None)
+            version = self.cache.get(version_key)
+        self.cache.set(row_key, (version, instance), timeout=None)
+        return instance, version
+
+    def set(self, instance, update_fields=None):
+        """
+        Write-through after a save. With `update_fields` only those fields
+        are copied onto the cached row, so a partially loaded or stale
+        instance cannot overwrite newer values. That merge is a
+        compare-and-set on the version: when another write bumps it
+        between reading the row and bumping it here, the row is dropped
+        and the next read goes to the database.
+        """
+        robot_id = instance.robot_id
+        version_key, row_key = _keys(robot_id)
+        try:
+            if update_fields:
+                self._merge(instance, update_fields)
+                return
+            local = self._local.get(robot_id)
+            if local is not None and local[1] is not None and local[1].pk > instance.pk:
+                # an older row was saved; the latest one is unchanged
+                return
+
+            instance = copy.copy(instance)
+            version = self._bump(version_key)
+            self.cache.set(row_key, (version, instance), timeout=None)
+            with self._lock:
+                self._local[robot_id] = (version, instance)
+        except Exception as e:
+            logger.exception(f"Failed to update robot state cache: {e}")
+
+    def _merge(self, instance, update_fields):
+        robot_id = instance.robot_id
+        version_key, row_key = _keys(robot_id)
+        version = self.cache.get(version_key)
+        cached = self.cache.get(row_key)
+        if version is None or cached is None or cached[0] != version \
+                or cached[1] is None or cached[1].pk != instance.pk:
+            self.invalidate(robot_id)
+            return
+        current = copy.copy(cached[1])
+        for field in update_fields:
+            setattr(current, field, getattr(instance, field))
+        bumped = self._bump(version_key)
+        if bumped != version + 1:
+            # another write landed in between; its fields may be missing here
+            self.cache.delete(row_key)
+            with self._lock:
+                self._local.pop(robot_id, None)
+            return
+        self.cache.set(row_key, (bumped, current), timeout=None)
+        with self._lock:
+            self._local[robot_id] = (bumped, current)
+
+    def invalidate(self, robot_id=DEFAULT_ROBOT_ID):
+        version_key, row_key = _keys(robot_id)
+        try:
+            self._bump(version_key)
+            self.cache.delete(row_key)
+        except Exception as e:
+            logger.exception(f"Failed to invalidate robot state cache: {e}")
+        with self._lock:
+            self._local.pop(robot_id, None)
+
+    def _bump(self, version_key):
+        try:
+            return self.cache.incr(version_key)
+        except ValueError:
+            self.cache.add(version_key, 0, timeout=None)
+            return self.cache.incr(version_key)
+
+
+robot_state = RobotStateCache()
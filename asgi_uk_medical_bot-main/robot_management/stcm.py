@@ -0,0 +1,146 @@
+import logging
+import os
+import struct
+from collections import namedtuple
+from io import BytesIO
+
+import numpy as np
+from django.core.files.base import ContentFile
+from django.db import transaction
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# STCM map file: HEADER (int32 height, width, origin_x, origin_y,
+# resolution) followed by the int8 occupancy grid, row-major:
+# 0 free, 1 occupied, -1 unknown.
+HEADER = struct.Struct("<iiiii")
+
+StcmHeader = namedtuple("StcmHeader", "height width origin_x origin_y resolution")
+
+# int8 cell value (read as uint8) -> RGB; values outside the three known
+# states stay black, as occupied cells
+COLOURS = np.zeros((256, 3), dtype=np.uint8)
+COLOURS[0] = (255, 255, 255)     # free = white
+COLOURS[1] = (0, 0, 0)           # occupied = black
+COLOURS[0xFF] = (128, 128, 128)  # -1: unknown = gray
+
+# COLOURS packed as one uint32 per cell value, so a single np.take does
+# the whole RGB lookup
+_PACKED = np.pad(COLOURS, ((0, 0), (0, 1))).view(np.uint32).ravel()
+
+
+def _grid_shape(header, cells):
+    """(height, width) of the grid for `cells` payload bytes."""
+    if header.height > 0 and header.width > 0 and cells == header.height * header.width:
+        return header.height, header.width
+    side = int(np.sqrt(cells))
+    if not side:
+        raise ValueError("STCM file has no occupancy grid.")
+    logger.warning(
+        f"STCM header mismatch (expected {header.height * header.width}, got {cells}). "
+        f"Falling back to {side}x{side} grid."
+    )
+    return side, side
+
+
+def parse_stcm(data):
+    """
+    Returns (StcmHeader, grid) for the bytes of an STCM file; grid is an
+    int8 (height x width) view of `data`, not a copy. When the payload
+    does not match the header size, the largest square grid that fits is
+    used instead. Raises ValueError for a file too short to hold a header.
+    """
+    if len(data) < HEADER.size:
+        raise ValueError("Invalid STCM file format.")
+    header = StcmHeader(*HEADER.unpack_from(data, 0))
+    height, width = _grid_shape(header, len(data) - HEADER.size)
+    grid = np.frombuffer(data, dtype=np.int8, count=height * width, offset=HEADER.size)
+    return header, grid.reshape(height, width)
+
+
+def open_stcm(path):
+    """
+    parse_stcm() for a file on disk: the grid is a read-only numpy.memmap,
+    so only the parts of it that are used are paged in.
+    """
+    size = os.path.getsize(path)
+    if size < HEADER.size:
+        raise ValueError("Invalid STCM file format.")
+    with open(path, "rb") as f:
+        header = StcmHeader(*HEADER.unpack(f.read(HEADER.size)))
+    shape = _grid_shape(header, size - HEADER.size)
+    return header, np.memmap(path, dtype=np.int8, mode="r", offset=HEADER.size, shape=shape)
+
+
+def load_map_grid(field_file):
+    """
+    (StcmHeader, grid) of a stored STCM FieldFile: memory mapped on local
+    storage, read into memory otherwise.
+    """
+    try:
+        path = field_file.path
+    except NotImplementedError:
+        with field_file.open("rb") as f:
+            return parse_stcm(f.read())
+    return open_stcm(path)
+
+
+def rasterize(grid):
+    """RGB (height x width x 3) image array of an occupancy grid, through COLOURS."""
+    height, width = grid.shape
+    return np.take(_PACKED, grid.view(np.uint8)).view(np.uint8).reshape(height, width, 4)[..., :3]
+
+
+def render_png(grid):
+    """
+    PNG bytes of an occupancy grid: a palette image whose palette is
+    COLOURS, so each cell is written as its own byte with no RGB pass.
+    """
+    image = Image.fromarray(grid.view(np.uint8), mode="L")
+    image.putpalette(COLOURS.tobytes())
+    buffer = BytesIO()
+    # map images are mostly flat areas; low compression is much faster at
+    # nearly the same size
+    image.save(buffer, format="PNG", compress_level=1)
+    return buffer.getvalue()
+
+
+def render_map_image(map_id):
+    """
+    Convert the STCM file of MapManagement `map_id` to its PNG
+    robot_map_image_file. Returns the StcmHeader, or None when the map
+    is gone or has no file.
+    """
+    from .models import MapManagement
+
+    instance = MapManagement.objects.filter(pk=map_id).first()
+    if instance is None or not instance.robot_map_file:
+        return None
+
+    header, grid = load_map_grid(instance.robot_map_file)
+    png = render_png(grid)
+
+    image = instance.robot_map_image_file
+    old_name = image.name
+    image.save(f"map_{instance.pk}.png", ContentFile(png), save=False)
+    # update only the image column: the row may have been activated or
+    # edited while the map was converting
+    MapManagement.objects.filter(pk=instance.pk).update(robot_map_image_file=image.name)
+    if old_name and old_name != image.name:
+        image.storage.delete(old_name)
+    logger.info(f"Rasterized STCM map {instance.pk}: {grid.shape[1]}x{grid.shape[0]} cells")
+    return header
+
+
+def queue_rasterize(map_id):
+    """Convert the map's STCM file in the background once the current transaction commits."""
+    from .tasks import rasterize_stcm_map
+
+    def send():
+        try:
+            rasterize_stcm_map.delay(map_id)
+        except Exception as e:
+            logger.exception(f"Failed to queue STCM rasterization for map {map_id}: {e}")
+
+    transaction.on_commit(send)
@@ -0,0 +1,66 @@
+import logging
+
+from celery import shared_task
+
+from .outbox import relay
+from .pathing import engine as path_engine
+from .stcm import render_map_image
+from .tiles import build_tiles
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def relay_outbox():
+    """Publish outbox events the in-process relays left pending, then prune old ones."""
+    try:
+        sent = relay.drain()
+        pruned = relay.prune()
+        if sent or pruned:
+            logger.info(f"Outbox sweep: {sent} published, {pruned} pruned")
+    except Exception as e:
+        logger.exception(f"Outbox sweep failed: {e}")
+
+
+@shared_task(bind=True, max_retries=3)
+def rasterize_stcm_map(self, map_id):
+    """Render the PNG image of a MapManagement STCM upload."""
+    try:
+        render_map_image(map_id)
+    except ValueError as e:
+        logger.error(f"STCM map {map_id} could not be parsed: {e}")
+    except Exception as e:
+        logger.exception(f"STCM rasterization failed for map {map_id}: {e}")
+        try:
+            self.retry(countdown=30, exc=e)
+        except self.MaxRetriesExceededError:
+            logger.error(f"Max retries exceeded for rasterize_stcm_map({map_id})")
+
+
+@shared_task(bind=True, max_retries=3)
+def build_map_tiles(self, map_id):
+    """Render the tile pyramid of a MapManagement map."""
+    try:
+        build_tiles(map_id)
+    except ValueError as e:
+        logger.error(f"STCM map {map_id} could not be parsed: {e}")
+    except Exception as e:
+        logger.exception(f"Tile build failed for map {map_id}: {e}")
+        try:
+            self.retry(countdown=30, exc=e)
+        except self.MaxRetriesExceededError:
+            logger.error(f"Max retries exceeded for build_map_tiles({map_id})")
+
+
+@shared_task(bind=True, max_retries=3)
+def build_path_costs(self, matrix_id):
+    """Compute the path costs of a PathCostMatrix queued by the path cost engine."""
+    try:
+        path_engine.build(matrix_id)
+    except Exception as e:
+        logger.exception(f"Path cost build {matrix_id} failed: {e}")
+        try:
+            self.retry(countdown=30, exc=e)
+        except self.MaxRetriesExceededError:
+            logger.error(f"Max retries exceeded for build_path_costs({matrix_id})")
+            path_engine.abandon(matrix_id)
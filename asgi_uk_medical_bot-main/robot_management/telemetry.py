@@ -0,0 +1,381 @@
+import logging
+
+from django.db import models, transaction
+from django.utils import timezone
+
+from rest_framework import serializers
+
+from .models import (
+    ArmEndpose,
+    JointVelocity,
+    JointEffort,
+    JointPosition,
+    JointHeat,
+    ArmStatus,
+    JointStatus,
+    BatteryStatus,
+    RobotTelemetry,
+)
+from .serializers import (
+    ArmEndposeSerializer,
+    JointVelocitySerializer,
+    JointEffortSerializer,
+    JointPositionSerializer,
+    JointHeatSerializer,
+    ArmStatusSerializer,
+    JointStatusSerializer,
+    BatteryStatusSerializer,
+    RobotTelemetrySerializer,
+    RobotTelemetryLastRobotEmergencySerializer,
+    TelemetryFrameSerializer,
+)
+from .broadcast import broadcaster
+from . import battery, outbox
+from .anomaly import detector
+from .deadband import deadband
+from .robots import DEFAULT_ROBOT_ID, robot_group
+from .state import robot_state
+from .timeseries import history, STREAM_FIELDS
+from .writebehind import buffer
+
+logger = logging.getLogger(__name__)
+
+FRAME_GROUP = "telemetry_frame_group"
+FRAME_MESSAGE = "telemetry_frame_message"
+
+# stream name -> singleton model, legacy group and handler type
+STREAMS = {
+    "arm_endpose": {
+        "model": ArmEndpose,
+        "serializer": ArmEndposeSerializer,
+        "group": "arm_endpose_value_group",
+        "message": "arm_endpose_value_message",
+    },
+    "joint_velocity": {
+        "model": JointVelocity,
+        "serializer": JointVelocitySerializer,
+        "group": "joint_velocity_value_group",
+        "message": "joint_velocity_value_message",
+    },
+    "joint_effort": {
+        "model": JointEffort,
+        "serializer": JointEffortSerializer,
+        "group": "joint_effort_value_group",
+        "message": "joint_effort_value_message",
+    },
+    "joint_position": {
+        "model": JointPosition,
+        "serializer": JointPositionSerializer,
+        "group": "joint_position_value_group",
+        "message": "joint_position_value_message",
+    },
+    "joint_heat": {
+        "model": JointHeat,
+        "serializer": JointHeatSerializer,
+        "group": "joint_heat_group",
+        "message": "joint_heat_message",
+    },
+}
+
+
+def stream_payload(stream, obj):
+    return {field: getattr(obj, field) for field in STREAM_FIELDS[stream]}
+
+
+def _group_send(group, message_type, payload, robot_id=DEFAULT_ROBOT_ID, **extra):
+    broadcaster.publish(
+        robot_group(group, robot_id),
+        {
+            "type": message_type,
+            "payload": payload,
+            **extra,
+        },
+    )
+
+
+def _outbox_send(group, message_type, payload, robot_id=DEFAULT_ROBOT_ID):
+    # status changes must reach clients in order and survive a failed
+    # send, so they go through the outbox rather than straight out
+    outbox.enqueue(robot_group(group, robot_id), {"type": message_type, "payload": payload})
+
+
+# (model, robot_id) -> pk of the robot's singleton row
+_singleton_pks = {}
+
+
+def get_single_instance(model, robot_id=DEFAULT_ROBOT_ID):
+    """
+    The robot's row of a singleton model, created on first use. The
+    default robot's row is the legacy pk=1 singleton.
+    """
+    pk = _singleton_pks.get((model, robot_id))
+    obj = buffer.get(model, pk) if pk is not None else None
+    if obj is None:
+        obj = model.objects.filter(robot_id=robot_id).order_by('id').first()
+        if obj is None:
+            obj = model.objects.create(robot_id=robot_id)
+        _singleton_pks[(model, robot_id)] = obj.pk
+        obj = buffer.overlay(obj)
+    return obj
+
+
+def _buffered_save(serializer):
+    """serializer.save() for an existing row, through the write-behind buffer."""
+    instance = serializer.instance
+    for field, value in serializer.validated_data.items():
+        setattr(instance, field, value)
+    buffer.put(instance, serializer.validated_data.keys())
+    return instance
+
+
+def update_stream(stream, data, robot_id=DEFAULT_ROBOT_ID):
+    """
+    Apply one (partial) sample to the robot's row of a stream, append it
+    to the history store and broadcast it on the robot's stream group.
+    Samples inside the stream's deadband are neither stored nor broadcast.
+    Raises serializers.ValidationError on bad input.
+    """
+    spec = STREAMS[stream]
+    instance = get_single_instance(spec["model"], robot_id)
+    serializer = spec["serializer"](instance, data=data, partial=True)
+    serializer.is_valid(raise_exception=True)
+    for field, value in serializer.validated_data.items():
+        setattr(instance, field, value)
+
+    values = stream_payload(stream, instance)
+    # fields the update left out are the stored values, not new samples
+    detector.observe(stream, {field: values[field] for field in serializer.validated_data if field in values},
+                     robot_id)
+    result = deadband.check(stream, values, robot_id=robot_id)
+    if result is None:
+        return serializer.data
+    changed, keyframe = result
+
+    _buffered_save(serializer)
+    history.record(stream, instance, robot_id=robot_id)
+
+    _group_send(
+        spec["group"], spec["message"], values,
+        robot_id=robot_id, changed=None if keyframe else changed,
+    )
+    return serializer.data
+
+
+def update_arm_status(data, robot_id=DEFAULT_ROBOT_ID):
+    """Returns (serializer data, created)."""
+    instance = ArmStatus.objects.filter(robot_id=robot_id).order_by('-id').first()
+    serializer = ArmStatusSerializer(instance, data=data, partial=True)
+    serializer.is_valid(raise_exception=True)
+    with transaction.atomic():
+        serializer.save(robot_id=robot_id)
+        _outbox_send("refresh_arm_data_value_group", "refresh_arm_data_value_message", True, robot_id)
+    return serializer.data, instance is None
+
+
+def update_joint_status(data, robot_id=DEFAULT_ROBOT_ID):
+    """Returns (serializer data, created)."""
+    instance = JointStatus.objects.filter(robot_id=robot_id, joint_number=data.get('joint_number')).first()
+    serializer = JointStatusSerializer(instance, data=data, partial=True)
+    serializer.is_valid(raise_exception=True)
+    with transaction.atomic():
+        serializer.save(robot_id=robot_id)
+        _outbox_send("refresh_joint_data_value_group", "refresh_joint_data_value_message", True, robot_id)
+    return serializer.data, instance is None
+
+
+def update_battery_status(data, robot_id=DEFAULT_ROBOT_ID):
+    """Returns (serializer data, created)."""
+    instance = buffer.overlay(BatteryStatus.objects.filter(robot_id=robot_id).order_by('-id').first())
+    if instance:
+        serializer = BatteryStatusSerializer(instance, data=data, partial=True)
+    else:
+        serializer = BatteryStatusSerializer(data=data)
+    serializer.is_valid(raise_exception=True)
+    detector.observe("battery_status", serializer.validated_data, robot_id)
+    if instance:
+        _buffered_save(serializer)
+    else:
+        serializer.save(robot_id=robot_id)
+    battery.record(serializer.instance, robot_id=robot_id)
+    return serializer.data, instance is None
+
+
+def save_robot_telemetry(serializer, robot_id=DEFAULT_ROBOT_ID):
+    """
+    serializer.save() for RobotTelemetry that writes the validated fields
+    at once, ahead of older values any process has buffered for them.
+    """
+    instance = serializer.instance
+    if instance is None:
+        return serializer.save(robot_id=robot_id)
+    for field, value in serializer.validated_data.items():
+        setattr(instance, field, value)
+    buffer.save(instance, serializer.validated_data.keys())
+    return instance
+
+
+def update_robot_telemetry(data, robot_id=DEFAULT_ROBOT_ID):
+    """
+    Returns (serializer data, created). Updates are buffered (and made
+    visible through the robot state cache at once) unless they carry a
+    file, which has to be stored by a regular save.
+    """
+    instance = robot_state.get(robot_id)
+    serializer = RobotTelemetrySerializer(instance, data=data, partial=True)
+    serializer.is_valid(raise_exception=True)
+    has_files = any(
+        isinstance(RobotTelemetry._meta.get_field(field), models.FileField)
+        for field in serializer.validated_data
+    )
+    if instance is None or has_files:
+        save_robot_telemetry(serializer, robot_id)
+    else:
+        _buffered_save(serializer)
+        robot_state.set(instance, list(serializer.validated_data))
+    return serializer.data, instance is None
+
+
+def update_robot_emergency(robot_emergency, instance=None, robot_id=DEFAULT_ROBOT_ID):
+    """
+    Store the emergency button state on the robot's latest RobotTelemetry
+    (or the given `instance`) and broadcast it. Returns the serializer data.
+    """
+    if instance is None:
+        instance = robot_state.get(robot_id)
+        if not instance:
+            raise serializers.ValidationError("No RobotTelemetry found")
+    instance.robot_emergency = robot_emergency
+    serializer = RobotTelemetryLastRobotEmergencySerializer(
+        instance, data={"robot_emergency": robot_emergency}, partial=True
+    )
+    serializer.is_valid(raise_exception=True)
+    with transaction.atomic():
+        # a buffered telemetry update must not land on top of the new state
+        save_robot_telemetry(serializer, instance.robot_id)
+        _outbox_send("emergency_value_group", "emergency_value_message", {
+            "emergency": instance.robot_emergency
+        }, instance.robot_id)
+    return serializer.data
+
+
+def ingest_frame_data(data, robot_id=DEFAULT_ROBOT_ID):
+    """Validate raw frame input (one frame or a list) and ingest it."""
+    many = isinstance(data, list)
+    if many and not data:
+        raise serializers.ValidationError("At least one frame is required.")
+    serializer = TelemetryFrameSerializer(data=data, many=many)
+    serializer.is_valid(raise_exception=True)
+    frames = serializer.validated_data if many else [serializer.validated_data]
+    return ingest_frames(frames, robot_id)
+
+
+def _current_values(stream, robot_id):
+    return stream_payload(stream, get_single_instance(STREAMS[stream]["model"], robot_id))
+
+
+def _write_singleton(stream, values, robot_id):
+    """Buffer the merged values of one stream for the robot's row."""
+    instance = get_single_instance(STREAMS[stream]["model"], robot_id)
+    for field, value in values.items():
+        setattr(instance, field, value)
+    buffer.put(instance, values.keys())
+
+
+def ingest_frames(frames, robot_id=DEFAULT_ROBOT_ID):
+    """
+    Persist a list of validated frames (TelemetryFrameSerializer output)
+    of one robot.
+
+    Every sample outside its stream's deadband goes to the history store;
+    the singleton rows only get the merged latest values, handed to the
+    write-behind buffer once per stream. Returns the combined payload that was
+    broadcast; streams whose samples were all filtered out are left out.
+
+    The arm status is validated before anything else is touched, so a
+    rejected batch leaves the deadband, detector and rows as they were.
+    The writes themselves are not atomic: singleton rows go through the
+    write-behind buffer, outside any transaction.
+    """
+    now = timezone.now()
+    state = {}
+    samples = []
+    changed = {}
+    arm_status = {}
+    for frame in frames:
+        if frame.get("arm_status"):
+            arm_status.update(frame["arm_status"])
+    arm_serializer = None
+    if arm_status:
+        instance = ArmStatus.objects.filter(robot_id=robot_id).order_by('-id').first()
+        arm_serializer = ArmStatusSerializer(instance, data=arm_status, partial=True)
+        arm_serializer.is_valid(raise_exception=True)
+
+    for frame in frames:
+        recorded_at = frame.get("timestamp") or now
+        for stream in STREAMS:
+            values = frame.get(stream)
+            if not values:
+                continue
+            if stream not in state:
+                # partial first sample: start from the stored row
+                full = set(STREAM_FIELDS[stream]) <= values.keys()
+                state[stream] = {} if full else _current_values(stream, robot_id)
+            state[stream].update(values)
+            detector.observe(stream, values, robot_id, recorded_at.timestamp())
+
+            result = deadband.check(stream, state[stream], robot_id=robot_id)
+            if result is None:
+                continue
+            fields, keyframe = result
+            if keyframe or changed.get(stream, []) is None:
+                changed[stream] = None
+            else:
+                seen = set(changed.get(stream, [])) | set(fields)
+                changed[stream] = [f for f in STREAM_FIELDS[stream] if f in seen]
+            samples.append((stream, dict(state[stream]), recorded_at))
+
+    payload = {"timestamp": (frames[-1].get("timestamp") or now).isoformat()}
+
+    for stream in changed:
+        _write_singleton(stream, state[stream], robot_id)
+        payload[stream] = state[stream]
+
+    if arm_serializer is not None:
+        arm_serializer.save(robot_id=robot_id)
+        payload["arm_status"] = arm_serializer.data
+
+    for stream, values, recorded_at in samples:
+        history.record(stream, values, recorded_at, robot_id=robot_id)
+
+    if changed or arm_status:
+        _group_send(FRAME_GROUP, FRAME_MESSAGE, payload, robot_id=robot_id, changed=changed)
+    return payload
+
+
+# message types accepted by ingest() (the robot ingest socket's "type")
+INGEST_TYPES = tuple(STREAMS) + (
+    "frame", "arm_status", "joint_status", "battery_status", "robot_telemetry", "robot_emergency",
+)
+
+
+def ingest(message_type, data, robot_id=DEFAULT_ROBOT_ID):
+    """
+    Apply one robot message through the same functions the HTTP views
+    use. Raises serializers.ValidationError on bad input or an unknown
+    message type.
+    """
+    if message_type in STREAMS:
+        return update_stream(message_type, data, robot_id)
+    if message_type == "frame":
+        return ingest_frame_data(data, robot_id)
+    if message_type == "arm_status":
+        return update_arm_status(data, robot_id)
+    if message_type == "joint_status":
+        return update_joint_status(data, robot_id)
+    if message_type == "battery_status":
+        return update_battery_status(data, robot_id)
+    if message_type == "robot_telemetry":
+        return update_robot_telemetry(data, robot_id)
+    if message_type == "robot_emergency":
+        return update_robot_emergency(data.get("robot_emergency"), robot_id=robot_id)
+    raise serializers.ValidationError(f"Unknown message type '{message_type}'.")
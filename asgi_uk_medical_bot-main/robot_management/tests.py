@@ -1,3 +1,1076 @@
-from django.test import TestCase
+import atexit
+import copy
+import hashlib
+import json
+import os
+import tempfile
+import time
+from datetime import timedelta
+from io import BytesIO
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+import msgpack
+import numpy as np
+from PIL import Image
+
+from channels.testing import WebsocketCommunicator
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile, TemporaryUploadedFile
+from django.db import transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework.test import APIClient
+
+from bed_data.models import BedDataModel, RoomDataModel, RoomPositionModel, SlotDataModel
+from mainapp.models import HealthcareUser
+
+from .anomaly import AnomalyDetector
+from .consumers import JointPositionValue, MultiplexConsumer, RobotIngestConsumer
+from .deadband import DeadbandFilter, deadband
+from .management.commands.bench_fanout import FanoutBench
+from .encoding import FLOAT32_HEADER, FLOAT32_PROTOCOL, MSGPACK_PROTOCOL, FrameEncoder
+from .models import (
+    BatteryRollup, JointPosition, JointStatus, MapManagement, OutboxEvent, PathCostMatrix, RobotTelemetry,
+    TelemetryChunk,
+)
+from . import outbox, snapshots
+from .broadcast import CoalescingBroadcaster, broadcaster
+from .outbound import SendQueue
+from .pathing import PathGrid, engine as path_engine
+from .stcm import COLOURS, HEADER, load_map_grid, parse_stcm, rasterize, render_map_image
+from .tiles import build_tiles, tile_name
+from .recorder import TelemetryRecorder, read_recording
+from .robots import robot_group
+from .state import RobotStateCache, check_shared_cache, robot_state
+from .timeseries import JOINT_FIELDS, TelemetryHistory, history
+from .telemetry import ingest_frames, update_robot_emergency, update_robot_telemetry, update_stream
+from .topics import encode_event, topic_payload
+from .writebehind import WriteBehindBuffer, _replay_journal
+
+API = "/api/medicalbot/robot_management/"
+
+# tests run without Redis: process-local cache and channel layer
+LOCAL_SERVICES = override_settings(
+    CACHES={
+        "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+        "robot_state": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "robot-state"},
+    },
+    CHANNEL_LAYERS={"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}},
+)
+
+
+@LOCAL_SERVICES
+class TelemetryHistoryViewTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def tearDown(self):
+        history.flush()
+
+    def test_naive_datetimes_are_taken_in_the_current_time_zone(self):
+        recorded_at = timezone.now() - timedelta(minutes=30)
+        history.record("joint_heat", [40, 41, 42, 43, 44, 45], recorded_at)
+        local = timezone.localtime(recorded_at).replace(tzinfo=None)
+
+        # end defaults to now (aware)
+        response = self.client.get(f"{API}telemetry/history/joint_heat/", {
+            "start": (local - timedelta(minutes=1)).isoformat(),
+        })
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["data"]["count"], 1)
+
+    def test_unparseable_datetime_is_a_bad_request(self):
+        for value in ("yesterday", "2026-13-01T00:00:00"):
+            response = self.client.get(f"{API}telemetry/history/joint_heat/", {"start": value})
+            self.assertEqual(response.status_code, 400)
+            self.assertIn("start", response.json()["errors"])
+
+
+class TelemetryHistoryTests(TestCase):
+
+    def setUp(self):
+        self.history = TelemetryHistory(chunk_size=100, chunk_seconds=10)
+        self.t0 = timezone.now().timestamp()
+
+    def record(self, *offsets):
+        for offset in offsets:
+            self.history.record("joint_heat", [offset] * 6, self.t0 + offset)
+
+    def load(self):
+        ts, vals = self.history.load("joint_heat", self.t0 - 10 ** 7, self.t0 + 10 ** 7)
+        return np.round(ts - self.t0, 3).tolist(), vals[:, 0].tolist()
+
+    def test_a_backfilled_sample_starts_a_new_chunk(self):
+        self.record(0, 1, -30)
+        self.assertEqual(list(TelemetryChunk.objects.values_list("sample_count", flat=True)), [2])
+
+        self.history.flush()
+        self.assertEqual(TelemetryChunk.objects.count(), 2)
+        self.assertEqual(self.load(), ([-30, 0, 1], [-30, 0, 1]))
+
+    def test_a_chunk_too_long_for_its_offsets_is_split(self):
+        month = 30 * 24 * 3600
+        self.history._write_chunk("joint_heat", [self.t0 + month, self.t0], [[1] * 6, [0] * 6])
+        self.assertEqual(TelemetryChunk.objects.count(), 2)
+        self.assertEqual(self.load(), ([0, month], [0, 1]))
+
+    def test_partial_chunks_are_flushed_once_they_are_old_enough(self):
+        self.record(0)
+        self.history.flush(older_than=60)
+        self.assertFalse(TelemetryChunk.objects.exists())
+
+        with mock.patch("robot_management.timeseries.time.monotonic", return_value=time.monotonic() + 60):
+            self.history.flush(older_than=60)
+        self.assertEqual(TelemetryChunk.objects.count(), 1)
+
+
+@LOCAL_SERVICES
+class BatteryHistoryViewTests(TestCase):
+
+    def test_naive_datetimes_are_taken_in_the_current_time_zone(self):
+        bucket_start = (timezone.now() - timedelta(hours=2)).replace(second=0, microsecond=0)
+        BatteryRollup.objects.create(resolution="minute", bucket_start=bucket_start, samples=1, charge_sum=80.0)
+        local = timezone.localtime(bucket_start).replace(tzinfo=None)
+
+        response = APIClient().get(f"{API}battery/history/", {
+            "start": (local - timedelta(minutes=1)).isoformat(),
+            "end": (local + timedelta(minutes=1)).isoformat(),
+        })
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()["data"]["buckets"]), 1)
+
+    def test_unparseable_datetime_is_a_bad_request(self):
+        response = APIClient().get(f"{API}battery/history/", {"end": "yesterday"})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("end", response.json()["errors"])
+
+
+@LOCAL_SERVICES
+class RobotIngestConsumerTests(TestCase):
+
+    async def test_non_object_messages_are_answered_with_an_error(self):
+        communicator = WebsocketCommunicator(RobotIngestConsumer.as_asgi(), "/ws/socket-server/robot-ingest/")
+        communicator.scope["user"] = HealthcareUser(username="robot")
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        await communicator.receive_json_from()  # connection_established
+
+        for text in ("[]", "1", '"x"', "null"):
+            await communicator.send_to(text_data=text)
+            ack = await communicator.receive_json_from()
+            self.assertEqual(ack["status"], "error")
+            self.assertEqual(ack["errors"], "Message must be a JSON object.")
+        await communicator.disconnect()
+
+
+@LOCAL_SERVICES
+class MultiplexConsumerTests(TestCase):
+
+    async def test_non_object_messages_are_answered_with_an_error(self):
+        communicator = WebsocketCommunicator(MultiplexConsumer.as_asgi(), "/ws/socket-server/multiplex/")
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        await communicator.receive_json_from()  # connection_established
+
+        for text in ("[]", "1", '"x"'):
+            await communicator.send_to(text_data=text)
+            self.assertEqual(
+                await communicator.receive_json_from(),
+                {"type": "error", "message": "Message must be a JSON object."},
+            )
+        await communicator.disconnect()
+
+
+@LOCAL_SERVICES
+class StatusChangeEventsViewTests(TestCase):
+
+    def test_limit_must_be_positive(self):
+        client = APIClient()
+        for limit in ("-1", "0", "x"):
+            response = client.get(f"{API}status-changes/", {"limit": limit})
+            self.assertEqual(response.status_code, 400)
+        self.assertEqual(client.get(f"{API}status-changes/", {"limit": "5000"}).status_code, 200)
+
+    def test_events_are_scoped_to_their_robot(self):
+        for robot_id, motor in (("r1", "ok"), ("r2", "fault")):
+            joint = JointStatus.objects.create(robot_id=robot_id, joint_number="1")
+            joint.motor = motor
+            joint.save()
+
+        client = APIClient()
+        response = client.get(f"{API}status-changes/", {
+            "robot_id": "r2", "model": "jointstatus", "field": "motor", "joint_number": "1",
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([event["new_value"] for event in response.json()["data"]], ["fault", ""])
+
+        response = client.get(f"{API}get-joint-status/", {"robot_id": "r1", "last_changes": "motor"})
+        self.assertEqual(response.json()["last_changes"]["motor"]["new_value"], "ok")
+
+
+class SharedCacheCheckTests(SimpleTestCase):
+
+    def test_process_local_robot_state_cache_is_refused(self):
+        with LOCAL_SERVICES, self.assertRaises(ImproperlyConfigured):
+            check_shared_cache()
+
+    def test_redis_robot_state_cache_is_accepted(self):
+        check_shared_cache()
+
+
+@LOCAL_SERVICES
+class RobotStateCacheTests(TestCase):
+
+    def setUp(self):
+        self.addCleanup(robot_state.invalidate, "r1")
+
+    def test_write_in_one_process_is_seen_by_another(self):
+        # two instances stand for two processes sharing the cache
+        writer, reader = RobotStateCache(), RobotStateCache()
+        row = RobotTelemetry.objects.create(robot_id="r1")
+        self.assertFalse(reader.get("r1").robot_emergency)
+
+        row.robot_emergency = True
+        row.save(update_fields=["robot_emergency"])
+        writer.set(row, update_fields=["robot_emergency"])
+
+        self.assertTrue(reader.get("r1").robot_emergency)
+
+    def test_concurrent_partial_writes_do_not_lose_a_field(self):
+        first, second, reader = RobotStateCache(), RobotStateCache(), RobotStateCache()
+        row = RobotTelemetry.objects.create(robot_id="r1", volume=10)
+        reader.get("r1")
+        RobotTelemetry.objects.filter(pk=row.pk).update(volume=20, robot_emergency=True)
+        volume, emergency = copy.copy(row), copy.copy(row)
+        volume.volume, emergency.robot_emergency = 20, True
+
+        bump = first._bump
+
+        def interleaved(version_key):
+            # the second write lands between the first one's read and bump
+            second.set(emergency, update_fields=["robot_emergency"])
+            return bump(version_key)
+
+        with mock.patch.object(first, "_bump", interleaved):
+            first.set(volume, update_fields=["volume"])
+
+        current = reader.get("r1")
+        self.assertEqual((current.volume, current.robot_emergency), (20, True))
+
+
+class CoalescingBroadcasterTests(SimpleTestCase):
+
+    def setUp(self):
+        self.broadcaster = CoalescingBroadcaster(rates={"joint_position_value_group": 10})
+        patcher = mock.patch.object(self.broadcaster, "_schedule_flush")
+        self.schedule_flush = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def offer(self, group, payload, changed):
+        return self.broadcaster._offer(group, {"type": "joint_position_value_message", "payload": payload, "changed": changed})
+
+    def test_the_latest_value_wins_and_changed_fields_are_unioned(self):
+        group = robot_group("joint_position_value_group", "r1")
+        self.assertIsNotNone(self.offer(group, {"j1": 1.0}, ["j1"]))
+        self.assertIsNone(self.offer(group, {"j1": 1.0, "j2": 2.0}, ["j2"]))
+        self.assertIsNone(self.offer(group, {"j1": 3.0, "j2": 2.0}, ["j1"]))
+        self.assertEqual(self.schedule_flush.call_count, 1)
+
+        pending = self.broadcaster._take_pending(group)
+        self.assertEqual(pending["payload"], {"j1": 3.0, "j2": 2.0})
+        self.assertEqual(pending["changed"], ["j2", "j1"])
+
+    def test_a_keyframe_in_between_makes_the_flush_a_keyframe(self):
+        group = "joint_position_value_group"
+        self.offer(group, {"j1": 1.0}, ["j1"])
+        self.offer(group, {"j1": 2.0}, None)
+        self.offer(group, {"j1": 3.0}, ["j1"])
+        self.assertIsNone(self.broadcaster._take_pending(group)["changed"])
+
+    def test_groups_without_a_rate_are_not_throttled(self):
+        for _ in range(3):
+            self.assertIsNotNone(self.offer("help_group", {"j1": 1.0}, None))
+        self.schedule_flush.assert_not_called()
+
+
+class SendQueueTests(SimpleTestCase):
+
+    def test_dropping_a_resync_frame_marks_its_key_stale(self):
+        queue = SendQueue(2)
+        queue.put("alert", droppable=False)
+        queue.put("delta 1", droppable=True, resync="joint_position")
+        self.assertTrue(queue.put("delta 2", droppable=True, resync="joint_position"))
+
+        self.assertEqual(queue.dropped, 1)
+        self.assertEqual(queue.stale, {"joint_position"})
+        self.assertEqual(len(queue), 2)
+
+    def test_full_queue_of_undroppable_frames_refuses_more(self):
+        queue = SendQueue(1)
+        queue.put("alert", droppable=False)
+        self.assertFalse(queue.put("alert 2", droppable=False))
+        self.assertEqual(queue.stale, set())
+
+
+class DeadbandFilterTests(SimpleTestCase):
+
+    def test_drift_below_the_deadband_adds_up_until_it_passes(self):
+        band = DeadbandFilter({"joint_position": 0.1}, keyframe_seconds=5)
+        joints = dict.fromkeys(JOINT_FIELDS, 0.0)
+        self.assertEqual(band.check("joint_position", joints, now=0), (list(JOINT_FIELDS), True))
+
+        for now, j1, expected in ((1, 0.06, None), (2, 0.12, (["j1"], False)), (3, 0.18, None)):
+            self.assertEqual(band.check("joint_position", {**joints, "j1": j1}, now=now), expected)
+        self.assertEqual(band.check("joint_position", joints, now=7)[1], True)
+
+    def test_streams_without_a_deadband_always_pass(self):
+        band = DeadbandFilter({}, keyframe_seconds=5)
+        joints = dict.fromkeys(JOINT_FIELDS, 0.0)
+        for now in (0, 1):
+            self.assertEqual(band.check("joint_heat", joints, now=now), (list(JOINT_FIELDS), False))
+
+
+class DeltaResyncTests(SimpleTestCase):
+
+    def setUp(self):
+        self.consumer = MultiplexConsumer()
+        self.consumer.delta = True
+        self.consumer.closing = False
+        self.consumer.encoder = FrameEncoder()
+        self.consumer.outbox = SendQueue(1)
+
+    async def send(self, payload, changed):
+        await self.consumer.send_topic("joint_position", payload, changed=changed)
+
+    async def received(self):
+        return json.loads((await self.consumer.outbox.get())["text_data"])
+
+    async def test_a_delta_client_gets_full_values_after_a_drop(self):
+        await self.send({"j1": 1.0, "j2": 0.0}, ["j1"])
+        # the queue is full, so the first delta is dropped for this one
+        await self.send({"j1": 1.0, "j2": 2.0}, ["j2"])
+        self.assertEqual(self.consumer.outbox.dropped, 1)
+        self.assertEqual(await self.received(), {"topic": "joint_position", "payload": {"j1": 1.0, "j2": 2.0}})
+
+        await self.send({"j1": 3.0, "j2": 2.0}, ["j1"])
+        self.assertEqual(await self.received(), {"topic": "joint_position", "payload": {"j1": 3.0, "j2": 2.0}})
+        await self.send({"j1": 4.0, "j2": 2.0}, ["j1"])
+        self.assertEqual(
+            await self.received(), {"topic": "joint_position", "payload": {"j1": 4.0}, "delta": True}
+        )
+
+
+@LOCAL_SERVICES
+class SnapshotTests(SimpleTestCase):
+
+    def test_only_state_topics_are_retained(self):
+        events = {
+            "emergency_value_group": {"type": "emergency_value_message", "payload": {"emergency": True}},
+            "scheduler_value_group": {"type": "scheduler_value_message", "payload": {"batch_id": 1}},
+            "apparatus_value_group": {"type": "apparatus_value_message", "payload": {"apparatus": "on"}},
+            "robot_movement": {"type": "joint_update", "joints": [0, 1]},
+        }
+        for group, message in events.items():
+            self.assertEqual(snapshots.wanted(group, message), group == "emergency_value_group")
+            snapshots.remember(group, message)
+
+        recalled = snapshots.recall(["emergency", "scheduler", "apparatus", "arm_moment"])
+        self.assertEqual(recalled, [("emergency", {"emergency": True})])
+
+    def test_encoded_frames_are_merged_and_decoded(self):
+        for payload in ({"joint_heat": {"j1": 40.0}}, {"joint_position": {"j1": 0.5}}):
+            snapshots.remember("telemetry_frame_group", encode_event({"type": "telemetry_frame_message", "payload": payload}))
+
+        recalled = dict(snapshots.recall(["joint_heat", "joint_position", "telemetry_frame"]))
+        self.assertEqual(recalled["joint_heat"], {"j1": 40.0})
+        self.assertEqual(recalled["telemetry_frame"], {"joint_heat": {"j1": 40.0}, "joint_position": {"j1": 0.5}})
+
+
+class EncodeEventTests(SimpleTestCase):
+
+    def test_payload_is_sent_only_encoded(self):
+        values = {"j1": 1.5, "j2": 2.0}
+        event = encode_event({"type": "joint_position_value_message", "payload": values, "changed": ["j1"]})
+
+        self.assertNotIn("payload", event)
+        self.assertEqual(json.loads(event["payload_json"]), values)
+        self.assertEqual(topic_payload("joint_position", event), (None, ["j1"], event["payload_json"]))
+
+    def test_frames_are_sent_as_encoded_sections(self):
+        payload = {"timestamp": "2026-01-01T00:00:00+00:00", "joint_heat": {"j1": 40.0}}
+        event = encode_event({"type": "telemetry_frame_message", "payload": payload, "changed": {"joint_heat": None}})
+
+        self.assertEqual(set(event), {"type", "sections_json", "changed"})
+        _, _, section_json = topic_payload("joint_heat", event)
+        self.assertEqual(json.loads(section_json), {"j1": 40.0})
+        self.assertIsNone(topic_payload("joint_position", event))
+        _, _, frame = topic_payload("telemetry_frame", event)
+        self.assertEqual(json.loads(frame), payload)
+
+
+@LOCAL_SERVICES
+class EncodedFanOutTests(TestCase):
+
+    async def test_subscriber_receives_the_encoded_payload(self):
+        communicator = WebsocketCommunicator(
+            MultiplexConsumer.as_asgi(), "/ws/socket-server/multiplex/?topics=joint_position"
+        )
+        await communicator.connect()
+        await communicator.receive_json_from()  # connection_established
+
+        await broadcaster.asend("joint_position_value_group", {
+            "type": "joint_position_value_message",
+            "payload": {"j1": 1.0, "j2": 2.0},
+        })
+
+        self.assertEqual(
+            await communicator.receive_json_from(),
+            {"topic": "joint_position", "payload": {"j1": 1.0, "j2": 2.0}},
+        )
+        await communicator.disconnect()
+
+
+@LOCAL_SERVICES
+class BinaryFrameTests(TestCase):
+
+    joints = {"j1": 0.5, "j2": -1.25, "j3": 0.0, "j4": 2.0, "j5": 3.5, "j6": -0.75}
+
+    async def connect(self, consumer, path, subprotocol):
+        communicator = WebsocketCommunicator(consumer.as_asgi(), path, subprotocols=[subprotocol])
+        connected, accepted = await communicator.connect()
+        self.assertTrue(connected)
+        self.assertEqual(accepted, subprotocol)
+        await communicator.receive_json_from()  # connection_established
+        return communicator
+
+    async def send_joints(self, robot_id):
+        # a robot of its own, so no retained snapshot is sent first
+        await broadcaster.asend(robot_group("joint_position_value_group", robot_id), {
+            "type": "joint_position_value_message", "payload": self.joints,
+        })
+
+    async def test_float32_frames_carry_a_sequence_number_and_the_values_in_field_order(self):
+        communicator = await self.connect(
+            JointPositionValue, "/ws/socket-server/joint-position-value/?robot_id=f32", FLOAT32_PROTOCOL
+        )
+        for seq in (1, 2):
+            await self.send_joints("f32")
+            frame = await communicator.receive_from()
+            self.assertEqual(FLOAT32_HEADER.unpack_from(frame), (seq, 6))
+            values = np.frombuffer(frame, dtype="<f4", offset=FLOAT32_HEADER.size)
+            self.assertEqual(values.tolist(), list(self.joints.values()))
+        await communicator.disconnect()
+
+    async def test_msgpack_frames_decode_to_the_json_message(self):
+        communicator = await self.connect(
+            MultiplexConsumer, "/ws/socket-server/multiplex/?topics=joint_position&robot_id=msgpack", MSGPACK_PROTOCOL
+        )
+        await self.send_joints("msgpack")
+        frame = await communicator.receive_from()
+        self.assertEqual(msgpack.unpackb(frame), {"topic": "joint_position", "payload": self.joints})
+        await communicator.disconnect()
+
+    def test_float32_falls_back_to_json_for_payloads_that_are_not_numbers(self):
+        encoder = FrameEncoder(FLOAT32_PROTOCOL)
+        message = {"payload": {"refresh": True}}
+        frame = encoder.encode(message, values=message["payload"])
+        self.assertEqual(json.loads(frame["text_data"]), message)
+        self.assertEqual(encoder.seq, 0)
+
+
+@LOCAL_SERVICES
+class FanoutBenchTests(TransactionTestCase):
+    # the views run on the server's threads, outside a test transaction
+
+    def setUp(self):
+        journal_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(journal_dir.cleanup)
+        buffer = WriteBehindBuffer(flush_seconds=3600, journal_dir=journal_dir.name)
+        self.addCleanup(close_buffer, buffer)
+        for patcher in (
+            mock.patch("robot_management.telemetry.buffer", buffer),
+            mock.patch.object(broadcaster, "rates", {}),
+            mock.patch.object(outbox.relay, "wake"),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        # written while the test database is still there
+        self.addCleanup(history.flush)
+
+    async def test_every_published_sample_is_delivered_and_timed(self):
+        from asgi_uk_medical_bot.asgi import application
+
+        bench = FanoutBench(application, robots=2, subscribers=3, messages=5, rate=0, via="both", drain=5)
+        results = await bench.run()
+
+        self.assertEqual(results["published"], 20)
+        self.assertEqual(results["publish_errors"], 0)
+        # 3 subscribers x 5 samples x 2 paths
+        self.assertEqual((results["expected_deliveries"], results["delivered"]), (30, 30))
+        self.assertLessEqual(results["latency_ms"]["p50"], results["latency_ms"]["max"])
+
+
+@LOCAL_SERVICES
+class OutboxRelayTests(TestCase):
+
+    def enqueue(self, group, n):
+        with transaction.atomic():
+            return outbox.enqueue(group, {"type": "slot_message", "payload": n})
+
+    def test_events_are_published_in_commit_order_per_group(self):
+        for n in range(3):
+            self.enqueue("slot_group", n)
+            self.enqueue("emergency_value_group", n)
+        sent = []
+
+        async def asend(group, message):
+            sent.append((group, message["payload"]))
+
+        with mock.patch.object(outbox.broadcaster, "asend", side_effect=asend):
+            self.assertEqual(outbox.OutboxRelay().drain(), 6)
+
+        for group in ("slot_group", "emergency_value_group"):
+            self.assertEqual([n for g, n in sent if g == group], [0, 1, 2])
+        self.assertFalse(OutboxEvent.objects.filter(published_at__isnull=True).exists())
+
+    def test_failed_send_holds_back_the_rest_of_its_group(self):
+        first = self.enqueue("slot_group", 0)
+        self.enqueue("slot_group", 1)
+        self.enqueue("emergency_value_group", 0)
+        sent = []
+
+        async def asend(group, message):
+            if group == "slot_group" and message["payload"] == 0:
+                raise ConnectionError("channel layer down")
+            sent.append((group, message["payload"]))
+
+        with mock.patch.object(outbox.broadcaster, "asend", side_effect=asend):
+            outbox.OutboxRelay().drain()
+
+        self.assertEqual(sent, [("emergency_value_group", 0)])
+        first.refresh_from_db()
+        self.assertEqual(first.attempts, 1)
+        self.assertIsNone(first.published_at)
+
+    def test_only_one_relay_holds_the_lease(self):
+        first, second = outbox.OutboxRelay(), outbox.OutboxRelay()
+        self.assertTrue(first._claim("a"))
+        self.assertFalse(second._claim("b"))
+        self.assertEqual(second.drain(), 0)
+
+        first._release("a")
+        self.assertTrue(second._claim("b"))
+
+
+@LOCAL_SERVICES
+class SlotReachedPosViewTests(TestCase):
+
+    def tearDown(self):
+        robot_state.invalidate()
+
+    def test_unknown_slot_or_empty_bed_is_not_found(self):
+        client = APIClient()
+        RobotTelemetry.objects.create()
+        room = RoomDataModel.objects.create(room_name="R1")
+        bed = BedDataModel.objects.create(bed_name="B1")
+        SlotDataModel.objects.create(room_name=room, bed_name=bed, x=1.0, y=2.0, yaw=0.0)
+
+        self.assertEqual(client.post(f"{API}transfer-slot-reached-pos/", {}, format="json").status_code, 400)
+        for bed_name in ("B2", "B1"):
+            response = client.post(
+                f"{API}transfer-slot-reached-pos/", {"room": "R1", "bed": bed_name}, format="json"
+            )
+            self.assertEqual(response.status_code, 404)
+        # the position is recorded even without a patient to announce
+        self.assertEqual(RobotTelemetry.objects.get().latest_bed_reached, "B1")
+        self.assertFalse(OutboxEvent.objects.exists())
+
+
+def close_buffer(buffer):
+    if buffer._journal is not None:
+        atexit.unregister(buffer._flush_at_exit)
+        buffer._flush_at_exit()
+
+
+@LOCAL_SERVICES
+class WriteBehindTests(TestCase):
+
+    def setUp(self):
+        journal_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(journal_dir.cleanup)
+        # flushed only when the test says so
+        self.buffer = WriteBehindBuffer(flush_seconds=3600, journal_dir=journal_dir.name)
+        self.addCleanup(close_buffer, self.buffer)
+        for patcher in (
+            mock.patch("robot_management.telemetry.buffer", self.buffer),
+            # the outbox relay thread would write outside the test transaction
+            mock.patch.object(outbox.relay, "wake"),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(robot_state.invalidate)
+
+    def test_buffered_update_does_not_revert_a_direct_save(self):
+        row = RobotTelemetry.objects.create(robot_emergency=False, volume=10)
+        update_robot_telemetry({"robot_emergency": False, "volume": 20})
+        self.assertEqual(RobotTelemetry.objects.get().volume, 10)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            update_robot_emergency(True)
+            self.buffer.flush()
+
+        row.refresh_from_db()
+        self.assertTrue(row.robot_emergency)
+        self.assertEqual(row.volume, 20)
+
+    def test_a_direct_save_wins_over_another_workers_older_buffer(self):
+        row = RobotTelemetry.objects.create(robot_emergency=False, volume=10)
+        journal_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(journal_dir.cleanup)
+        other_worker = WriteBehindBuffer(flush_seconds=3600, journal_dir=journal_dir.name)
+        self.addCleanup(close_buffer, other_worker)
+        stale = RobotTelemetry.objects.get()
+        stale.robot_emergency, stale.volume = False, 20
+        other_worker.put(stale, ["robot_emergency", "volume"])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            update_robot_emergency(True)
+            other_worker.flush()
+
+        row.refresh_from_db()
+        self.assertTrue(row.robot_emergency)
+        self.assertEqual(row.volume, 20)
+
+    def test_journal_entries_older_than_the_row_are_not_replayed(self):
+        row = RobotTelemetry.objects.create(volume=10)
+        path = os.path.join(self.buffer.journal_dir, "writebehind-dead-00000000.journal")
+        with open(path, "w") as journal:
+            for volume, stamp in ((20, row.updated_at - timedelta(hours=1)), (30, row.updated_at - timedelta(minutes=1))):
+                journal.write(json.dumps({
+                    "model": "robot_management.RobotTelemetry", "pk": row.pk,
+                    "fields": {"volume": volume, "updated_at": stamp.isoformat()},
+                }) + "\n")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(_replay_journal([path]), 0)
+        row.refresh_from_db()
+        self.assertEqual(row.volume, 10)
+
+        with open(path, "a") as journal:
+            journal.write(json.dumps({
+                "model": "robot_management.RobotTelemetry", "pk": row.pk,
+                "fields": {"volume": 40, "updated_at": (row.updated_at + timedelta(seconds=1)).isoformat()},
+            }) + "\n")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(_replay_journal([path]), 1)
+        row.refresh_from_db()
+        self.assertEqual(row.volume, 40)
+
+    def test_flush_writes_the_journalled_rows_and_updates_the_state_cache(self):
+        RobotTelemetry.objects.create(volume=10)
+        update_robot_telemetry({"volume": 20})
+        other_process = RobotStateCache()
+        self.assertEqual(other_process.get().volume, 20)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.buffer.flush(), 1)
+
+        self.assertEqual(RobotTelemetry.objects.get().volume, 20)
+        self.assertEqual(other_process.get().volume, 20)
+        # the flushed journal segment is gone, only the open one is left
+        self.assertCountEqual(
+            [name for name in os.listdir(self.buffer.journal_dir) if name.endswith(".journal")],
+            [os.path.basename(self.buffer._journal.name)],
+        )
+
+
+@LOCAL_SERVICES
+class FrameIngestTests(TestCase):
+
+    def setUp(self):
+        journal_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(journal_dir.cleanup)
+        self.buffer = WriteBehindBuffer(flush_seconds=3600, journal_dir=journal_dir.name)
+        self.addCleanup(close_buffer, self.buffer)
+        for patcher in (
+            mock.patch("robot_management.telemetry.buffer", self.buffer),
+            # a throttled send would be flushed by a timer after the test
+            mock.patch.object(broadcaster, "rates", {}),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(deadband.reset)
+        self.addCleanup(history.flush)
+
+    def positions(self, j1):
+        return {f"j{i}": j1 if i == 1 else 0.0 for i in range(1, 7)}
+
+    def test_frames_update_the_row_once_and_keep_every_sample_outside_the_deadband(self):
+        start = timezone.now() - timedelta(seconds=3)
+        frames = [
+            {"timestamp": (start + timedelta(seconds=n)).isoformat(), "joint_position": self.positions(j1)}
+            for n, j1 in enumerate((0.0, 0.05, 1.0))
+        ]
+        response = APIClient().post(f"{API}telemetry/frame/?robot_id=r1", frames, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["data"], {"frames": 3, "streams": ["joint_position"]})
+
+        self.buffer.flush()
+        self.assertEqual(JointPosition.objects.get(robot_id="r1").j1, 1.0)
+        _, values = history.load("joint_position", start, timezone.now(), robot_id="r1")
+        self.assertEqual(values[:, 0].tolist(), [0.0, 1.0])
+
+    def test_a_rejected_arm_status_leaves_the_deadband_untouched(self):
+        frame = {"joint_position": self.positions(0.0)}
+        with self.assertRaises(serializers.ValidationError):
+            ingest_frames([dict(frame, arm_status={"ctrl_mode": "x" * 51})], robot_id="r1")
+        self.assertIn("joint_position", ingest_frames([frame], robot_id="r1"))
+
+
+class AnomalyDetectorTests(SimpleTestCase):
+
+    def setUp(self):
+        self.detector = AnomalyDetector(
+            rules={"joint_heat": {"*": {"limit": 65.0, "direction": "rising"}},
+                   "battery_status": {"charge": {"limit": 15.0, "direction": "falling"}}},
+            # no forecasts within the horizon, only spikes
+            horizon=0.001, min_samples=5,
+        )
+        patcher = mock.patch.object(self.detector, "_notify")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def feed(self, stream, field, values):
+        alerts = []
+        for second, value in enumerate(values):
+            alerts += self.detector.observe(stream, {field: value}, timestamp=second)
+        return [alert["kind"] for alert in alerts]
+
+    def test_spikes_alert_only_towards_the_limit(self):
+        noise = [40.0, 40.5, 39.5, 40.2, 39.8, 40.1, 39.9, 40.0]
+        self.assertEqual(self.feed("joint_heat", "j1", noise + [30.0]), [])
+        self.assertEqual(self.feed("joint_heat", "j2", noise + [50.0]), ["spike"])
+
+        self.detector.reset()
+        charge = [80.0, 80.5, 79.5, 80.2, 79.8, 80.1, 79.9, 80.0]
+        self.assertEqual(self.feed("battery_status", "charge", charge + [95.0]), [])
+        self.detector.reset()
+        self.assertEqual(self.feed("battery_status", "charge", charge + [60.0]), ["spike"])
+
+
+@LOCAL_SERVICES
+class StreamAnomalySamplingTests(TestCase):
+
+    def setUp(self):
+        self.addCleanup(history.flush)
+        self.addCleanup(robot_state.invalidate)
+
+    def test_a_partial_update_only_samples_the_fields_it_carries(self):
+        with mock.patch("robot_management.telemetry.detector") as detector, \
+                mock.patch("robot_management.telemetry.buffer.put"):
+            update_stream("joint_heat", {"j2": 41.5})
+        detector.observe.assert_called_once_with("joint_heat", {"j2": 41.5}, "default")
+
+
+@LOCAL_SERVICES
+class RobotIsolationTests(TestCase):
+
+    def setUp(self):
+        self.addCleanup(robot_state.invalidate)
+        self.addCleanup(robot_state.invalidate, "r2")
+
+    def test_views_read_and_write_only_the_requested_robot(self):
+        client = APIClient()
+        RobotTelemetry.objects.create(latest_room_reached="R1")
+        RobotTelemetry.objects.create(robot_id="r2", latest_room_reached="R1")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.put(f"{API}robot/latest/room/?robot_id=r2", {"latest_room_reached": "R7"}, format="json")
+        self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(client.get(f"{API}fetch-latest-slot/").json()["data"]["latest_room_reached"], "R1")
+        self.assertEqual(
+            client.get(f"{API}fetch-latest-slot/", {"robot_id": "r2"}).json()["data"]["latest_room_reached"], "R7"
+        )
+        rows = client.get(f"{API}all-robot-telemetry/", {"robot_id": "r2"}).json()["data"]
+        self.assertEqual([row["robot_id"] for row in rows], ["r2"])
+        self.assertEqual(client.get(f"{API}fetch-latest-slot/", {"robot_id": "r/2"}).status_code, 400)
+
+    async def test_subscribers_only_receive_their_robots_events(self):
+        communicators = {}
+        for robot_id in ("r1", "r2"):
+            communicator = WebsocketCommunicator(
+                MultiplexConsumer.as_asgi(), f"/ws/socket-server/multiplex/?topics=slot,scheduler&robot_id={robot_id}"
+            )
+            await communicator.connect()
+            await communicator.receive_json_from()  # connection_established
+            communicators[robot_id] = communicator
+
+        await broadcaster.asend(robot_group("slot_group", "r2"), {"type": "slot_message", "payload": {"bed": "B1"}})
+
+        self.assertEqual(
+            await communicators["r2"].receive_json_from(), {"topic": "slot", "payload": {"bed": "B1"}}
+        )
+        self.assertTrue(await communicators["r1"].receive_nothing())
+        for communicator in communicators.values():
+            await communicator.disconnect()
+
+
+class TelemetryRecorderTests(SimpleTestCase):
+
+    def test_messages_are_written_in_order_by_the_writer_thread(self):
+        with tempfile.TemporaryDirectory() as directory:
+            recorder = TelemetryRecorder(directory)
+            for n in range(50):
+                recorder.record("joint_position", {"j1": n}, "r1")
+            recorder.flush()
+
+            [path] = [os.path.join(directory, name) for name in os.listdir(directory)]
+            records = list(read_recording(path))
+            self.assertEqual([record.data["j1"] for record in records], list(range(50)))
+            self.assertEqual({record.robot_id for record in records}, {"r1"})
+
+    def test_messages_beyond_the_queue_are_dropped_not_blocked_on(self):
+        recorder = TelemetryRecorder("unused", queue_size=1)
+        # without its writer thread nothing drains the queue
+        with mock.patch.object(recorder, "_start"):
+            recorder.record("joint_position", {"j1": 1})
+            recorder.record("joint_position", {"j1": 2})
+        self.assertEqual(recorder.dropped, 1)
+
+
+@LOCAL_SERVICES
+class MetricsViewTests(TestCase):
+
+    @override_settings(METRICS_TOKEN="scrape-secret")
+    def test_scrapes_need_the_bearer_token(self):
+        self.assertEqual(self.client.get("/metrics").status_code, 403)
+        self.assertEqual(self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer wrong").status_code, 403)
+
+        response = self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer scrape-secret")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"http_request_duration_seconds", response.content)
+
+    @override_settings(METRICS_TOKEN=None)
+    def test_without_a_token_configured_every_scrape_is_refused(self):
+        self.assertEqual(self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer ").status_code, 403)
+
+
+def stcm_bytes(grid, origin=(0, 0), resolution=50):
+    """STCM file content for an int8 occupancy grid."""
+    grid = np.asarray(grid, dtype=np.int8)
+    return HEADER.pack(*grid.shape, *origin, resolution) + grid.tobytes()
+
+
+class MapStorageTestCase(TestCase):
+    """Maps stored under a throwaway MEDIA_ROOT."""
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        media_root = self.settings(MEDIA_ROOT=media.name)
+        media_root.enable()
+        self.addCleanup(media_root.disable)
+
+    def create_map(self, grid, **kwargs):
+        instance = MapManagement(map_name="ward", **kwargs)
+        instance.robot_map_file.save("ward.stcm", ContentFile(stcm_bytes(grid)))
+        return instance
+
+
+class StcmTests(SimpleTestCase):
+
+    def test_the_grid_is_read_as_laid_out_in_the_header(self):
+        header, grid = parse_stcm(stcm_bytes([[0, 1, -1], [1, 0, 0]], origin=(-2, 3)))
+        self.assertEqual((header.height, header.width, header.origin_x, header.origin_y), (2, 3, -2, 3))
+        self.assertEqual(grid.tolist(), [[0, 1, -1], [1, 0, 0]])
+
+    def test_a_grid_that_does_not_match_its_header_is_read_as_a_square(self):
+        data = HEADER.pack(5, 5, 0, 0, 50) + bytes(9)
+        self.assertEqual(parse_stcm(data)[1].shape, (3, 3))
+        with self.assertRaises(ValueError):
+            parse_stcm(b"short")
+
+    def test_cells_are_coloured_by_state(self):
+        image = rasterize(np.array([[0, 1, -1, 7]], dtype=np.int8))
+        self.assertEqual(image.tolist(), [[[255, 255, 255], [0, 0, 0], [128, 128, 128], [0, 0, 0]]])
+
+
+class RenderMapImageTests(MapStorageTestCase):
+
+    def test_the_png_has_one_pixel_per_cell(self):
+        grid = [[0, 1], [-1, 0], [1, 1]]
+        instance = self.create_map(grid)
+
+        header = render_map_image(instance.pk)
+
+        self.assertEqual((header.height, header.width), (3, 2))
+        instance.refresh_from_db()
+        with instance.robot_map_image_file.open("rb") as f:
+            image = Image.open(f).convert("RGB")
+            pixels = np.asarray(image)
+        self.assertEqual(pixels.tolist(), COLOURS[np.array(grid, dtype=np.int8).view(np.uint8)].tolist())
+
+    def test_a_map_without_a_file_is_skipped(self):
+        instance = MapManagement.objects.create(map_name="empty")
+        self.assertIsNone(render_map_image(instance.pk))
+        self.assertIsNone(render_map_image(instance.pk + 1))
+
+
+class MapTileTests(MapStorageTestCase):
+
+    def setUp(self):
+        super().setUp()
+        grid = np.zeros((200, 300), dtype=np.int8)
+        grid[:, 150:] = 1
+        self.map = self.create_map(grid, checksum="a" * 64)
+
+    def tile_url(self, version, z, x, y):
+        return f"{API}maps/{self.map.pk}/tiles/{version}/{z}/{x}/{y}.png"
+
+    def test_every_zoom_level_is_written_down_to_a_single_tile(self):
+        version = build_tiles(self.map.pk, tile_size=128)
+
+        self.assertEqual(version, "a" * 16)
+        self.map.refresh_from_db()
+        self.assertEqual((self.map.tiles_version, self.map.tiles_max_zoom), (version, 2))
+        self.assertEqual((self.map.map_width, self.map.map_height), (300, 200))
+        for z, columns, rows in ((2, 3, 2), (1, 2, 1), (0, 1, 1)):
+            for x in range(columns + 1):
+                for y in range(rows + 1):
+                    exists = default_storage.exists(tile_name(self.map.pk, version, z, x, y))
+                    self.assertEqual(exists, x < columns and y < rows, (z, x, y))
+
+    def test_tiles_of_an_older_version_are_deleted(self):
+        old = build_tiles(self.map.pk, tile_size=128)
+        MapManagement.objects.filter(pk=self.map.pk).update(checksum="b" * 64)
+
+        build_tiles(self.map.pk, tile_size=128)
+        self.assertFalse(default_storage.exists(tile_name(self.map.pk, old, 0, 0, 0)))
+        self.assertTrue(default_storage.exists(tile_name(self.map.pk, "b" * 16, 0, 0, 0)))
+
+    def test_tiles_are_immutable_and_revalidated_with_their_etag(self):
+        version = build_tiles(self.map.pk, tile_size=128)
+        client = APIClient()
+
+        response = client.get(self.tile_url(version, 0, 0, 0))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "image/png")
+        self.assertIn("immutable", response["Cache-Control"])
+        etag = response["ETag"]
+        self.assertEqual(Image.open(BytesIO(b"".join(response.streaming_content))).size, (128, 128))
+
+        response = client.get(self.tile_url(version, 0, 0, 0), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(client.get(self.tile_url(version, 0, 1, 0)).status_code, 404)
+        self.assertEqual(client.post(self.tile_url(version, 0, 0, 0)).status_code, 405)
+
+
+class StcmUploadTests(MapStorageTestCase):
+
+    def test_the_checksum_is_taken_while_the_upload_streams_to_disk(self):
+        instance = MapManagement.objects.create(map_name="ward", is_active=True)
+        # several upload chunks
+        content = stcm_bytes(np.tile(np.array([[0, 1, -1]], dtype=np.int8), (600, 200)))
+        upload = SimpleUploadedFile("ward.stcm", content)
+
+        with mock.patch.object(TemporaryUploadedFile, "chunks", side_effect=AssertionError("read back")), \
+                mock.patch("robot_management.tasks.rasterize_stcm_map.delay") as rasterize_delay, \
+                mock.patch("robot_management.tasks.build_map_tiles.delay") as tiles_delay, \
+                self.captureOnCommitCallbacks(execute=True):
+            response = APIClient().post(f"{API}save/robot/stcm_map/", {"stcm_file": upload}, format="multipart")
+
+        self.assertEqual(response.status_code, 200)
+        instance.refresh_from_db()
+        self.assertEqual(instance.checksum, hashlib.sha256(content).hexdigest())
+        rasterize_delay.assert_called_once_with(instance.pk)
+        tiles_delay.assert_called_once_with(instance.pk)
+
+        header, grid = load_map_grid(instance.robot_map_file)
+        self.assertIsInstance(grid, np.memmap)
+        self.assertEqual(grid.shape, (600, 600))
+        self.assertEqual(grid[599, -3:].tolist(), [0, 1, -1])
+
+    def test_an_upload_without_a_file_is_rejected(self):
+        MapManagement.objects.create(map_name="ward", is_active=True)
+        response = APIClient().post(f"{API}save/robot/stcm_map/", {}, format="multipart")
+        self.assertEqual(response.status_code, 400)
+
+
+def open_floor(size=40):
+    """PathGrid of an empty size x size map, 0.25 m per cell, origin at 0."""
+    header = SimpleNamespace(resolution=250, origin_x=0, origin_y=0)
+    return PathGrid(header, np.zeros((size, size), dtype=np.int8), cell_metres=0.25)
+
+
+class PathGridTests(SimpleTestCase):
+
+    def test_slots_beyond_the_local_search_are_joined_through_an_anchor(self):
+        grid = open_floor()
+        door, left, right = (5.0, 5.0), (1.0, 5.0), (9.0, 5.0)
+
+        matrix = grid.distances([door, left, right], anchors=[True, False, False], local=1.0)
+
+        self.assertAlmostEqual(matrix[1, 2], matrix[1, 0] + matrix[0, 2])
+        self.assertAlmostEqual(matrix[1, 2], 8.0, delta=0.5)
+
+
+@LOCAL_SERVICES
+class PathCostViewTests(TestCase):
+
+    def setUp(self):
+        self.addCleanup(path_engine.reset)
+        patcher = mock.patch.object(path_engine, "grid", return_value=open_floor())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        MapManagement.objects.create(map_name="ward", robot_map_file="robot_maps/ward.stcm", checksum="v1",
+                                     is_active=True)
+        room = RoomDataModel.objects.create(room_name="room_1")
+        RoomPositionModel.objects.create(room_name=room, entry_point_x=5.0, entry_point_y=5.0)
+        self.slot = SlotDataModel.objects.create(
+            room_name=room, bed_name=BedDataModel.objects.create(bed_name="B1"), x=6.0, y=5.0, yaw=0.0
+        )
+
+    def get(self):
+        with mock.patch("robot_management.tasks.build_path_costs.delay") as delay, \
+                self.captureOnCommitCallbacks(execute=True):
+            response = APIClient().get(f"{API}path-costs/")
+        return response, [call.args[0] for call in delay.call_args_list]
+
+    def test_costs_are_built_in_the_background_and_then_served(self):
+        response, queued = self.get()
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(len(queued), 1)
+        # a second request while the build is queued does not queue another
+        self.assertEqual(self.get()[1], [])
+
+        self.assertTrue(path_engine.build(queued[0]))
+        response, queued = self.get()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(queued, [])
+        data = response.json()["data"]
+        self.assertFalse(data["stale"])
+        self.assertEqual([point["key"] for point in data["points"]], ["entry:room_1", f"slot:{self.slot.pk}"])
+        self.assertAlmostEqual(data["distances"][0][1], 1.0, delta=0.25)
+
+    def test_a_moved_slot_serves_the_previous_costs_until_rebuilt(self):
+        path_engine.build(self.get()[1][0])
+        SlotDataModel.objects.filter(pk=self.slot.pk).update(x=8.0)
+
+        response, queued = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()["data"]["stale"])
+
+        path_engine.build(queued[0])
+        response, _ = self.get()
+        self.assertFalse(response.json()["data"]["stale"])
+        self.assertAlmostEqual(response.json()["data"]["distances"][0][1], 3.0, delta=0.25)
+        self.assertEqual(PathCostMatrix.objects.count(), 1)
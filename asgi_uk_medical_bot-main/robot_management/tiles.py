@@ -0,0 +1,149 @@
+import hashlib
+import logging
+import math
+import posixpath
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image
+
+from .stcm import COLOURS, load_map_grid, rasterize
+
+logger = logging.getLogger(__name__)
+
+TILES_DIR = "robot_map_tiles"
+
+# edge tiles are padded to full size with the unknown colour
+PADDING = tuple(int(c) for c in COLOURS[0xFF])
+
+
+def tile_name(map_id, version, z, x, y):
+    return f"{TILES_DIR}/{map_id}/{version}/{z}/{x}/{y}.png"
+
+
+def grid_version(header, grid):
+    """
+    Content hash of a parsed map, for maps stored without an upload
+    checksum; tile URLs and ETags are keyed by it.
+    """
+    digest = hashlib.sha256(repr(tuple(header)).encode())
+    digest.update(grid.data)
+    return digest.hexdigest()[:16]
+
+
+def max_zoom(width, height, tile_size):
+    """Zoom level at which one map cell is one pixel; level 0 fits the map in one tile."""
+    return max(0, math.ceil(math.log2(max(width, height) / tile_size)))
+
+
+def build_tiles(map_id, tile_size=None):
+    """
+    Render the tile pyramid of MapManagement `map_id` from its STCM file:
+    level max_zoom is the grid at one pixel per cell, and every level below
+    halves it (2x2 box average) until the map fits in one tile. Tiles go to
+    robot_map_tiles/<map_id>/<version>/<z>/<x>/<y>.png and the map row
+    records the version; tiles of older versions are deleted. Returns the
+    version, or None when the map is gone or has no file.
+
+    The full-resolution level is rendered one band of tile rows at a time
+    from the memory-mapped grid, so no RGB copy of the whole map is made;
+    the levels below start at a quarter of that size.
+    """
+    from .models import MapManagement
+
+    tile_size = tile_size or getattr(settings, "MAP_TILE_SIZE", 256)
+    instance = MapManagement.objects.filter(pk=map_id).first()
+    if instance is None or not instance.robot_map_file:
+        return None
+
+    header, grid = load_map_grid(instance.robot_map_file)
+    version = instance.checksum[:16] if instance.checksum else grid_version(header, grid)
+    if version == instance.tiles_version:
+        return version
+
+    height, width = grid.shape
+    top = max_zoom(width, height, tile_size)
+    below = Image.new("RGB", ((width + 1) // 2, (height + 1) // 2)) if top else None
+    count = 0
+    for row in range(math.ceil(height / tile_size)):
+        band = Image.fromarray(rasterize(grid[row * tile_size:(row + 1) * tile_size]))
+        count += _write_level(map_id, version, top, band, tile_size, row)
+        if below is not None:
+            below.paste(band.reduce(2), (0, row * tile_size // 2))
+
+    image = below
+    for z in range(top - 1, -1, -1):
+        count += _write_level(map_id, version, z, image, tile_size)
+        if z:
+            image = image.reduce(2)
+
+    MapManagement.objects.filter(pk=map_id).update(
+        tiles_version=version, tiles_max_zoom=top, map_width=width, map_height=height,
+    )
+    for old in default_storage.listdir(f"{TILES_DIR}/{map_id}")[0]:
+        if old != version:
+            _delete_tree(f"{TILES_DIR}/{map_id}/{old}")
+    logger.info(f"Built {count} tiles (zoom 0-{top}) for map {map_id}, version {version}")
+    return version
+
+
+def _write_level(map_id, version, z, image, tile_size, first_row=0):
+    """Write the tiles of `image`, whose top edge is tile row `first_row` of zoom level z."""
+    count = 0
+    for x in range(math.ceil(image.width / tile_size)):
+        for y in range(math.ceil(image.height / tile_size)):
+            box = (
+                x * tile_size, y * tile_size,
+                min((x + 1) * tile_size, image.width), min((y + 1) * tile_size, image.height),
+            )
+            if box[2] - box[0] == tile_size and box[3] - box[1] == tile_size:
+                tile = image.crop(box)
+            else:
+                tile = Image.new("RGB", (tile_size, tile_size), PADDING)
+                tile.paste(image.crop(box))
+            _write(tile_name(map_id, version, z, x, first_row + y), tile)
+            count += 1
+    return count
+
+
+def _write(name, tile):
+    buffer = BytesIO()
+    tile.save(buffer, format="PNG", compress_level=1)
+    if default_storage.exists(name):
+        default_storage.delete(name)
+    default_storage.save(name, ContentFile(buffer.getvalue()))
+
+
+def _delete_tree(path):
+    if not default_storage.exists(path):
+        return
+    dirs, files = default_storage.listdir(path)
+    for name in files:
+        default_storage.delete(posixpath.join(path, name))
+    for name in dirs:
+        _delete_tree(posixpath.join(path, name))
+    try:
+        # FileSystemStorage leaves empty directories behind
+        default_storage.delete(path)
+    except OSError:
+        pass
+
+
+def delete_tiles(map_id):
+    _delete_tree(f"{TILES_DIR}/{map_id}")
+
+
+def queue_tiles(map_id):
+    """Build the map's tile pyramid in the background once the current transaction commits."""
+    from .tasks import build_map_tiles
+
+    def send():
+        try:
+            build_map_tiles.delay(map_id)
+        except Exception as e:
+            logger.exception(f"Failed to queue tile build for map {map_id}: {e}")
+
+    transaction.on_commit(send)
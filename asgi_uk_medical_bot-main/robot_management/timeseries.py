@@ -0,0 +1,263 @@
+import atexit
+import logging
+import threading
+import time
+from datetime import datetime, timezone as dt_timezone
+
+import numpy as np
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from .robots import DEFAULT_ROBOT_ID
+
+logger = logging.getLogger(__name__)
+
+JOINT_FIELDS = ("j1", "j2", "j3", "j4", "j5", "j6")
+ENDPOSE_FIELDS = ("x", "y", "z", "rx", "ry", "rz")
+BATTERY_FIELDS = ("charge", "voltage", "current", "power", "temperature")
+
+# stream name -> value columns stored for every sample
+STREAM_FIELDS = {
+    "arm_endpose": ENDPOSE_FIELDS,
+    "joint_velocity": JOINT_FIELDS,
+    "joint_effort": JOINT_FIELDS,
+    "joint_position": JOINT_FIELDS,
+    "joint_heat": JOINT_FIELDS,
+    "battery": BATTERY_FIELDS,
+}
+
+# longest span the int32 millisecond offsets of one chunk can hold
+MAX_CHUNK_SPAN = np.iinfo(np.int32).max / 1000.0
+
+
+def _to_epoch(value):
+    if value is None:
+        value = timezone.now()
+    if isinstance(value, datetime):
+        if timezone.is_naive(value):
+            value = timezone.make_aware(value)
+        return value.timestamp()
+    return float(value)
+
+
+def _from_epoch(value):
+    return datetime.fromtimestamp(float(value), tz=dt_timezone.utc)
+
+
+class TelemetryHistory:
+    """
+    Append-only history of the arm/joint streams and the battery.
+
+    Samples are buffered per robot and stream in memory and written as one
+    TelemetryChunk row per block: int32 millisecond offsets plus a
+    float32 (n x fields) value matrix. A block is flushed once it holds
+    `chunk_size` samples, and before a sample that would make it span
+    more than `chunk_seconds`, late or backfilled ones included.
+
+    Unflushed samples are only seen by this process's queries, so a
+    background thread also flushes every block that has been open for
+    `chunk_seconds`: a quiet stream reaches the database within two
+    chunk intervals.
+    """
+
+    def __init__(self, chunk_size=None, chunk_seconds=None):
+        self.chunk_size = chunk_size or getattr(settings, "TELEMETRY_HISTORY_CHUNK_SIZE", 200)
+        self.chunk_seconds = chunk_seconds or getattr(settings, "TELEMETRY_HISTORY_CHUNK_SECONDS", 10)
+        self._lock = threading.Lock()
+        self._buffers = {}
+        # key -> [earliest sample, latest sample, monotonic time the block was opened]
+        self._spans = {}
+        self._thread = None
+
+    def record(self, stream, values, recorded_at=None, robot_id=DEFAULT_ROBOT_ID):
+        """
+        Buffer one sample. `values` is either a model instance / dict
+        carrying the stream fields or a sequence in field order.
+        """
+        fields = STREAM_FIELDS[stream]
+        if isinstance(values, dict):
+            row = [float(values.get(f) or 0.0) for f in fields]
+        elif hasattr(values, fields[0]):
+            row = [float(getattr(values, f) or 0.0) for f in fields]
+        else:
+            row = [float(v) for v in values]
+
+        ts = _to_epoch(recorded_at)
+        ready = []
+        self._start()
+        with self._lock:
+            key = (robot_id, stream)
+            span = self._spans.get(key)
+            if span and max(span[1], ts) - min(span[0], ts) > self.chunk_seconds:
+                ready.append(self._pop(key))
+                span = None
+            if span is None:
+                span = self._spans[key] = [ts, ts, time.monotonic()]
+            span[0], span[1] = min(span[0], ts), max(span[1], ts)
+            stamps, rows = self._buffers.setdefault(key, ([], []))
+            stamps.append(ts)
+            rows.append(row)
+            if len(stamps) >= self.chunk_size:
+                ready.append(self._pop(key))
+
+        for stamps, rows in ready:
+            self._write_chunk(stream, stamps, rows, robot_id=robot_id)
+
+    def flush(self, stream=None, older_than=None):
+        """
+        Write the buffered blocks of `stream` (all streams by default);
+        with `older_than`, only those opened at least that many seconds ago.
+        """
+        with self._lock:
+            opened_before = time.monotonic() - (older_than or 0)
+            keys = [
+                key for key in self._buffers
+                if (stream is None or key[1] == stream)
+                and (older_than is None or self._spans[key][2] <= opened_before)
+            ]
+            pending = [(key, self._pop(key)) for key in keys]
+
+        for (robot_id, name), (stamps, rows) in pending:
+            self._write_chunk(name, stamps, rows, robot_id=robot_id)
+
+    def _pop(self, key):
+        self._spans.pop(key, None)
+        return self._buffers.pop(key)
+
+    def _start(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="telemetry-history", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.chunk_seconds)
+            try:
+                self.flush(older_than=self.chunk_seconds)
+            except Exception as e:
+                logger.exception(f"Telemetry history flush failed: {e}")
+            finally:
+                close_old_connections()
+
+    def _write_chunk(self, stream, stamps, rows, robot_id=DEFAULT_ROBOT_ID):
+        from .models import TelemetryChunk
+
+        if len(stamps) == 0:
+            return None
+        ts = np.asarray(stamps, dtype=np.float64)
+        values = np.asarray(rows, dtype="<f4")
+        base = ts.min()
+        if ts.max() - base > MAX_CHUNK_SPAN:
+            # split rather than let the offsets wrap
+            order = np.argsort(ts, kind="stable")
+            ts, values = ts[order], values[order]
+            split = int(np.searchsorted(ts, base + MAX_CHUNK_SPAN, side="right"))
+            self._write_chunk(stream, ts[:split], values[:split], robot_id=robot_id)
+            return self._write_chunk(stream, ts[split:], values[split:], robot_id=robot_id)
+        offsets = np.round((ts - base) * 1000.0).astype("<i4")
+        try:
+            return TelemetryChunk.objects.create(
+                stream=stream,
+                robot_id=robot_id,
+                started_at=_from_epoch(base),
+                ended_at=_from_epoch(ts.max()),
+                sample_count=len(stamps),
+                offsets=offsets.tobytes(),
+                values=values.tobytes(),
+            )
+        except Exception as e:
+            logger.exception(f"Failed to write telemetry chunk for {stream}: {e}")
+            return None
+
+    def _pending(self, stream, robot_id):
+        with self._lock:
+            stamps, rows = self._buffers.get((robot_id, stream), ([], []))
+            return list(stamps), list(rows)
+
+    def load(self, stream, start, end, robot_id=DEFAULT_ROBOT_ID):
+        """
+        Return (timestamps, values) for samples in [start, end], sorted by
+        time. timestamps are epoch seconds (float64), values float32 (n x fields).
+        """
+        from .models import TelemetryChunk
+
+        width = len(STREAM_FIELDS[stream])
+        start_ts, end_ts = _to_epoch(start), _to_epoch(end)
+
+        stamp_parts, value_parts = [], []
+        chunks = (
+            TelemetryChunk.objects
+            .filter(robot_id=robot_id, stream=stream, started_at__lte=_from_epoch(end_ts), ended_at__gte=_from_epoch(start_ts))
+            .order_by("started_at")
+            .values_list("started_at", "offsets", "values")
+        )
+        for started_at, offsets, values in chunks:
+            offsets = np.frombuffer(bytes(offsets), dtype="<i4")
+            stamp_parts.append(started_at.timestamp() + offsets.astype(np.float64) / 1000.0)
+            value_parts.append(np.frombuffer(bytes(values), dtype="<f4").reshape(-1, width))
+
+        stamps, rows = self._pending(stream, robot_id)
+        if stamps:
+            stamp_parts.append(np.asarray(stamps, dtype=np.float64))
+            value_parts.append(np.asarray(rows, dtype=np.float32).reshape(-1, width))
+
+        if not stamp_parts:
+            return np.empty(0, dtype=np.float64), np.empty((0, width), dtype=np.float32)
+
+        ts = np.concatenate(stamp_parts)
+        vals = np.concatenate(value_parts)
+        order = np.argsort(ts, kind="stable")
+        ts, vals = ts[order], vals[order]
+        mask = (ts >= start_ts) & (ts <= end_ts)
+        return ts[mask], vals[mask]
+
+    def query(self, stream, start, end, bucket_seconds=None, robot_id=DEFAULT_ROBOT_ID):
+        """
+        Windowed range query. Without `bucket_seconds` the raw samples are
+        returned; with it, samples are reduced to min/max/mean per bucket.
+        """
+        fields = STREAM_FIELDS[stream]
+        ts, vals = self.load(stream, start, end, robot_id=robot_id)
+
+        if not bucket_seconds:
+            return {
+                "stream": stream,
+                "count": int(ts.size),
+                "timestamps": [_from_epoch(t).isoformat() for t in ts],
+                "values": {f: vals[:, i].tolist() for i, f in enumerate(fields)},
+            }
+
+        start_ts = _to_epoch(start)
+        if ts.size == 0:
+            return {"stream": stream, "bucket_seconds": bucket_seconds, "timestamps": [], "count": [], "values": {}}
+
+        bucket_ids = np.floor((ts - start_ts) / float(bucket_seconds)).astype(np.int64)
+        bucket_keys, first_idx, counts = np.unique(bucket_ids, return_index=True, return_counts=True)
+
+        mins = np.minimum.reduceat(vals, first_idx, axis=0)
+        maxs = np.maximum.reduceat(vals, first_idx, axis=0)
+        means = np.add.reduceat(vals.astype(np.float64), first_idx, axis=0) / counts[:, None]
+
+        return {
+            "stream": stream,
+            "bucket_seconds": bucket_seconds,
+            "timestamps": [_from_epoch(start_ts + k * bucket_seconds).isoformat() for k in bucket_keys],
+            "count": counts.tolist(),
+            "values": {
+                f: {
+                    "min": mins[:, i].tolist(),
+                    "max": maxs[:, i].tolist(),
+                    "mean": means[:, i].tolist(),
+                }
+                for i, f in enumerate(fields)
+            },
+        }
+
+
+history = TelemetryHistory()
+atexit.register(history.flush)
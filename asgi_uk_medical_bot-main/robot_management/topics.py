@@ -0,0 +1,209 @@
+from .encoding import dumps
+from .robots import DEFAULT_ROBOT_ID, robot_group
+from .telemetry import FRAME_GROUP, FRAME_MESSAGE
+
+
+def _help_payload(data):
+    return f"Immediate attention required at {data.get('bed')} in {data.get('room')}"
+
+
+def _notification_payload(data):
+    return {"icon": data.get("icon"), "notification": data.get("notification")}
+
+
+def _apparatus_payload(data):
+    return {"apparatus": data.get("data")}
+
+
+def _passthrough_payload(data):
+    return data
+
+
+# topic name -> channel layer group, event type and how to read/build it.
+#   payload_key    event key carrying the payload (default "payload")
+#   frame_key      section of telemetry frame messages to forward
+#   frame_refresh  forward frame sections as a plain True refresh signal
+#   client_payload builds the payload when a client publishes on the topic
+#                  (topics without it are server-to-client only)
+#   drop           "oldest": a slow client loses the oldest queued frames
+#                  of this topic; default is never to drop (alerts)
+#   snapshot       retain the last payload and send it to new subscribers.
+#                  Only for idempotent state: never alerts or commands
+#                  (round dispatch, apparatus, arm moves), which a client
+#                  or robot reconnecting would act on a second time
+#   per_robot      one group per robot (see robots.robot_group); subscribers
+#                  pick the robot with ?robot_id=
+TOPICS = {
+    "slot": {"group": "slot_group", "message": "slot_message", "per_robot": True},
+    "help": {"group": "help_group", "message": "help_message", "client_payload": _help_payload},
+    "notification": {
+        "group": "notification_group",
+        "message": "notification_message",
+        "client_payload": _notification_payload,
+    },
+    "apparatus": {
+        "group": "apparatus_value_group",
+        "message": "apparatus_value_message",
+        "client_payload": _apparatus_payload,
+    },
+    "scheduler": {"group": "scheduler_value_group", "message": "scheduler_value_message", "per_robot": True},
+    "emergency": {
+        "group": "emergency_value_group",
+        "message": "emergency_value_message",
+        "snapshot": True,
+        "per_robot": True,
+    },
+    "robot_distance_accuracy": {
+        "group": "robot_entry_exit_acc_dis_value_group",
+        "message": "robot_entry_exit_acc_dis_value_message",
+        "client_payload": _passthrough_payload,
+        "per_robot": True,
+    },
+    "arm_endpose": {
+        "group": "arm_endpose_value_group",
+        "message": "arm_endpose_value_message",
+        "frame_key": "arm_endpose",
+        "drop": "oldest",
+        "snapshot": True,
+        "per_robot": True,
+    },
+    "joint_velocity": {
+        "group": "joint_velocity_value_group",
+        "message": "joint_velocity_value_message",
+        "frame_key": "joint_velocity",
+        "drop": "oldest",
+        "snapshot": True,
+        "per_robot": True,
+    },
+    "joint_effort": {
+        "group": "joint_effort_value_group",
+        "message": "joint_effort_value_message",
+        "frame_key": "joint_effort",
+        "drop": "oldest",
+        "snapshot": True,
+        "per_robot": True,
+    },
+    "joint_position": {
+        "group": "joint_position_value_group",
+        "message": "joint_position_value_message",
+        "frame_key": "joint_position",
+        "drop": "oldest",
+        "snapshot": True,
+        "per_robot": True,
+    },
+    "joint_heat": {
+        "group": "joint_heat_group",
+        "message": "joint_heat_message",
+        "frame_key": "joint_heat",
+        "drop": "oldest",
+        "snapshot": True,
+        "per_robot": True,
+    },
+    "refresh_arm_data": {
+        "group": "refresh_arm_data_value_group",
+        "message": "refresh_arm_data_value_message",
+        "frame_key": "arm_status",
+        "frame_refresh": True,
+        "drop": "oldest",
+        "per_robot": True,
+    },
+    "refresh_joint_data": {
+        "group": "refresh_joint_data_value_group",
+        "message": "refresh_joint_data_value_message",
+        "drop": "oldest",
+        "per_robot": True,
+    },
+    "telemetry_frame": {
+        "group": FRAME_GROUP,
+        "message": FRAME_MESSAGE,
+        "drop": "oldest",
+        "snapshot": True,
+        "per_robot": True,
+    },
+    "arm_moment": {
+        "group": "robot_movement",
+        "message": "joint_update",
+        "payload_key": "joints",
+        "drop": "oldest",
+        "per_robot": True,
+    },
+}
+
+# event type -> topic names it is delivered to
+EVENT_TOPICS = {}
+for _name, _spec in TOPICS.items():
+    EVENT_TOPICS.setdefault(_spec["message"], []).append(_name)
+    if _spec.get("frame_key"):
+        EVENT_TOPICS.setdefault(FRAME_MESSAGE, []).append(_name)
+
+
+def topic_groups(name, robot_id=DEFAULT_ROBOT_ID):
+    """Channel layer groups a subscriber of `name` (for `robot_id`) has to join."""
+    spec = TOPICS[name]
+    groups = [spec["group"]]
+    if spec.get("frame_key"):
+        groups.append(FRAME_GROUP)
+    if spec.get("per_robot"):
+        groups = [robot_group(group, robot_id) for group in groups]
+    return groups
+
+
+def frame_json(sections_json):
+    """JSON text of a whole telemetry frame payload from its encoded sections."""
+    return "{" + ", ".join(f"{dumps(key)}: {value}" for key, value in sections_json.items()) + "}"
+
+
+def topic_payload(name, event):
+    """
+    Payload of `event` for topic `name` as (payload, changed_fields,
+    payload_json), or None when the event carries nothing for that topic.
+    Events sent through encode_event carry only the encoded payload, so
+    for them payload is None and payload_json the JSON text; consumers
+    decode it only when they need the data itself.
+    """
+    spec = TOPICS[name]
+    if event.get("type") == FRAME_MESSAGE:
+        sections_json = event.get("sections_json")
+        if spec.get("frame_key"):
+            key = spec["frame_key"]
+            changed = (event.get("changed") or {}).get(key)
+            if sections_json is not None:
+                section, section_json = None, sections_json.get(key)
+                present = section_json is not None
+            else:
+                section, section_json = (event.get("payload") or {}).get(key), None
+                present = section is not None
+            if not present:
+                return None
+            if spec.get("frame_refresh"):
+                return True, changed, "true"
+            return section, changed, section_json
+        if sections_json is not None:
+            return None, None, frame_json(sections_json)
+    changed = event.get("changed")
+    return (
+        event.get(spec.get("payload_key", "payload")),
+        changed if isinstance(changed, list) else None,
+        event.get("payload_json"),
+    )
+
+
+def encode_event(event):
+    """
+    Replace the event payload by its JSON text ("payload_json"; telemetry
+    frames get one "sections_json" entry per section instead) so it is
+    encoded once, sent over the channel layer once, and spliced by the
+    consumers into their frames as-is.
+    """
+    names = EVENT_TOPICS.get(event.get("type"))
+    if not names:
+        return event
+    key = TOPICS[names[0]].get("payload_key", "payload")
+    if key not in event:
+        return event
+    encoded = {k: v for k, v in event.items() if k != key}
+    if event["type"] == FRAME_MESSAGE and isinstance(event[key], dict):
+        encoded["sections_json"] = {section: dumps(value) for section, value in event[key].items()}
+    else:
+        encoded["payload_json"] = dumps(event[key])
+    return encoded
@@ -49,10 +49,17 @@ urlpatterns = [
     path("map/active/", get_active_map, name="get_active_map"),
     path("maps/activate-map/<int:map_id>/", activate_map, name="activate_map"),
     path("maps/<int:pk>/delete/", delete_map, name="delete map"),
+    path("maps/<int:map_id>/tiles/<slug:version>/<int:z>/<int:x>/<int:y>.png", map_tile, name="map tile"),
+    path("path-costs/", path_costs, name="path costs"),
 
     path("create-update-joint-heat/", create_or_update_joint_heat, name="create or update joint heat"),
     path("get-joint-heat/", get_joint_heat, name="get joint heat"),
 
     path("transfer-slot-reached-pos/", slot_reached_pos, name="transfer slot reached position"),
 
+    path("telemetry/frame/", ingest_telemetry_frame, name="ingest telemetry frame"),
+    path("telemetry/history/<str:stream>/", telemetry_history, name="telemetry history"),
+    path("battery/history/", battery_history, name="battery history"),
+    path("status-changes/", status_change_events, name="status change events"),
+
 ]
\ No newline at end of file
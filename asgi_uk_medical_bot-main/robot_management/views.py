@@ -1,26 +1,33 @@
 import struct
 import logging
+from datetime import timedelta
 from io import BytesIO
 
 import numpy as np
 from PIL import Image
 
 from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
 from django.db.models import Q
+from django.http import FileResponse, JsonResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.views.decorators.http import etag, require_safe
 
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, parser_classes, permission_classes
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
-from rest_framework import status
+from rest_framework import status, serializers
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.parsers import FormParser, JSONParser
 
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
 
 from mainapp.models import Patient, AlertHistory
 from mainapp.serializers import PatientSerializer, AlertHistorySerializer
 from bed_data.models import RoomPositionModel, SlotDataModel, RoomDataModel, BedDataModel
 from bed_data.serializer import RoomPositionModelSerializer, SlotCoordinatesSerializer
+from utils.uploads import ChecksumMultiPartParser, file_checksum
 
 from .models import (
     RobotTelemetry,
@@ -33,7 +40,9 @@ from .models import (
     FailedScheduledModel,
     BatteryStatus,
     MapManagement,
-    JointHeat
+    JointHeat,
+    StatusChangeEvent,
+    BatteryRollup,
 )
 from .serializers import (
     RobotTelemetryLastSlotSerializer,
@@ -52,8 +61,30 @@ from .serializers import (
     RobotTelemetryLastRobotRoomOpeningSerializer,
     BatteryStatusSerializer,
     MapManagementSerializer,
-    JointHeatSerializer
+    JointHeatSerializer,
+    StatusChangeEventSerializer,
 )
+from .telemetry import (
+    get_single_instance,
+    ingest_frame_data,
+    save_robot_telemetry,
+    update_stream,
+    update_arm_status,
+    update_joint_status,
+    update_battery_status,
+    update_robot_emergency,
+    update_robot_telemetry,
+)
+from . import outbox
+from .battery import RESOLUTIONS, forecaster
+from .pathing import PathCostsPending, engine as path_engine
+from .recorder import recorder
+from .stcm import queue_rasterize
+from .tiles import delete_tiles, queue_tiles, tile_name
+from .robots import robot_group, with_robot_id
+from .state import robot_state
+from .timeseries import history, BATTERY_FIELDS, STREAM_FIELDS
+from .writebehind import buffer
 
 from django.shortcuts import get_object_or_404
 
@@ -69,6 +100,27 @@ class FailedSchedulesPagination(PageNumberPagination):
     page_size_query_param = "page_size"
     max_page_size = 100
 
+
+def query_datetime(request, name, default=None):
+    """
+    ISO 8601 datetime query param `name` as an aware datetime; values
+    without an offset are taken in the current time zone. Returns
+    `default` when the param is absent and raises ValidationError when it
+    cannot be parsed.
+    """
+    value = request.query_params.get(name)
+    if not value:
+        return default
+    try:
+        parsed = parse_datetime(value)
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        raise serializers.ValidationError({name: [f"'{value}' is not an ISO 8601 datetime."]})
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def get_patient_data(request, patient_id):
@@ -325,9 +377,15 @@ def update_alert_reason(request, pk):
 
 @api_view(['GET'])
 @permission_classes([AllowAny])
-def fetch_latest_slot(request):
+@with_robot_id
+def fetch_latest_slot(request, robot_id):
     try:
-        instance = RobotTelemetry.objects.get(pk=1)
+        instance = robot_state.get(robot_id)
+        if not instance:
+            return Response({
+                "status": "error",
+                "message": "No RobotTelemetry found.",
+            }, status=status.HTTP_404_NOT_FOUND)
 
         serializer = RobotTelemetryLastSlotSerializer(instance)
 
@@ -370,9 +428,10 @@ def fetch_latest_slot(request):
 
 @api_view(['GET'])
 @permission_classes([AllowAny])
-def robot_telemetry_all(request):
+@with_robot_id
+def robot_telemetry_all(request, robot_id):
     try:
-        instances = RobotTelemetry.objects.all()
+        instances = RobotTelemetry.objects.filter(robot_id=robot_id)
         if not instances.exists():  # Check if queryset is empty
             return Response({
                 "status": "error",
@@ -397,6 +456,7 @@ def robot_telemetry_all(request):
     
 @api_view(["POST"])
 @permission_classes([AllowAny])
+@parser_classes([ChecksumMultiPartParser])
 def save_stcm_map(request):
     try:
         stcm_file = request.FILES.get("stcm_file")
@@ -406,16 +466,19 @@ def save_stcm_map(request):
                 status=status.HTTP_400_BAD_REQUEST,
             )
         
-        instance = RobotTelemetry.objects.order_by('-id').first()
+        instance = MapManagement.objects.filter(is_active=True).first()
         if not instance:
             return Response(
-                {"status": "error", "message": "No RobotTelemetry record found to attach the file."},
+                {"status": "error", "message": "No active map found to attach the file."},
                 status=status.HTTP_404_NOT_FOUND,
             )
 
         try:
             instance.robot_map_file = stcm_file
-            instance.save()
+            instance.checksum = file_checksum(stcm_file)
+            instance.save(update_fields=["robot_map_file", "checksum", "updated_at"])
+            queue_rasterize(instance.pk)
+            queue_tiles(instance.pk)
             # ✅ Success response added here
             return Response(
                 {"status": "success", "message": "STCM file uploaded successfully."},
@@ -436,46 +499,24 @@ def save_stcm_map(request):
             "data": str(e)
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-# ---- Helper to fetch pk=1 ----
-def get_single_instance(model):
-    obj, _ = model.objects.get_or_create(pk=1)  # ensures row exists
-    return obj
-
-
 # ---- ArmEndpose ----
 @api_view(["GET", "PUT"])
 @permission_classes([AllowAny])
-def arm_endpose(request):
+@with_robot_id
+def arm_endpose(request, robot_id):
     try:
-        instance = get_single_instance(ArmEndpose)
-
         if request.method == "GET":
+            instance = get_single_instance(ArmEndpose, robot_id)
             serializer = ArmEndposeSerializer(instance)
             return Response({"status": "success", "data": serializer.data})
 
         elif request.method == "PUT":
-            serializer = ArmEndposeSerializer(instance, data=request.data, partial=True)
-            if serializer.is_valid():
-                obj = serializer.save()
-
-                channel_layer = get_channel_layer()
-                async_to_sync(channel_layer.group_send)(
-                    "arm_endpose_value_group",
-                    {
-                        "type": "arm_endpose_value_message",
-                        "payload": {
-                            "x": obj.x,
-                            "y": obj.y,
-                            "z": obj.z,
-                            "rx": obj.rx,
-                            "ry": obj.ry,
-                            "rz": obj.rz,
-                        }
-                    },
-                )
-
-                return Response({"status": "success", "message": "Updated", "data": serializer.data})
-            return Response({"status": "error", "errors": serializer.errors}, status=400)
+            recorder.record("arm_endpose", request.data, robot_id)
+            try:
+                data = update_stream("arm_endpose", request.data, robot_id)
+            except serializers.ValidationError as e:
+                return Response({"status": "error", "errors": e.detail}, status=400)
+            return Response({"status": "success", "message": "Updated", "data": data})
 
     except Exception as e:
         logger.exception(f"ArmEndpose error: {e}")
@@ -485,37 +526,21 @@ def arm_endpose(request):
 # ---- JointVelocity ----
 @api_view(["GET", "PUT"])
 @permission_classes([AllowAny])
-def joint_velocity(request):
+@with_robot_id
+def joint_velocity(request, robot_id):
     try:
-        instance = get_single_instance(JointVelocity)
-
         if request.method == "GET":
+            instance = get_single_instance(JointVelocity, robot_id)
             serializer = JointVelocitySerializer(instance)
             return Response({"status": "success", "data": serializer.data})
 
         elif request.method == "PUT":
-            serializer = JointVelocitySerializer(instance, data=request.data, partial=True)
-            if serializer.is_valid():
-                obj = serializer.save()
-
-                channel_layer = get_channel_layer()
-                async_to_sync(channel_layer.group_send)(
-                    "joint_velocity_value_group",
-                    {
-                        "type": "joint_velocity_value_message",
-                        "payload": {
-                            "j1": obj.j1,
-                            "j2": obj.j2,
-                            "j3": obj.j3,
-                            "j4": obj.j4,
-                            "j5": obj.j5,
-                            "j6": obj.j6,
-                        }
-                    },
-                )
-
-                return Response({"status": "success", "message": "Updated", "data": serializer.data})
-            return Response({"status": "error", "errors": serializer.errors}, status=400)
+            recorder.record("joint_velocity", request.data, robot_id)
+            try:
+                data = update_stream("joint_velocity", request.data, robot_id)
+            except serializers.ValidationError as e:
+                return Response({"status": "error", "errors": e.detail}, status=400)
+            return Response({"status": "success", "message": "Updated", "data": data})
 
     except Exception as e:
         logger.exception(f"JointVelocity error: {e}")
@@ -525,37 +550,21 @@ def joint_velocity(request):
 # ---- JointEffort ----
 @api_view(["GET", "PUT"])
 @permission_classes([AllowAny])
-def joint_effort(request):
+@with_robot_id
+def joint_effort(request, robot_id):
     try:
-        instance = get_single_instance(JointEffort)
-
         if request.method == "GET":
+            instance = get_single_instance(JointEffort, robot_id)
             serializer = JointEffortSerializer(instance)
             return Response({"status": "success", "data": serializer.data})
 
         elif request.method == "PUT":
-            serializer = JointEffortSerializer(instance, data=request.data, partial=True)
-            if serializer.is_valid():
-                obj = serializer.save()
-
-                channel_layer = get_channel_layer()
-                async_to_sync(channel_layer.group_send)(
-                    "joint_effort_value_group",
-                    {
-                        "type": "joint_effort_value_message",
-                        "payload": {
-                            "j1": obj.j1,
-                            "j2": obj.j2,
-                            "j3": obj.j3,
-                            "j4": obj.j4,
-                            "j5": obj.j5,
-                            "j6": obj.j6,
-                        }
-                    },
-                )
-
-                return Response({"status": "success", "message": "Updated", "data": serializer.data})
-            return Response({"status": "error", "errors": serializer.errors}, status=400)
+            recorder.record("joint_effort", request.data, robot_id)
+            try:
+                data = update_stream("joint_effort", request.data, robot_id)
+            except serializers.ValidationError as e:
+                return Response({"status": "error", "errors": e.detail}, status=400)
+            return Response({"status": "success", "message": "Updated", "data": data})
 
     except Exception as e:
         logger.exception(f"JointEffort error: {e}")
@@ -565,37 +574,21 @@ def joint_effort(request):
 # ---- JointPosition ----
 @api_view(["GET", "PUT"])
 @permission_classes([AllowAny])
-def joint_position(request):
+@with_robot_id
+def joint_position(request, robot_id):
     try:
-        instance = get_single_instance(JointPosition)
-
         if request.method == "GET":
+            instance = get_single_instance(JointPosition, robot_id)
             serializer = JointPositionSerializer(instance)
             return Response({"status": "success", "data": serializer.data})
 
         elif request.method == "PUT":
-            serializer = JointPositionSerializer(instance, data=request.data, partial=True)
-            if serializer.is_valid():
-                obj = serializer.save()
-
-                channel_layer = get_channel_layer()
-                async_to_sync(channel_layer.group_send)(
-                    "joint_position_value_group",
-                    {
-                        "type": "joint_position_value_message",
-                        "payload": {
-                            "j1": obj.j1,
-                            "j2": obj.j2,
-                            "j3": obj.j3,
-                            "j4": obj.j4,
-                            "j5": obj.j5,
-                            "j6": obj.j6,
-                        }
-                    },
-                )
-
-                return Response({"status": "success", "message": "Updated", "data": serializer.data})
-            return Response({"status": "error", "errors": serializer.errors}, status=400)
+            recorder.record("joint_position", request.data, robot_id)
+            try:
+                data = update_stream("joint_position", request.data, robot_id)
+            except serializers.ValidationError as e:
+                return Response({"status": "error", "errors": e.detail}, status=400)
+            return Response({"status": "success", "message": "Updated", "data": data})
 
     except Exception as e:
         logger.exception(f"JointPosition error: {e}")
@@ -603,38 +596,25 @@ def joint_position(request):
     
 @api_view(['POST'])
 @permission_classes([AllowAny])
-def create_or_update_arm_status(request):
+@with_robot_id
+def create_or_update_arm_status(request, robot_id):
     try:
+        recorder.record("arm_status", request.data, robot_id)
         try:
-            instance = ArmStatus.objects.order_by('-id').first()
-        except ArmStatus.DoesNotExist:
-            instance = None
-
-        serializer = ArmStatusSerializer(instance, data=request.data, partial=True)
-        if serializer.is_valid():
-            serializer.save()
-
-            channel_layer = get_channel_layer()
-            async_to_sync(channel_layer.group_send)(
-                "refresh_arm_data_value_group",
-                {
-                    "type": "refresh_arm_data_value_message",
-                    "payload": True
-                },
-            )
-
+            data, created = update_arm_status(request.data, robot_id)
+        except serializers.ValidationError as e:
             return Response(
-                {
-                    "status": "success",
-                    "message": "ArmStatus updated" if instance else "ArmStatus created",
-                    "data": serializer.data,
-                },
-                status=status.HTTP_200_OK,
+                {"status": "error", "errors": e.detail},
+                status=status.HTTP_400_BAD_REQUEST,
             )
 
         return Response(
-            {"status": "error", "errors": serializer.errors},
-            status=status.HTTP_400_BAD_REQUEST,
+            {
+                "status": "success",
+                "message": "ArmStatus created" if created else "ArmStatus updated",
+                "data": data,
+            },
+            status=status.HTTP_200_OK,
         )
 
     except Exception as e:
@@ -644,11 +624,31 @@ def create_or_update_arm_status(request):
             status=status.HTTP_500_INTERNAL_SERVER_ERROR,
         )
     
+def _last_status_changes(instance, fields_param):
+    """
+    Latest logged transition per tracked field of `instance`.
+    `fields_param` is "all" or a comma separated list of field names.
+    """
+    if fields_param == "all":
+        fields = instance.tracked_fields
+    else:
+        fields = [f for f in fields_param.split(",") if f in instance.tracked_fields]
+
+    changes = {}
+    events = StatusChangeEvent.objects.filter(
+        robot_id=instance.robot_id, model=instance._meta.model_name, object_id=instance.pk
+    )
+    for field in fields:
+        event = events.filter(field=field).order_by("-changed_at", "-id").first()
+        changes[field] = StatusChangeEventSerializer(event).data if event else None
+    return changes
+
 @api_view(['GET'])
 @permission_classes([AllowAny])
-def get_arm_status(request):
+@with_robot_id
+def get_arm_status(request, robot_id):
     try:
-        instance = ArmStatus.objects.order_by('-id').first()
+        instance = ArmStatus.objects.filter(robot_id=robot_id).order_by('-id').first()
         if not instance:
             return Response(
                 {"status": "error", "message": "No ArmStatus found"},
@@ -656,14 +656,14 @@ def get_arm_status(request):
             )
 
         serializer = ArmStatusSerializer(instance)
-        return Response(
-            {
-                "status": "success",
-                "message": "Latest ArmStatus fetched",
-                "data": serializer.data,
-            },
-            status=status.HTTP_200_OK,
-        )
+        response = {
+            "status": "success",
+            "message": "Latest ArmStatus fetched",
+            "data": serializer.data,
+        }
+        if request.query_params.get("last_changes"):
+            response["last_changes"] = _last_status_changes(instance, request.query_params["last_changes"])
+        return Response(response, status=status.HTTP_200_OK)
 
     except Exception as e:
         logger.exception(f"ArmStatus fetch error: {e}")
@@ -674,39 +674,25 @@ def get_arm_status(request):
     
 @api_view(['POST'])
 @permission_classes([AllowAny])
-def create_or_update_joint_status(request):
+@with_robot_id
+def create_or_update_joint_status(request, robot_id):
     try:
+        recorder.record("joint_status", request.data, robot_id)
         try:
-            joint_num = request.data.get('joint_number')
-            instance = JointStatus.objects.get(joint_number=joint_num)
-        except JointStatus.DoesNotExist:
-            instance = None
-
-        serializer = JointStatusSerializer(instance, data=request.data, partial=True)
-        if serializer.is_valid():
-            serializer.save()
-
-            channel_layer = get_channel_layer()
-            async_to_sync(channel_layer.group_send)(
-                "refresh_joint_data_value_group",
-                {
-                    "type": "refresh_joint_data_value_message",
-                    "payload": True
-                },
-            )
-
+            data, created = update_joint_status(request.data, robot_id)
+        except serializers.ValidationError as e:
             return Response(
-                {
-                    "status": "success",
-                    "message": "JointStatus updated" if instance else "JointStatus created",
-                    "data": serializer.data,
-                },
-                status=status.HTTP_200_OK,
+                {"status": "error", "errors": e.detail},
+                status=status.HTTP_400_BAD_REQUEST,
             )
 
         return Response(
-            {"status": "error", "errors": serializer.errors},
-            status=status.HTTP_400_BAD_REQUEST,
+            {
+                "status": "success",
+                "message": "JointStatus created" if created else "JointStatus updated",
+                "data": data,
+            },
+            status=status.HTTP_200_OK,
         )
 
     except Exception as e:
@@ -718,9 +704,10 @@ def create_or_update_joint_status(request):
     
 @api_view(['GET'])
 @permission_classes([AllowAny])
-def get_joint_status(request):
+@with_robot_id
+def get_joint_status(request, robot_id):
     try:
-        instance = JointStatus.objects.order_by('-id').first()
+        instance = JointStatus.objects.filter(robot_id=robot_id).order_by('-id').first()
         if not instance:
             return Response(
                 {"status": "error", "message": "No JointStatus found"},
@@ -728,14 +715,14 @@ def get_joint_status(request):
             )
 
         serializer = JointStatusSerializer(instance)
-        return Response(
-            {
-                "status": "success",
-                "message": "Latest JointStatus fetched",
-                "data": serializer.data,
-            },
-            status=status.HTTP_200_OK,
-        )
+        response = {
+            "status": "success",
+            "message": "Latest JointStatus fetched",
+            "data": serializer.data,
+        }
+        if request.query_params.get("last_changes"):
+            response["last_changes"] = _last_status_changes(instance, request.query_params["last_changes"])
+        return Response(response, status=status.HTTP_200_OK)
 
     except Exception as e:
         logger.exception(f"ArmStatus fetch error: {e}")
@@ -746,10 +733,11 @@ def get_joint_status(request):
 
 @api_view(['GET', 'PUT'])
 @permission_classes([AllowAny])
-def getup_robot_status(request):
+@with_robot_id
+def getup_robot_status(request, robot_id):
     try:
         # Fetch the latest telemetry record
-        instance = RobotTelemetry.objects.order_by('-id').first()
+        instance = robot_state.get(robot_id)
         if not instance:
             return Response(
                 {"status": "error", "message": "No RobotTelemetry found"},
@@ -762,7 +750,7 @@ def getup_robot_status(request):
                 {
                     "status": "success",
                     "message": "Latest RobotTelemetry status fetched",
-                    "data": serializer.data,
+                    "data": {**serializer.data, "battery_forecast": forecaster.estimate(robot_id)},
                 },
                 status=status.HTTP_200_OK,
             )
@@ -793,10 +781,11 @@ def getup_robot_status(request):
 
 @api_view(['GET', 'PUT'])
 @permission_classes([AllowAny])
-def getup_volume_status(request):
+@with_robot_id
+def getup_volume_status(request, robot_id):
     try:
         # Fetch the latest telemetry record
-        instance = RobotTelemetry.objects.order_by('-id').first()
+        instance = robot_state.get(robot_id)
         if not instance:
             return Response(
                 {"status": "error", "message": "No RobotTelemetry found"},
@@ -840,10 +829,11 @@ def getup_volume_status(request):
     
 @api_view(['GET', 'PUT'])
 @permission_classes([AllowAny])
-def getup_robot_emergency_status(request):
+@with_robot_id
+def getup_robot_emergency_status(request, robot_id):
     try:
         # Fetch the latest telemetry record
-        instance = RobotTelemetry.objects.order_by('-id').first()
+        instance = robot_state.get(robot_id)
         if not instance:
             return Response(
                 {"status": "error", "message": "No RobotTelemetry found"},
@@ -863,41 +853,27 @@ def getup_robot_emergency_status(request):
 
         elif request.method == "PUT":
             robot_emergency = request.data.get("robot_emergency", instance.robot_emergency)
-            instance.robot_emergency = robot_emergency
-
-            serializer = RobotTelemetryLastRobotEmergencySerializer(
-                instance, data={"robot_emergency": robot_emergency}, partial=True
-            )
-            if serializer.is_valid():
-                serializer.save()
-
-                channel_layer = get_channel_layer()
-                async_to_sync(channel_layer.group_send)(
-                    "emergency_value_group",
-                    {
-                        "type": "emergency_value_message",
-                        "payload": {
-                            "emergency": instance.robot_emergency
-                        }
-                    },
-                )
-
-                if instance.robot_emergency is True:
-                    emergency_state = "pressed"
-                else:
-                    emergency_state = "released"
-                
+            recorder.record("robot_emergency", {"robot_emergency": robot_emergency}, robot_id)
+            try:
+                data = update_robot_emergency(robot_emergency, instance)
+            except serializers.ValidationError as e:
                 return Response(
-                    {
-                        "status": "success",
-                        "message": f"Robot emergency button {emergency_state}",
-                        "data": serializer.data,
-                    },
-                    status=status.HTTP_200_OK,
+                    {"status": "error", "errors": e.detail},
+                    status=status.HTTP_400_BAD_REQUEST,
                 )
+
+            if instance.robot_emergency is True:
+                emergency_state = "pressed"
+            else:
+                emergency_state = "released"
+
             return Response(
-                {"status": "error", "errors": serializer.errors},
-                status=status.HTTP_400_BAD_REQUEST,
+                {
+                    "status": "success",
+                    "message": f"Robot emergency button {emergency_state}",
+                    "data": data,
+                },
+                status=status.HTTP_200_OK,
             )
 
     except Exception as e:
@@ -909,25 +885,25 @@ def getup_robot_emergency_status(request):
     
 @api_view(['POST'])
 @permission_classes([AllowAny])
-def create_or_update_robot_telemetry(request):
+@with_robot_id
+def create_or_update_robot_telemetry(request, robot_id):
     try:
-        instance = RobotTelemetry.objects.order_by('-id').first()
-
-        serializer = RobotTelemetrySerializer(instance, data=request.data, partial=True)
-        if serializer.is_valid():
-            serializer.save()
+        recorder.record("robot_telemetry", request.data, robot_id)
+        try:
+            data, created = update_robot_telemetry(request.data, robot_id)
+        except serializers.ValidationError as e:
             return Response(
-                {
-                    "status": "success",
-                    "message": "RobotTelemetry updated" if instance else "RobotTelemetry created",
-                    "data": serializer.data,
-                },
-                status=status.HTTP_200_OK,
+                {"status": "error", "errors": e.detail},
+                status=status.HTTP_400_BAD_REQUEST,
             )
 
         return Response(
-            {"status": "error", "errors": serializer.errors},
-            status=status.HTTP_400_BAD_REQUEST,
+            {
+                "status": "success",
+                "message": "RobotTelemetry created" if created else "RobotTelemetry updated",
+                "data": data,
+            },
+            status=status.HTTP_200_OK,
         )
 
     except Exception as e:
@@ -1004,13 +980,14 @@ def failed_scheduled_mark_respond(request, pk):
 
 @api_view(['PUT'])
 @permission_classes([AllowAny])
-def update_latest_room(request):
+@with_robot_id
+def update_latest_room(request, robot_id):
     try:
-        robot_telemetry = RobotTelemetry.objects.order_by('-id').first()
+        robot_telemetry = robot_state.get(robot_id)
         serializer = RobotTelemetryLastRobotRoomOpeningSerializer(robot_telemetry, data=request.data, partial=True)
         
         if serializer.is_valid():
-            serializer.save()
+            save_robot_telemetry(serializer, robot_id)
             return Response({
                 "status": "success",
                 "message": "Room status updated successfully.",
@@ -1032,33 +1009,27 @@ def update_latest_room(request):
     
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
-def create_or_update_battery_status(request):
+@with_robot_id
+def create_or_update_battery_status(request, robot_id):
     """
     Create or update the latest BatteryStatus record.
     If a record exists, updates it; otherwise, creates a new one.
     """
     try:
-        instance = BatteryStatus.objects.order_by('-id').first()
-        if instance:
-            # Update existing record
-            serializer = BatteryStatusSerializer(instance, data=request.data, partial=True)
-            action_message = "BatteryStatus updated"
-        else:
-            # Create new record
-            serializer = BatteryStatusSerializer(data=request.data)
-            action_message = "BatteryStatus created"
-        if serializer.is_valid():
-            serializer.save()
+        recorder.record("battery_status", request.data, robot_id)
+        try:
+            data, created = update_battery_status(request.data, robot_id)
+        except serializers.ValidationError as e:
             return Response({
-                    "status": "success",
-                    "message": action_message,
-                    "data": serializer.data,
-                }, status=status.HTTP_200_OK,)
+                    "status": "error",
+                    "message": "Validation failed.",
+                    "errors": e.detail,
+                }, status=status.HTTP_400_BAD_REQUEST,)
         return Response({
-                "status": "error",
-                "message": "Validation failed.",
-                "errors": serializer.errors,
-            }, status=status.HTTP_400_BAD_REQUEST,)
+                "status": "success",
+                "message": "BatteryStatus created" if created else "BatteryStatus updated",
+                "data": data,
+            }, status=status.HTTP_200_OK,)
     except Exception as e:
         logger.exception(f"BatteryStatus error: {e}")
         return Response({
@@ -1069,6 +1040,7 @@ def create_or_update_battery_status(request):
     
 @api_view(['GET','POST'])
 @permission_classes([AllowAny])
+@parser_classes([ChecksumMultiPartParser, FormParser, JSONParser])
 def map_management_list_getsert(request):
     try:
         if request.method == 'GET':
@@ -1084,13 +1056,12 @@ def map_management_list_getsert(request):
             serializer = MapManagementSerializer(data=request.data)
             MapManagement.objects.filter(is_active=True).update(is_active=False)
             if serializer.is_valid():
-                instance= serializer.save(is_active=True)
-                # stcm_file = request.FILES.get("robot_map_file")
-
-                # if stcm_file:
-                #     ok = save_stcm_image_to_db(stcm_file, instance)
-                #     if not ok:
-                #         logger.warning("STCM file processing failed.")
+                map_file = serializer.validated_data.get("robot_map_file")
+                instance= serializer.save(is_active=True, checksum=file_checksum(map_file) if map_file else "")
+                if instance.robot_map_file:
+                    # converted to robot_map_image_file and tiles by Celery tasks
+                    queue_rasterize(instance.pk)
+                    queue_tiles(instance.pk)
                 return Response({
                     "status": "success",
                     "message": "Map created successfully.",
@@ -1138,10 +1109,11 @@ def get_active_map(request):
     
 @api_view(['PUT'])
 @permission_classes([IsAuthenticated])
-def activate_map(request, map_id):
+@with_robot_id
+def activate_map(request, map_id, robot_id):
     try:
 
-        robot_telemetry = RobotTelemetry.objects.order_by('-id').first()
+        robot_telemetry = robot_state.get(robot_id)
         if robot_telemetry.robot_in_dock == False:
             return Response({
                 "status": "error",
@@ -1156,6 +1128,9 @@ def activate_map(request, map_id):
         # Activate the selected map
         map_to_activate.is_active = True
         map_to_activate.save()
+        # no-op when the tiles of this map version already exist
+        queue_tiles(map_to_activate.pk)
+        path_engine.queue()
 
         serializer = MapManagementSerializer(map_to_activate, context={"request": request})
         return Response({
@@ -1179,6 +1154,7 @@ def delete_map(request, pk):
         map_instance = get_object_or_404(MapManagement, pk=pk)
         map_name = map_instance.map_name
         map_instance.delete()
+        delete_tiles(pk)
         return Response({
             "status": "success",
             "message": f"Map '{map_name}' deleted successfully."
@@ -1191,131 +1167,88 @@ def delete_map(request, pk):
             "data": str(e)
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-# def save_stcm_image_to_db(stcm_file, instance):
-#     print("🔵 [save_stcm_image_to_db] called")
-#     logger.debug("save_stcm_image_to_db triggered")
-#     """
-#     Upload STCM file, convert to PNG, and save into RobotTelemetry.robot_image_file.
-#     Falls back to auto-detected grid size if header and payload mismatch.
-#     """
-#     try:
-#         if not stcm_file:
-#             return Response(
-#                 {"status": "error", "message": "STCM file is required."},
-#                 status=status.HTTP_400_BAD_REQUEST,
-#             )
-
-#         # Read file content
-#         data = stcm_file.read()
-
-#         # Parse header (first 20 bytes)
-#         try:
-#             height, width, origin_x, origin_y, resolution = struct.unpack(
-#                 "<iiiii", data[:20]
-#             )
-#         except Exception:
-#             return Response(
-#                 {"status": "error", "message": "Invalid STCM file format."},
-#                 status=status.HTTP_400_BAD_REQUEST,
-#             )
-
-#         logger.debug(
-#             f"STCM header -> height={height}, width={width}, "
-#             f"origin_x={origin_x}, origin_y={origin_y}, resolution={resolution}"
-#         )
-
-#         # Extract occupancy grid data
-#         grid_data = data[20:]
-#         payload_size = len(grid_data)
-#         expected_size = height * width
-
-#         logger.debug(f"Payload bytes={payload_size}, expected={expected_size}")
-
-#         grid = None
-#         # Case 1: payload matches header -> safe reshape
-#         if payload_size == expected_size:
-#             print("case 1")
-#             grid = np.frombuffer(grid_data, dtype=np.int8).reshape((height, width))
-#             logger.debug("Grid parsed using header values.")
-#         else:
-#             print("case 2")
-#             # Case 2: fallback -> auto-detect square grid
-#             side = int(np.sqrt(payload_size))
-#             usable = side * side
-#             grid = np.frombuffer(grid_data[:usable], dtype=np.int8).reshape((side, side))
-#             logger.warning(
-#                 f"Header mismatch (expected {expected_size}, got {payload_size}). "
-#                 f"Falling back to {side}x{side} grid."
-#             )
-
-#         # Map values to RGB
-#         img_array = np.zeros((grid.shape[0], grid.shape[1], 3), dtype=np.uint8)
-#         img_array[grid == 0] = [255, 255, 255]   # free = white
-#         img_array[grid == 1] = [0, 0, 0]         # occupied = black
-#         img_array[grid == -1] = [128, 128, 128]  # unknown = gray
-
-#         # Create PNG image
-#         img = Image.fromarray(img_array)
-
-#         # Save into memory
-#         buffer = BytesIO()
-#         img.save(buffer, format="PNG")
-#         buffer.seek(0)
-
-#         file_name = f"map_{instance.pk}.png"
-#         instance.robot_map_image_file.save(file_name, ContentFile(buffer.read()), save=True)
-
-#         # Verify
-#         if instance.robot_map_image_file and instance.robot_map_image_file:
-#             print(f"Image saved successfully: {instance.robot_map_image_file}")
-#             logger.debug(f"Image saved successfully: {instance.robot_map_image_file}")
-#         else:
-#             print("Image save failed!")
-#             logger.debug("Image save failed for instance ID=%s", instance.pk)
-
-#         logger.debug(f"STCM image saved successfully for MapManagement id={instance.pk}")
-#         print(f"Image saved successfully for instance ID={instance.pk}")
-#         return True
+def _tile_etag(request, map_id, version, z, x, y):
+    # tiles of a version never change, so the URL parts are a strong ETag
+    return f"{version}-{z}-{x}-{y}"
 
-#     except Exception as e:
-#         logger.exception(f"Failed to process STCM file: {e}")
-#         print(f"Exception in save_stcm_image_to_db: {e}")
-#         raise ValueError(f"Failed to process STCM file: {e}")
+
+@require_safe
+@etag(_tile_etag)
+def map_tile(request, map_id, version, z, x, y):
+    """
+    One PNG tile of a map's tile pyramid (see tiles.py). The version comes
+    from MapManagement.tiles_version, so tiles are cached as immutable and
+    revalidated with their ETag (304 Not Modified).
+    """
+    name = tile_name(map_id, version, z, x, y)
+    if not default_storage.exists(name):
+        return JsonResponse({"status": "error", "message": "Tile not found."}, status=404)
+    response = FileResponse(default_storage.open(name), content_type="image/png")
+    response["Cache-Control"] = "public, max-age=31536000, immutable"
+    return response
+
+# ---- Path Costs ----
+@api_view(["GET"])
+@permission_classes([AllowAny])
+def path_costs(request):
+    """
+    Shortest path lengths in metres over the active map between every room
+    entry/exit point and bed slot (see pathing.py). They are built in the
+    background after the map or a position changes; meanwhile the previous
+    costs are served with "stale": true, or 202 when there are none yet.
+    """
+    try:
+        try:
+            costs = path_engine.costs()
+        except PathCostsPending:
+            return Response({
+                "status": "pending",
+                "message": "Path costs are being computed, try again shortly.",
+                "data": None
+            }, status=status.HTTP_202_ACCEPTED)
+        if costs is None:
+            return Response({
+                "status": "error",
+                "message": "No active map found."
+            }, status=status.HTTP_404_NOT_FOUND)
+
+        return Response({
+            "status": "success",
+            "message": "Path costs fetched successfully.",
+            "data": costs.as_dict()
+        }, status=status.HTTP_200_OK)
+
+    except ValueError as e:
+        return Response({
+            "status": "error",
+            "message": f"Active map could not be used: {e}"
+        }, status=status.HTTP_400_BAD_REQUEST)
+    except Exception as e:
+        logger.exception(f"Exception in path_costs: {e}")
+        return Response({
+            "status": "error",
+            "message": "Internal server error.",
+            "data": str(e)
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 # ---- JointHeat ----
 @api_view(["GET", "PUT"])
 @permission_classes([AllowAny])
-def create_or_update_joint_heat(request):
+@with_robot_id
+def create_or_update_joint_heat(request, robot_id):
     try:
-        instance = get_single_instance(JointHeat)
-
         if request.method == "GET":
+            instance = get_single_instance(JointHeat, robot_id)
             serializer = JointHeatSerializer(instance)
             return Response({"status": "success", "data": serializer.data})
 
         elif request.method == "PUT":
-            serializer = JointHeatSerializer(instance, data=request.data, partial=True)
-            if serializer.is_valid():
-                obj = serializer.save()
-
-                channel_layer = get_channel_layer()
-                async_to_sync(channel_layer.group_send)(
-                    "joint_heat_group",
-                    {
-                        "type": "joint_heat_message",
-                        "payload": {
-                            "j1": obj.j1,
-                            "j2": obj.j2,
-                            "j3": obj.j3,
-                            "j4": obj.j4,
-                            "j5": obj.j5,
-                            "j6": obj.j6,
-                        }
-                    },
-                )
-
-                return Response({"status": "success", "message": "Updated", "data": serializer.data})
-            return Response({"status": "error", "errors": serializer.errors}, status=400)
+            recorder.record("joint_heat", request.data, robot_id)
+            try:
+                data = update_stream("joint_heat", request.data, robot_id)
+            except serializers.ValidationError as e:
+                return Response({"status": "error", "errors": e.detail}, status=400)
+            return Response({"status": "success", "message": "Updated", "data": data})
 
     except Exception as e:
         logger.exception(f"JointHeat error: {e}")
@@ -1323,9 +1256,10 @@ def create_or_update_joint_heat(request):
     
 @api_view(['GET'])
 @permission_classes([AllowAny])
-def get_joint_heat(request):
+@with_robot_id
+def get_joint_heat(request, robot_id):
     try:
-        instance = JointHeat.objects.order_by('id').first()
+        instance = buffer.overlay(JointHeat.objects.filter(robot_id=robot_id).order_by('id').first())
         if not instance:
             return Response(
                 {"status": "error", "message": "No JointHeat found"},
@@ -1352,46 +1286,298 @@ def get_joint_heat(request):
 # ---- Slot Reached Position ----
 @api_view(["POST"])
 @permission_classes([AllowAny])
-def slot_reached_pos(request):
+@with_robot_id
+def slot_reached_pos(request, robot_id):
     try:
-        room = request.data.get("room")
-        bed = request.data.get("bed")
-        robot_telemetry = RobotTelemetry.objects.order_by('id').first()
+        room_name = request.data.get("room")
+        bed_name = request.data.get("bed")
+        if not room_name or not bed_name:
+            return Response({
+                "status": "error",
+                "message": "room and bed are required."
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        # the robot reached the position whether or not a patient is there
+        robot_telemetry = robot_state.get(robot_id)
         if robot_telemetry:
-            robot_telemetry.latest_room_reached = room
-            robot_telemetry.latest_bed_reached = bed
-            robot_telemetry.save(update_fields=["latest_room_reached", "latest_bed_reached"])
+            robot_telemetry.latest_room_reached = room_name
+            robot_telemetry.latest_bed_reached = bed_name
+            buffer.save(robot_telemetry, ["latest_room_reached", "latest_bed_reached"])
 
-        room = RoomDataModel.objects.get(room_name=room)
-        bed = BedDataModel.objects.get(bed_name=bed)
-        slot = SlotDataModel.objects.get(room_name=room.pk, bed_name=bed.pk)
+        try:
+            room = RoomDataModel.objects.get(room_name=room_name)
+            bed = BedDataModel.objects.get(bed_name=bed_name)
+            slot = SlotDataModel.objects.get(room_name=room.pk, bed_name=bed.pk)
+        except (RoomDataModel.DoesNotExist, BedDataModel.DoesNotExist, SlotDataModel.DoesNotExist):
+            return Response({
+                "status": "error",
+                "message": f"No slot for room '{room_name}' and bed '{bed_name}'."
+            }, status=status.HTTP_404_NOT_FOUND)
 
         patient = Patient.objects.filter(slot_assigned=slot.pk, is_active=True).first()
+        if patient is None:
+            return Response({
+                "status": "error",
+                "message": f"No active patient in room '{room_name}', bed '{bed_name}'."
+            }, status=status.HTTP_404_NOT_FOUND)
 
-        channel_layer = get_channel_layer()
-        async_to_sync(channel_layer.group_send)(
-            "slot_group",
-            {
-                "type": "slot_message",
-                "payload": {
-                    "id": patient.pk,
-                    "patient_id": patient.patient_id,
-                    "name": patient.name,
-                    "gender": patient.gender,
-                    "age": patient.age,
-                    "slot": {
-                        "room": room.room_name,
-                        "bed": bed.bed_name,
-                        "x": slot.x,
-                        "y": slot.y,
-                        "yaw": slot.yaw,
+        with transaction.atomic():
+            outbox.enqueue(
+                robot_group("slot_group", robot_id),
+                {
+                    "type": "slot_message",
+                    "payload": {
+                        "id": patient.pk,
+                        "patient_id": patient.patient_id,
+                        "name": patient.name,
+                        "gender": patient.gender,
+                        "age": patient.age,
+                        "slot": {
+                            "room": room.room_name,
+                            "bed": bed.bed_name,
+                            "x": slot.x,
+                            "y": slot.y,
+                            "yaw": slot.yaw,
+                        }
                     }
-                }
-            },
-        )
+                },
+            )
         # ✅ return success response
         return Response({"status": "success", "message": "Slot position broadcasted."})
 
     except Exception as e:
         logger.exception(f"JointHeat error: {e}")
-        return Response({"status": "error", "message": str(e)}, status=500)
\ No newline at end of file
+        return Response({"status": "error", "message": str(e)}, status=500)
+# ---- Telemetry History ----
+@api_view(["GET"])
+@permission_classes([AllowAny])
+@with_robot_id
+def telemetry_history(request, stream, robot_id):
+    """
+    Windowed history for one arm/joint stream or the battery.
+    Query params: start, end (ISO datetimes, default last 10 minutes)
+    and optional bucket (seconds) for min/max/mean downsampling.
+    """
+    try:
+        if stream not in STREAM_FIELDS:
+            return Response({
+                "status": "error",
+                "message": f"Unknown stream '{stream}'. Expected one of: {', '.join(STREAM_FIELDS)}."
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            end = query_datetime(request, "end", timezone.now())
+            start = query_datetime(request, "start", end - timedelta(minutes=10))
+        except serializers.ValidationError as e:
+            return Response({"status": "error", "errors": e.detail}, status=status.HTTP_400_BAD_REQUEST)
+        if start >= end:
+            return Response({
+                "status": "error",
+                "message": "start must be before end."
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        bucket = request.query_params.get("bucket")
+        try:
+            bucket = float(bucket) if bucket else None
+        except ValueError:
+            return Response({
+                "status": "error",
+                "message": "bucket must be a number of seconds."
+            }, status=status.HTTP_400_BAD_REQUEST)
+        if bucket is not None and bucket <= 0:
+            return Response({
+                "status": "error",
+                "message": "bucket must be greater than zero."
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        data = history.query(stream, start, end, bucket_seconds=bucket, robot_id=robot_id)
+        return Response({
+            "status": "success",
+            "message": "Telemetry history fetched successfully.",
+            "data": data
+        }, status=status.HTTP_200_OK)
+
+    except Exception as e:
+        logger.exception(f"Exception in telemetry_history: {e}")
+        return Response({
+            "status": "error",
+            "message": "Internal server error.",
+            "data": str(e)
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+# ---- Battery History ----
+@api_view(["GET"])
+@permission_classes([AllowAny])
+@with_robot_id
+def battery_history(request, robot_id):
+    """
+    Battery rollups of one robot.
+    Query params: resolution ("minute" or "hour", default minute), start,
+    end (ISO datetimes, default the last 24 hours). Each bucket carries the
+    mean/min/max of every battery field; the current minute shows up once
+    it has closed. Raw samples are at telemetry/history/battery/.
+    """
+    try:
+        resolution = request.query_params.get("resolution", "minute")
+        if resolution not in RESOLUTIONS:
+            return Response({
+                "status": "error",
+                "message": f"Unknown resolution '{resolution}'. Expected one of: {', '.join(RESOLUTIONS)}."
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            end = query_datetime(request, "end", timezone.now())
+            start = query_datetime(request, "start", end - timedelta(hours=24))
+        except serializers.ValidationError as e:
+            return Response({"status": "error", "errors": e.detail}, status=status.HTTP_400_BAD_REQUEST)
+        if start >= end:
+            return Response({
+                "status": "error",
+                "message": "start must be before end."
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        rollups = BatteryRollup.objects.filter(
+            robot_id=robot_id, resolution=resolution, bucket_start__gte=start, bucket_start__lt=end
+        ).order_by("bucket_start")
+        buckets = [
+            {
+                "start": rollup.bucket_start,
+                "samples": rollup.samples,
+                **{
+                    field: {
+                        "mean": rollup.mean(field),
+                        "min": getattr(rollup, f"{field}_min"),
+                        "max": getattr(rollup, f"{field}_max"),
+                    }
+                    for field in BATTERY_FIELDS
+                },
+            }
+            for rollup in rollups
+        ]
+        return Response({
+            "status": "success",
+            "message": "Battery history fetched successfully.",
+            "data": {"resolution": resolution, "buckets": buckets}
+        }, status=status.HTTP_200_OK)
+
+    except Exception as e:
+        logger.exception(f"Exception in battery_history: {e}")
+        return Response({
+            "status": "error",
+            "message": "Internal server error.",
+            "data": str(e)
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+# ---- Telemetry Frame Ingest ----
+@api_view(["POST"])
+@permission_classes([AllowAny])
+@with_robot_id
+def ingest_telemetry_frame(request, robot_id):
+    """
+    Accepts one arm frame or a list of timestamped frames carrying any of
+    arm_endpose, joint_velocity, joint_effort, joint_position, joint_heat
+    and arm_status. Validated in one pass, persisted in one transaction
+    and fanned out as a single telemetry_frame_group message.
+    """
+    try:
+        recorder.record("frame", request.data, robot_id)
+        try:
+            payload = ingest_frame_data(request.data, robot_id)
+        except serializers.ValidationError as e:
+            return Response({
+                "status": "error",
+                "message": "Validation failed.",
+                "errors": e.detail
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            "status": "success",
+            "message": "Telemetry frame ingested.",
+            "data": {
+                "frames": len(request.data) if isinstance(request.data, list) else 1,
+                "streams": [key for key in payload if key != "timestamp"],
+            }
+        }, status=status.HTTP_200_OK)
+
+    except Exception as e:
+        logger.exception(f"Exception in ingest_telemetry_frame: {e}")
+        return Response({
+            "status": "error",
+            "message": "Internal server error.",
+            "data": str(e)
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+# ---- Status Change Events ----
+STATUS_CHANGE_MAX_LIMIT = 1000
+
+@api_view(["GET"])
+@permission_classes([AllowAny])
+@with_robot_id
+def status_change_events(request, robot_id):
+    """
+    Logged ArmStatus / JointStatus transitions of one robot, newest first.
+    Query params: robot_id, model (armstatus | jointstatus, default armstatus),
+    field, joint_number (jointstatus only), start, end (ISO datetimes)
+    and limit (default 100, at most 1000).
+    """
+    try:
+        model_name = request.query_params.get("model", "armstatus")
+        tracked = {"armstatus": ArmStatus, "jointstatus": JointStatus}
+        if model_name not in tracked:
+            return Response({
+                "status": "error",
+                "message": f"Unknown model '{model_name}'. Expected one of: {', '.join(tracked)}."
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        events = StatusChangeEvent.objects.filter(robot_id=robot_id, model=model_name)
+
+        field = request.query_params.get("field")
+        if field:
+            if field not in tracked[model_name].tracked_fields:
+                return Response({
+                    "status": "error",
+                    "message": f"'{field}' is not a tracked {model_name} field."
+                }, status=status.HTTP_400_BAD_REQUEST)
+            events = events.filter(field=field)
+
+        joint_number = request.query_params.get("joint_number")
+        if model_name == "jointstatus" and joint_number:
+            ids = JointStatus.objects.filter(
+                robot_id=robot_id, joint_number=joint_number
+            ).values_list("id", flat=True)
+            events = events.filter(object_id__in=list(ids))
+
+        try:
+            start = query_datetime(request, "start")
+            end = query_datetime(request, "end")
+        except serializers.ValidationError as e:
+            return Response({"status": "error", "errors": e.detail}, status=status.HTTP_400_BAD_REQUEST)
+        if start:
+            events = events.filter(changed_at__gte=start)
+        if end:
+            events = events.filter(changed_at__lte=end)
+
+        try:
+            limit = min(int(request.query_params.get("limit", 100)), STATUS_CHANGE_MAX_LIMIT)
+        except ValueError:
+            limit = 0
+        if limit < 1:
+            return Response({
+                "status": "error",
+                "message": "limit must be a positive integer."
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        serializer = StatusChangeEventSerializer(events.order_by("-changed_at", "-id")[:limit], many=True)
+        return Response({
+            "status": "success",
+            "message": "Status changes fetched successfully.",
+            "data": serializer.data
+        }, status=status.HTTP_200_OK)
+
+    except Exception as e:
+        logger.exception(f"Exception in status_change_events: {e}")
+        return Response({
+            "status": "error",
+            "message": "Internal server error.",
+            "data": str(e)
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -0,0 +1,397 @@
+import atexit
+import copy
+import fcntl
+import glob
+import json
+import logging
+import os
+import threading
+import uuid
+from collections import defaultdict
+from functools import partial
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import caches
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections, transaction
+from django.dispatch import Signal
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# Sent (sender=model, instances, fields) once buffered or replayed rows are
+# committed. bulk_update sends no post_save, so caches of these rows
+# listen here instead.
+flushed = Signal()
+
+# how long a direct save keeps older buffered values of its fields from
+# being flushed; far longer than any sample stays buffered
+SAVED_MARK_SECONDS = 60 * 60
+
+
+def _auto_now_fields(model):
+    return [f.name for f in model._meta.concrete_fields if getattr(f, "auto_now", False)]
+
+
+def _saved_key(label, pk, name):
+    return f"writebehind:saved:{label}:{pk}:{name}"
+
+
+def _replay_journal(paths):
+    """
+    Apply journal segments (oldest first) to the database: the last
+    journalled value of every field wins, rows are updated with one
+    bulk_update per model and field set. Entries stamped (auto_now)
+    before the row's current stamp are older than what the database
+    holds and are skipped. Torn trailing lines are skipped.
+    """
+    rows = defaultdict(list)
+    for path in paths:
+        with open(path, encoding="utf-8") as journal:
+            for line in journal:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                rows[(record["model"], record["pk"])].append(record["fields"])
+
+    by_model = defaultdict(dict)
+    for (label, pk), entries in rows.items():
+        by_model[label][pk] = entries
+
+    replayed = 0
+    with transaction.atomic():
+        for label, pending in by_model.items():
+            model = apps.get_model(label)
+            stamp = next(iter(_auto_now_fields(model)), None)
+            instances = model.objects.select_for_update().in_bulk(list(pending))
+            groups = defaultdict(list)
+            for pk, entries in pending.items():
+                instance = instances.get(pk)
+                if instance is None:
+                    continue
+                current = getattr(instance, stamp) if stamp else None
+                names = set()
+                for fields in entries:
+                    if current is not None and fields.get(stamp) is not None:
+                        if model._meta.get_field(stamp).to_python(fields[stamp]) < current:
+                            continue
+                    for name, value in fields.items():
+                        setattr(instance, name, model._meta.get_field(name).to_python(value))
+                    names.update(fields)
+                if names:
+                    groups[tuple(sorted(names))].append(instance)
+            for names, group in groups.items():
+                model.objects.bulk_update(group, names)
+                replayed += len(group)
+                transaction.on_commit(partial(flushed.send, sender=model, instances=group, fields=list(names)))
+    return replayed
+
+
+class WriteBehindBuffer:
+    """
+    Write-behind persistence for rows that are overwritten at telemetry
+    rate (the stream singletons, BatteryStatus, RobotTelemetry).
+
+    put() keeps the instance in memory, where get()/overlay() serve it to
+    readers, and appends the changed fields to a journal file. A
+    background thread flushes every WRITE_BEHIND_FLUSH_SECONDS, or
+    sooner once WRITE_BEHIND_MAX_PENDING samples are buffered, with one
+    bulk_update per model, so a row updated a hundred times in between
+    costs a single UPDATE. bulk_update sends no post_save signals; the
+    `flushed` signal is sent instead.
+
+    Code that writes fields of a buffered row directly goes through
+    save(): it marks the fields in the shared WRITE_BEHIND_CACHE while
+    holding the row lock, and every process's flush, which takes the
+    same lock, drops buffered values of those fields sampled before the
+    mark. Otherwise a worker's older buffered values could land on top.
+
+    Each process journals into its own segments in
+    WRITE_BEHIND_JOURNAL_DIR, held under an flock for as long as the
+    process lives. Samples are written to the journal as they come, and
+    fsynced once per flush interval, when the segment is rotated: a
+    crashed process loses nothing, a crashed machine up to one interval.
+    A segment is deleted once its samples are committed; segments of a
+    process that died before flushing are replayed by the next process
+    that starts buffering. With WRITE_BEHIND_FLUSH_SECONDS = 0 writes go
+    straight to the database.
+    """
+
+    def __init__(self, flush_seconds=None, max_pending=None, journal_dir=None):
+        self.flush_seconds = getattr(settings, "WRITE_BEHIND_FLUSH_SECONDS", 1.0) if flush_seconds is None else flush_seconds
+        self.max_pending = max_pending or getattr(settings, "WRITE_BEHIND_MAX_PENDING", 500)
+        self.journal_dir = journal_dir or getattr(
+            settings, "WRITE_BEHIND_JOURNAL_DIR", os.path.join(settings.BASE_DIR, "logs", "journal")
+        )
+        self.cache_alias = getattr(settings, "WRITE_BEHIND_CACHE", "default")
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._pending = {}
+        self._fields = defaultdict(set)
+        # key -> field -> timestamp the buffered value was sampled at
+        self._stamps = defaultdict(dict)
+        self._count = 0
+        self._token = None
+        self._owner = None
+        self._segment = 0
+        self._journal = None
+        self._unflushed = []
+        self._thread = None
+
+    # ---- reads ----
+
+    def get(self, model, pk):
+        """Copy of the buffered instance of `model` with `pk`, or None."""
+        with self._lock:
+            instance = self._pending.get((model._meta.label, pk))
+            return copy.copy(instance) if instance is not None else None
+
+    def overlay(self, instance):
+        """Apply fields still waiting to be flushed onto a database-loaded instance."""
+        if instance is None:
+            return None
+        with self._lock:
+            key = (instance._meta.label, instance.pk)
+            pending = self._pending.get(key)
+            for name in self._fields.get(key, ()):
+                setattr(instance, name, getattr(pending, name))
+        return instance
+
+    # ---- writes ----
+
+    def put(self, instance, fields):
+        """
+        Buffer an update of `fields` on an existing row. auto_now fields
+        are stamped here, as bulk_update does not.
+        """
+        fields = list(fields)
+        now = timezone.now()
+        for name in _auto_now_fields(type(instance)):
+            setattr(instance, name, now)
+            fields.append(name)
+
+        if not self.flush_seconds:
+            instance.save(update_fields=fields)
+            return
+
+        key = (instance._meta.label, instance.pk)
+        with self._lock:
+            self._start()
+            record = {
+                "model": key[0],
+                "pk": instance.pk,
+                "fields": {
+                    name: instance._meta.get_field(name).value_from_object(instance) for name in fields
+                },
+            }
+            self._journal.write(json.dumps(record, cls=DjangoJSONEncoder) + "\n")
+            self._journal.flush()
+
+            self._pending[key] = copy.copy(instance)
+            self._fields[key].update(fields)
+            self._stamps[key].update(dict.fromkeys(fields, now.timestamp()))
+            self._count += 1
+            full = self._count >= self.max_pending
+        if full:
+            self._wakeup.set()
+
+    def save(self, instance, fields):
+        """
+        Save `fields` of a row directly (instance.save(update_fields=...)),
+        ahead of whatever any process has buffered for them.
+        """
+        fields = list(fields)
+        model = type(instance)
+        key = (model._meta.label, instance.pk)
+        now = timezone.now()
+        with transaction.atomic():
+            # flushes lock the rows they write before reading the marks
+            list(model.objects.select_for_update().filter(pk=instance.pk).values_list("pk", flat=True))
+            try:
+                caches[self.cache_alias].set_many(
+                    {_saved_key(key[0], key[1], name): now.timestamp() for name in fields},
+                    timeout=SAVED_MARK_SECONDS,
+                )
+            except Exception as e:
+                logger.exception(f"Failed to mark direct save of {key[0]} {key[1]}: {e}")
+            instance.save(update_fields=fields + [
+                name for name in _auto_now_fields(model) if name not in fields
+            ])
+        with self._lock:
+            self._discard(key, {name: now.timestamp() for name in fields})
+
+    def _discard(self, key, saved):
+        """Drop buffered fields of `key` sampled before they were saved directly ({field: timestamp})."""
+        stamps = self._stamps.get(key, {})
+        for name, saved_at in saved.items():
+            if name in self._fields.get(key, ()) and stamps.get(name, 0) <= saved_at:
+                self._fields[key].discard(name)
+                stamps.pop(name, None)
+        if key in self._fields and not self._fields[key] - set(_auto_now_fields(type(self._pending[key]))):
+            self._pending.pop(key)
+            self._fields.pop(key)
+            self._stamps.pop(key, None)
+
+    def _saved_marks(self, keys, fields):
+        """{key: {field: timestamp}} of the direct saves marked for buffered fields."""
+        wanted = {
+            _saved_key(key[0], key[1], name): (key, name) for key in keys for name in fields[key]
+        }
+        try:
+            marks = caches[self.cache_alias].get_many(list(wanted))
+        except Exception as e:
+            logger.exception(f"Failed to read direct save marks, flushing without them: {e}")
+            return {}
+        saved = defaultdict(dict)
+        for cache_key, timestamp in marks.items():
+            key, name = wanted[cache_key]
+            saved[key][name] = timestamp
+        return saved
+
+    def flush(self):
+        """Write everything buffered so far to the database. Returns the rows written."""
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                pending, fields, stamps = self._pending, self._fields, self._stamps
+                self._pending, self._fields, self._stamps, self._count = {}, defaultdict(set), defaultdict(dict), 0
+                segments = self._unflushed + [self._rotate()]
+                self._unflushed = []
+
+            try:
+                by_model = defaultdict(list)
+                for key, instance in pending.items():
+                    by_model[type(instance)].append(key)
+                written = 0
+                with transaction.atomic():
+                    for model, keys in by_model.items():
+                        list(model.objects.select_for_update().filter(
+                            pk__in=[pk for _, pk in keys]
+                        ).values_list("pk", flat=True))
+                        saved = self._saved_marks(keys, fields)
+                        auto_now = set(_auto_now_fields(model))
+                        groups = defaultdict(list)
+                        for key in keys:
+                            names = {
+                                name for name in fields[key]
+                                if stamps[key].get(name, 0) > saved[key].get(name, float("-inf"))
+                            } if key in saved else fields[key]
+                            if names - auto_now:
+                                groups[tuple(sorted(names))].append(key)
+                        for names, group in groups.items():
+                            model.objects.bulk_update([pending[key] for key in group], names)
+                            transaction.on_commit(partial(self._flushed, model, group, pending, list(names)))
+                            written += len(group)
+            except Exception:
+                # keep the samples (newer ones win) and the segment for the next try
+                with self._lock:
+                    for key, instance in pending.items():
+                        if key not in self._pending:
+                            self._pending[key] = instance
+                            self._stamps[key] = stamps[key]
+                        else:
+                            self._stamps[key] = {**stamps[key], **self._stamps[key]}
+                        self._fields[key] |= fields[key]
+                    self._unflushed = segments + self._unflushed
+                raise
+
+            # inside an outer transaction the samples are only safe once it commits
+            transaction.on_commit(partial(self._remove, segments))
+            return written
+
+    def _flushed(self, model, keys, pending, names):
+        with self._lock:
+            # rows buffered again since carry newer values than these
+            instances = [pending[key] for key in keys if key not in self._pending]
+        if instances:
+            flushed.send(sender=model, instances=instances, fields=names)
+
+    @staticmethod
+    def _remove(paths):
+        for path in paths:
+            os.remove(path)
+
+    # ---- journal ----
+
+    def _segment_path(self, token, segment):
+        return os.path.join(self.journal_dir, f"writebehind-{token}-{segment:08d}.journal")
+
+    def _rotate(self):
+        """Sync and close the current segment, open the next one; returns the closed segment's path."""
+        os.fsync(self._journal.fileno())
+        self._journal.close()
+        closed = self._segment_path(self._token, self._segment)
+        self._segment += 1
+        self._journal = open(self._segment_path(self._token, self._segment), "a", encoding="utf-8")
+        return closed
+
+    def _start(self):
+        if self._journal is not None:
+            return
+        os.makedirs(self.journal_dir, exist_ok=True)
+        self._token = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._owner = open(os.path.join(self.journal_dir, f"writebehind-{self._token}.lock"), "w")
+        fcntl.flock(self._owner, fcntl.LOCK_EX)
+        self.replay_orphans()
+        self._journal = open(self._segment_path(self._token, self._segment), "a", encoding="utf-8")
+
+        self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._thread.start()
+        atexit.register(self._flush_at_exit)
+
+    def replay_orphans(self):
+        """Replay and remove the journals of processes that are no longer running."""
+        for lock_path in glob.glob(os.path.join(self.journal_dir, "writebehind-*.lock")):
+            token = os.path.basename(lock_path)[len("writebehind-"):-len(".lock")]
+            if token == self._token:
+                continue
+            with open(lock_path, "a") as lock:
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    continue  # owner still running
+                segments = sorted(glob.glob(os.path.join(self.journal_dir, f"writebehind-{token}-*.journal")))
+                try:
+                    replayed = _replay_journal(segments) if segments else 0
+                    if replayed:
+                        logger.warning(f"Replayed {replayed} rows from write-behind journal {token}")
+                except Exception as e:
+                    logger.exception(f"Failed to replay write-behind journal {token}: {e}")
+                    continue
+                for path in segments:
+                    os.remove(path)
+                os.remove(lock_path)
+
+    # ---- flusher ----
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_seconds)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.exception(f"Write-behind flush failed: {e}")
+            finally:
+                close_old_connections()
+
+    def _flush_at_exit(self):
+        try:
+            self.flush()
+        except Exception as e:
+            logger.exception(f"Write-behind flush at exit failed, journal kept: {e}")
+            return
+        with self._lock:
+            if self._pending or self._unflushed:
+                return
+            self._journal.close()
+            os.remove(self._segment_path(self._token, self._segment))
+            os.remove(self._owner.name)
+            self._owner.close()
+
+
+buffer = WriteBehindBuffer()
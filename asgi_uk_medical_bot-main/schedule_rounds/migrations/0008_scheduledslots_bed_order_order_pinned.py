@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-18 06:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('schedule_rounds', '0007_logscheduler'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scheduledslots',
+            name='bed_order',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='scheduledslots',
+            name='order_pinned',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-18 06:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('schedule_rounds', '0008_scheduledslots_bed_order_order_pinned'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scheduledslots',
+            name='room_pinned',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -81,6 +81,17 @@ class ScheduledSlots(models.Model):
 
     schedule_order = models.PositiveIntegerField(default=0)
 
+    # position among the beds of the same room (row_number)
+    bed_order = models.PositiveIntegerField(default=0)
+
+    # keep this room's position in the round, and this bed's position in
+    # its room, when the round is travel-optimized
+    order_pinned = models.BooleanField(default=False)
+
+    # keep only this room's position in the round (a manual room swap);
+    # its beds are still reordered
+    room_pinned = models.BooleanField(default=False)
+
     created_at = models.DateTimeField(auto_now_add=True)
     created_by = models.ForeignKey(
         settings.AUTH_USER_MODEL,
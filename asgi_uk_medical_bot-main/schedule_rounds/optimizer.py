@@ -0,0 +1,251 @@
+"""
+Travel-optimized ordering of the rooms of a round, and of the beds within
+each room, over the path costs of the active map (robot_management.pathing).
+
+A round is an open path: the robot leaves a room by its exit point and
+enters the next one by its entry point, and within a room goes from the
+entry point through the beds to the exit point. Orders are built by
+nearest neighbour (from every possible first stop) and improved by 2-opt.
+Scheduled slots with order_pinned keep their place: a room with a pinned
+slot keeps its position among the rooms, and a pinned slot keeps its
+position among the beds of its room. A room with a room_pinned slot only
+keeps its position among the rooms.
+"""
+import itertools
+import logging
+
+import numpy as np
+from django.db import transaction
+
+from robot_management.pathing import PathCostsPending, engine
+
+from .models import ScheduledSlots
+
+logger = logging.getLogger(__name__)
+
+# metres charged for a leg with no known path (missing coordinates or
+# unreachable on the map), so such stops drift to the end of a run
+PENALTY = 1e6
+
+MAX_PASSES = 50
+
+# up to this many unpinned stops every order is tried (7! = 5040)
+EXACT_STOPS = 7
+
+
+def _legs(costs, sources, targets):
+    """len(sources) x len(targets) path lengths between route point keys, PENALTY where unknown."""
+    rows = np.array([costs.index.get(key, -1) for key in sources], dtype=np.int64)
+    cols = np.array([costs.index.get(key, -1) for key in targets], dtype=np.int64)
+    legs = costs.distances[np.ix_(np.maximum(rows, 0), np.maximum(cols, 0))].copy()
+    legs[rows < 0, :] = PENALTY
+    legs[:, cols < 0] = PENALTY
+    legs[~np.isfinite(legs)] = PENALTY
+    return legs
+
+
+def path_length(order, cost, start=None, end=None):
+    """Length of visiting `order` (item indices); start/end are per-item legs from/to fixed ends."""
+    if not order:
+        return 0.0
+    total = sum(cost[a, b] for a, b in zip(order, order[1:]))
+    if start is not None:
+        total += start[order[0]]
+    if end is not None:
+        total += end[order[-1]]
+    return float(total)
+
+
+def order_stops(cost, pinned=None, start=None, end=None):
+    """
+    Order items 0..n-1 (cost[i, j]: leg from i to j, not necessarily
+    symmetric) for the shortest open path, with optional fixed start/end
+    legs. `pinned` maps position -> item for items that must stay put.
+    Returns the list of items by position.
+    """
+    size = len(cost)
+    pinned = pinned or {}
+    free = [item for item in range(size) if item not in pinned.values()]
+    if not free:
+        return [pinned[position] for position in range(size)]
+    if len(free) <= EXACT_STOPS:
+        return _exhaustive(cost, pinned, free, size, start, end)
+
+    firsts = [pinned[0]] if 0 in pinned else free
+    best, best_length = None, None
+    for first in firsts:
+        order = _nearest_neighbour(cost, pinned, free, first, size)
+        length = path_length(order, cost, start, end)
+        if best is None or length < best_length:
+            best, best_length = order, length
+
+    return _two_opt(best, cost, pinned, start, end)
+
+
+def _exhaustive(cost, pinned, free, size, start, end):
+    open_positions = [position for position in range(size) if position not in pinned]
+    order = [pinned.get(position) for position in range(size)]
+    best, best_length = None, None
+    for permutation in itertools.permutations(free):
+        for position, item in zip(open_positions, permutation):
+            order[position] = item
+        length = path_length(order, cost, start, end)
+        if best is None or length < best_length:
+            best, best_length = list(order), length
+    return best
+
+
+def _nearest_neighbour(cost, pinned, free, first, size):
+    left = set(free)
+    order = []
+    for position in range(size):
+        if position in pinned:
+            item = pinned[position]
+        elif position == 0:
+            item = first
+        else:
+            item = min(left, key=lambda candidate: cost[order[-1], candidate])
+        left.discard(item)
+        order.append(item)
+    return order
+
+
+def _two_opt(order, cost, pinned, start, end):
+    """
+    Reverse segments of unpinned positions while that shortens the path.
+    Legs may be asymmetric, so a reversed segment is priced with the
+    backward legs (prefix sums keep each check O(1)).
+    """
+    runs = [
+        [position for position, _ in group]
+        for is_free, group in itertools.groupby(enumerate(order), key=lambda pair: pair[0] not in pinned)
+        if is_free
+    ]
+    for _ in range(MAX_PASSES):
+        forward = np.concatenate(([0.0], np.cumsum([cost[a, b] for a, b in zip(order, order[1:])])))
+        backward = np.concatenate(([0.0], np.cumsum([cost[b, a] for a, b in zip(order, order[1:])])))
+        improved = False
+        for run in runs:
+            for i, j in itertools.combinations(run, 2):
+                before = _leg_in(order, i, cost, start) + _leg_out(order, j, cost, end)
+                after = _leg_in(order, i, cost, start, order[j]) + _leg_out(order, j, cost, end, order[i])
+                delta = after - before + (backward[j] - backward[i]) - (forward[j] - forward[i])
+                if delta < -1e-9:
+                    order[i:j + 1] = order[i:j + 1][::-1]
+                    improved = True
+                    break
+            if improved:
+                break
+        if not improved:
+            break
+    return order
+
+
+def _leg_in(order, i, cost, start, item=None):
+    """Leg into position i (the stop there being `item`, default order[i])."""
+    item = order[i] if item is None else item
+    if i > 0:
+        return cost[order[i - 1], item]
+    return start[item] if start is not None else 0.0
+
+
+def _leg_out(order, j, cost, end, item=None):
+    """Leg out of position j (the stop there being `item`, default order[j])."""
+    item = order[j] if item is None else item
+    if j < len(order) - 1:
+        return cost[item, order[j + 1]]
+    return end[item] if end is not None else 0.0
+
+
+def plan_batch(batch, costs=None, pinned=None, pinned_rooms=None):
+    """
+    Optimized visiting order of a batch's scheduled slots. `pinned`
+    (ScheduledSlots ids) and `pinned_rooms` (row numbers) stand in for the
+    stored order_pinned and room_pinned flags when given. Only reads the
+    database. Returns None when there are no path costs (no active map
+    with a file, or none built yet), else a dict:
+      rooms               [{"room", "row_number", "slots": [ScheduledSlots ids]}] in visiting order
+      distance_metres     length of the planned round
+      current_metres      length of the round in its stored order
+    Stops without coordinates are charged PENALTY per leg in both lengths.
+    """
+    if costs is None:
+        try:
+            costs = engine.costs()
+        except PathCostsPending:
+            return None
+    if costs is None:
+        return None
+
+    slots = list(
+        ScheduledSlots.objects.filter(batch=batch)
+        .select_related("patient")
+        .order_by("schedule_order", "row_number", "bed_order", "id")
+    )
+    rooms = [
+        (row_number, list(group))
+        for row_number, group in itertools.groupby(slots, key=lambda slot: slot.row_number)
+    ]
+    if not rooms:
+        return {"rooms": [], "distance_metres": 0.0, "current_metres": 0.0}
+
+    def slot_pinned(slot):
+        return slot.order_pinned if pinned is None else slot.pk in pinned
+
+    def room_pinned(row_number, group):
+        if any(slot_pinned(slot) for slot in group):
+            return True
+        if pinned_rooms is None:
+            return any(slot.room_pinned for slot in group)
+        return row_number in pinned_rooms
+
+    names = [f"room_{row_number}" for row_number, _ in rooms]
+    entries = [f"entry:{name}" for name in names]
+    exits = [
+        f"exit:{name}" if f"exit:{name}" in costs.index else f"entry:{name}"
+        for name in names
+    ]
+
+    planned_rooms, planned, current = [], 0.0, 0.0
+    inside = {}
+    for index, (row_number, group) in enumerate(rooms):
+        keys = [f"slot:{slot.patient.slot_assigned_id}" for slot in group]
+        cost = _legs(costs, keys, keys)
+        start = _legs(costs, [entries[index]], keys)[0]
+        end = _legs(costs, keys, [exits[index]])[:, 0]
+        fixed = {position: position for position, slot in enumerate(group) if slot_pinned(slot)}
+        order = order_stops(cost, fixed, start, end)
+        inside[index] = [group[position] for position in order]
+        planned += path_length(order, cost, start, end)
+        current += path_length(list(range(len(group))), cost, start, end)
+
+    between = _legs(costs, exits, entries)
+    fixed = {
+        position: position for position, (row_number, group) in enumerate(rooms) if room_pinned(row_number, group)
+    }
+    order = order_stops(between, fixed)
+    planned += path_length(order, between)
+    current += path_length(list(range(len(rooms))), between)
+
+    for index in order:
+        planned_rooms.append({
+            "room": names[index],
+            "row_number": rooms[index][0],
+            "slots": [slot.pk for slot in inside[index]],
+        })
+    return {
+        "rooms": planned_rooms,
+        "distance_metres": round(planned, 3),
+        "current_metres": round(current, 3),
+    }
+
+
+def apply_plan(plan):
+    """Store a plan_batch() order as schedule_order (rooms, from 1) and bed_order (beds in a room, from 1)."""
+    updates = []
+    for room_position, room in enumerate(plan["rooms"], start=1):
+        for bed_position, slot_id in enumerate(room["slots"], start=1):
+            updates.append(ScheduledSlots(pk=slot_id, schedule_order=room_position, bed_order=bed_position))
+    with transaction.atomic():
+        ScheduledSlots.objects.bulk_update(updates, ["schedule_order", "bed_order"])
+    return len(updates)
@@ -5,17 +5,21 @@ import re
 import os
 
 # Third-party
-from asgiref.sync import async_to_sync
 from celery import shared_task
-from channels.layers import get_channel_layer
+from django.conf import settings
 from django.core.cache import cache
 from django.utils import timezone
 from datetime import datetime
 
 # Local application
 from .models import BatchScheduleModel, ScheduledSlots
+from . import optimizer
 from .serializers import ScheduledSlotsSchedulerSerializer
 from bed_data.models import RoomDataModel, RoomPositionModel
+from robot_management.battery import forecaster
+from robot_management.broadcast import broadcaster
+from robot_management.robots import DEFAULT_ROBOT_ID, robot_group
+from utils import metrics
 
 logger = logging.getLogger(__name__)
 
@@ -31,6 +35,8 @@ def extract_number(value: str) -> int:
 def check_and_send_schedules(self):
     try:
         now = timezone.localtime()
+        # beat queues the check at the start of every minute
+        metrics.observe_schedule_lag((now - now.replace(second=0, microsecond=0)).total_seconds())
 
         key = f"check_schedule_lock_{now.strftime('%Y%m%d%H%M')}"
         if not cache.add(key, "locked", timeout=60):
@@ -58,15 +64,30 @@ def check_and_send_schedules(self):
                 batch_id = schedule.pk
 
                 try:
-                    # Fetch schedules ordered by id
+                    round_metres = None
+                    if settings.SCHEDULE_OPTIMIZE_ROUTES:
+                        try:
+                            plan = optimizer.plan_batch(schedule)
+                            if plan is not None:
+                                round_metres = plan["current_metres"]
+                                # leave the stored order alone unless the plan is shorter
+                                if plan["distance_metres"] < plan["current_metres"]:
+                                    optimizer.apply_plan(plan)
+                                    round_metres = plan["distance_metres"]
+                        except Exception as e:
+                            logger.exception(f"Route optimization failed for schedule {batch_id}: {e}")
+                            round_metres = None
+
+                    # Fetch schedules in round order: rooms, then beds within a room
                     schedules = (
                         ScheduledSlots.objects.filter(batch=schedule)
                         # .select_related('patient', 'batch')
                         .prefetch_related('patient__slot_assigned')
                         .all()
                         .order_by(
-                            # 'schedule_order', 
-                            'row_number', 
+                            'schedule_order',
+                            'row_number',
+                            'bed_order',
                             'id')
                     )
                     serializer = ScheduledSlotsSchedulerSerializer(schedules, many=True)
@@ -102,14 +123,40 @@ def check_and_send_schedules(self):
                             "slot_pos": slots_with_pos
                         })
 
-                    channel_layer = get_channel_layer()
-                    async_to_sync(channel_layer.group_send)(
-                        "scheduler_value_group",
+                    # can the robot finish the batch before it has to dock?
+                    round_seconds = len(serializer.data) * settings.BATTERY_ROUND_SECONDS_PER_SLOT
+                    if round_metres is not None and round_metres < optimizer.PENALTY:
+                        round_seconds += round(round_metres / settings.ROBOT_TRAVEL_SPEED)
+                    try:
+                        can_complete, forecast = forecaster.can_run(round_seconds)
+                    except Exception as e:
+                        logger.exception(f"Battery forecast failed for schedule {batch_id}: {e}")
+                        can_complete, forecast = None, None
+                    if can_complete is False and forecast["runtime_seconds"] is not None:
+                        logger.warning(
+                            f"Schedule {batch_id}: battery forecast {forecast['runtime_seconds']}s "
+                            f"is short of the estimated round time {round_seconds}s"
+                        )
+                    elif can_complete is False:
+                        # not discharging: the charge is already at the reserve
+                        logger.warning(
+                            f"Schedule {batch_id}: battery charge {forecast['charge']}% is at or below "
+                            f"the reserve {forecast['reserve']}%, round time {round_seconds}s"
+                        )
+
+                    # schedules are not assigned to a robot; rounds go to the default one
+                    broadcaster.publish(
+                        robot_group("scheduler_value_group", DEFAULT_ROBOT_ID),
                         {
                             "type": "scheduler_value_message",
                             "payload": {
                                 "scheduler": response_data,
-                                "batch_id": batch_id
+                                "batch_id": batch_id,
+                                "battery": {
+                                    "forecast": forecast,
+                                    "estimated_round_seconds": round_seconds,
+                                    "can_complete": can_complete,
+                                },
                             }
                         },
                     )
@@ -1,3 +1,195 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from bed_data.models import BedDataModel, RoomDataModel, RoomPositionModel, SlotDataModel
+from mainapp.models import HealthcareUser, Patient
+from privilagecontroller.models import PrivilegeModel
+from robot_management.pathing import PathCosts
+
+from . import optimizer, tasks
+from .models import BatchScheduleModel, ScheduledSlots
+
+API = "/api/medicalbot/schedule/"
+
+
+class OrderStopsTests(SimpleTestCase):
+
+    def line(self, positions):
+        positions = np.array(positions, dtype=float)
+        return np.abs(positions[:, None] - positions[None, :])
+
+    def test_small_rounds_get_the_shortest_order(self):
+        cost = self.line([3, 0, 2, 1])
+        order = optimizer.order_stops(cost)
+        # either end of the line may come first
+        self.assertIn(order, ([1, 3, 2, 0], [0, 2, 3, 1]))
+
+    def test_large_rounds_are_improved_by_two_opt(self):
+        positions = [7, 2, 9, 0, 5, 1, 8, 3, 6, 4, 10]
+        cost = self.line(positions)
+        order = optimizer.order_stops(cost)
+        self.assertEqual(optimizer.path_length(order, cost), 10.0)
+
+    def test_pinned_stops_keep_their_position(self):
+        cost = self.line([3, 0, 2, 1])
+        order = optimizer.order_stops(cost, pinned={0: 0})
+        self.assertEqual(order[0], 0)
+        self.assertEqual(sorted(order), [0, 1, 2, 3])
+
+
+class RoundTestCase(TestCase):
+    """
+    Three rooms on a line, stored in the order 1, 2, 3: room 1 is entered
+    at 0 and left at 4 with beds at 3 (stored first) and 1, room 3 is at
+    10 and room 2 at 20. The shortest round is rooms 1, 3, 2 with room 1's
+    beds swapped.
+    """
+
+    def setUp(self):
+        self.batch = BatchScheduleModel.objects.create(time_slot="morning")
+        points = {"entry:room_1": 0.0, "exit:room_1": 4.0, "entry:room_2": 20.0, "entry:room_3": 10.0}
+        self.slots = {}
+        beds_in_room = {}
+        for row_number, bed, x in ((1, "far", 3.0), (1, "near", 1.0), (2, "r2", 20.0), (3, "r3", 10.0)):
+            room, _ = RoomDataModel.objects.get_or_create(room_name=f"room_{row_number}")
+            slot = SlotDataModel.objects.create(
+                room_name=room, bed_name=BedDataModel.objects.create(bed_name=bed), x=x, y=0.0
+            )
+            patient = Patient.objects.create(patient_id=bed, name=bed, gender="F", age=50, slot_assigned=slot)
+            beds_in_room[row_number] = beds_in_room.get(row_number, 0) + 1
+            self.slots[bed] = ScheduledSlots.objects.create(
+                patient=patient, batch=self.batch, row_number=row_number,
+                schedule_order=row_number, bed_order=beds_in_room[row_number],
+            )
+            points[f"slot:{slot.pk}"] = x
+        keys = list(points)
+        xs = np.array([points[key] for key in keys])
+        self.costs = PathCosts(1, "v1", keys, [(x, 0.0) for x in xs], np.abs(xs[:, None] - xs[None, :]), 0.25)
+
+
+class PlanBatchTests(RoundTestCase):
+
+    def plan(self, **kwargs):
+        plan = optimizer.plan_batch(self.batch, costs=self.costs, **kwargs)
+        return [room["row_number"] for room in plan["rooms"]], plan
+
+    def bed_ids(self, *beds):
+        return [self.slots[bed].pk for bed in beds]
+
+    def test_rooms_and_beds_are_ordered_for_the_shortest_round(self):
+        rooms, plan = self.plan()
+        self.assertEqual(rooms, [1, 3, 2])
+        self.assertEqual(plan["rooms"][0]["slots"], self.bed_ids("near", "far"))
+        self.assertLess(plan["distance_metres"], plan["current_metres"])
+
+    def test_a_pinned_room_keeps_its_position_but_not_its_bed_order(self):
+        ScheduledSlots.objects.filter(row_number=2).update(room_pinned=True)
+        rooms, plan = self.plan()
+        self.assertEqual(rooms, [1, 2, 3])
+        self.assertEqual(plan["rooms"][0]["slots"], self.bed_ids("near", "far"))
+
+    def test_a_pinned_slot_keeps_its_place(self):
+        rooms, plan = self.plan(pinned={self.slots["far"].pk})
+        self.assertEqual(rooms[0], 1)
+        self.assertEqual(plan["rooms"][0]["slots"], self.bed_ids("far", "near"))
+
+
+class OptimizeRoomOrderViewTests(RoundTestCase):
+
+    def setUp(self):
+        super().setUp()
+        PrivilegeModel.objects.update_or_create(code="batch_schedule_crud", defaults={"allow_admin": True})
+        self.client = APIClient()
+        self.client.force_authenticate(HealthcareUser.objects.create(
+            username="admin", email="admin@example.com", name="Admin", role="admin", gender="F",
+        ))
+        patcher = mock.patch.object(optimizer.engine, "costs", return_value=self.costs)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def orders(self):
+        return {
+            slot.patient.patient_id: (slot.schedule_order, slot.bed_order)
+            for slot in ScheduledSlots.objects.select_related("patient")
+        }
+
+    def test_the_plan_is_saved(self):
+        response = self.client.post(f"{API}optimize-room-order/", {"batch_id": self.batch.pk}, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.orders(), {"near": (1, 1), "far": (1, 2), "r3": (2, 1), "r2": (3, 1)})
+
+    def test_a_dry_run_saves_nothing(self):
+        before = self.orders()
+        response = self.client.post(f"{API}optimize-room-order/", {
+            "batch_id": self.batch.pk, "dry_run": True, "pinned_rooms": [2],
+        }, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([room["row_number"] for room in response.json()["data"]["rooms"]], [1, 2, 3])
+        self.assertEqual(self.orders(), before)
+        self.assertFalse(ScheduledSlots.objects.filter(room_pinned=True).exists())
+
+    def test_a_swap_pins_the_rooms_but_not_their_beds(self):
+        response = self.client.post(f"{API}swap-room-order-scheduled-slot/", {
+            "batch_id": self.batch.pk, "room_pos_a": 1, "room_pos_b": 2,
+        }, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(ScheduledSlots.objects.filter(order_pinned=True).exists())
+
+        self.client.post(f"{API}optimize-room-order/", {"batch_id": self.batch.pk}, format="json")
+        orders = self.orders()
+        self.assertEqual((orders["r2"], orders["near"], orders["far"]), ((1, 1), (2, 1), (2, 2)))
+
+    def test_a_slot_can_be_pinned_through_the_slot_update(self):
+        far = self.slots["far"]
+        response = self.client.put(f"{API}schedule-slots/", {
+            "patient": far.patient_id, "batch": self.batch.pk, "order_pinned": True,
+        }, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()["data"]["order_pinned"])
+
+        self.client.post(f"{API}optimize-room-order/", {"batch_id": self.batch.pk}, format="json")
+        self.assertEqual(self.orders(), {"far": (1, 1), "near": (1, 2), "r3": (2, 1), "r2": (3, 1)})
+
+        # the pin stays with the batch it was set in
+        other = BatchScheduleModel.objects.create(time_slot="evening")
+        self.client.put(f"{API}schedule-slots/", {"patient": far.patient_id, "batch": other.pk}, format="json")
+        self.assertFalse(ScheduledSlots.objects.get(pk=far.pk).order_pinned)
+
+
+@override_settings(SCHEDULE_OPTIMIZE_ROUTES=True)
+class ScheduledRoundTaskTests(RoundTestCase):
+
+    def setUp(self):
+        super().setUp()
+        for patcher in (
+            mock.patch.object(optimizer.engine, "costs", return_value=self.costs),
+            mock.patch.object(tasks, "cache"),
+            mock.patch.object(tasks, "broadcaster"),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        for room in RoomDataModel.objects.all():
+            RoomPositionModel.objects.create(room_name=room, entry_point_x=0.0, entry_point_y=0.0)
+
+    def run_round(self):
+        now = timezone.localtime()
+        BatchScheduleModel.objects.filter(pk=self.batch.pk).update(
+            **{now.strftime("%A").lower(): True}, trigger_time=now.time()
+        )
+        with mock.patch.object(optimizer, "apply_plan", wraps=optimizer.apply_plan) as apply_plan:
+            tasks.check_and_send_schedules()
+        return apply_plan
+
+    def test_a_shorter_plan_is_applied(self):
+        self.run_round().assert_called_once()
+        self.assertEqual(ScheduledSlots.objects.get(pk=self.slots["r3"].pk).schedule_order, 2)
+        rooms = tasks.broadcaster.publish.call_args.args[1]["payload"]["scheduler"]
+        self.assertEqual([list(room)[0] for room in rooms], ["room_1", "room_3", "room_2"])
+
+    def test_a_round_already_in_its_shortest_order_is_left_alone(self):
+        optimizer.apply_plan(optimizer.plan_batch(self.batch, costs=self.costs))
+        self.run_round().assert_not_called()
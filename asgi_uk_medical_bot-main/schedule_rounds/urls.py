@@ -7,6 +7,7 @@ from .views import (
     export_batch_schedules_excel,
     import_batch_schedules_excel,
     mark_batch_as_completed,
+    optimize_room_order,
     remove_scheduled_slot,
     schedule_slots,
     swap_room_order_for_scheduled_slot,
@@ -42,6 +43,7 @@ urlpatterns = [
     path('view-active-slot-patient/', view_active_slot_patient, name='view every patient with active and slots available data'),
 
     path('swap-room-order-scheduled-slot/', swap_room_order_for_scheduled_slot, name='swap room order for scheduled slot url'),
+    path('optimize-room-order/', optimize_room_order, name='optimize room order'),
 
     path('create-scheduler-log/', create_scheduler_log, name='create_scheduler_log'),
     path('update-scheduler-log-attended/', update_scheduler_log_attended, name='update_scheduler_log_attended'),
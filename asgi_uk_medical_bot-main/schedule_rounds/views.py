@@ -19,6 +19,7 @@ from rest_framework.response import Response
 from mainapp.models import Patient
 from mainapp.serializers import PatientSerializer
 from privilagecontroller.views import hasFeatureAccess
+from . import optimizer
 from .models import BatchScheduleModel, ScheduledSlots, LogScheduler
 from .serializers import (
     BatchScheduleModelSerializer,
@@ -134,6 +135,13 @@ def schedule_slots(request):
         batch = BatchScheduleModel.objects.get(pk=batch_id)
         instance = ScheduledSlots.objects.get(patient=patient_id)
 
+        # 🔹 Pin the slot's place for route optimization; a pin does not
+        # follow the patient into another batch
+        if 'order_pinned' in request.data:
+            instance.order_pinned = str(request.data['order_pinned']).lower() in ('true', '1')
+        elif instance.batch_id != batch.pk:
+            instance.order_pinned = False
+
         # 🔹 Update batch
         instance.batch = batch
         instance.updated_by = request.user
@@ -679,7 +687,10 @@ def swap_room_order_for_scheduled_slot(request):
                     When(schedule_order=room_order_a, then=Value(room_order_b)),
                     When(schedule_order=room_order_b, then=Value(room_order_a)),
                     output_field=IntegerField()
-                )
+                ),
+                # a manual swap keeps the rooms in place when the round is
+                # optimized; their beds may still be reordered
+                room_pinned=True
             )
 
         if updated_count == 0:
@@ -702,6 +713,107 @@ def swap_room_order_for_scheduled_slot(request):
             'message': 'Internal server error.',
             'data': None
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def optimize_room_order(request):
+    """
+    Reorder the rooms of a batch, and the beds within each room, for the
+    shortest path over the active map. Optional "pinned": ScheduledSlots
+    ids whose place is kept, and "pinned_rooms": row numbers of rooms whose
+    position is kept (each replaces the batch's pins of that kind). With
+    "dry_run" the order is returned but nothing is saved.
+    """
+    try:
+        if request.user.role not in ['admin', 'nurse']:
+            return Response({
+                'status': 'error',
+                'message': 'Permission denied.',
+                'data': None
+            }, status=status.HTTP_403_FORBIDDEN)
+
+        if not hasFeatureAccess(request.user, 'batch_schedule_crud'):
+            return Response({
+                'status': 'error',
+                'message': 'Permission denied.',
+                'data': None
+            }, status=status.HTTP_403_FORBIDDEN)
+
+        batch_id = request.data.get('batch_id')
+        pinned = request.data.get('pinned')
+        pinned_rooms = request.data.get('pinned_rooms')
+        dry_run = str(request.data.get('dry_run', False)).lower() in ('true', '1')
+
+        if not batch_id:
+            return Response(
+                {'status': 'error', 'message': 'batch_id is required.', 'data': None},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        batch = BatchScheduleModel.objects.filter(pk=batch_id).first()
+        if batch is None:
+            return Response(
+                {'status': 'error', 'message': 'Batch not found.', 'data': None},
+                status=status.HTTP_404_NOT_FOUND
+            )
+
+        if pinned is not None:
+            try:
+                pinned = {int(slot_id) for slot_id in pinned}
+            except (TypeError, ValueError):
+                return Response(
+                    {'status': 'error', 'message': 'pinned must be a list of scheduled slot ids.', 'data': None},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+        if pinned_rooms is not None:
+            try:
+                pinned_rooms = {int(row_number) for row_number in pinned_rooms}
+            except (TypeError, ValueError):
+                return Response(
+                    {'status': 'error', 'message': 'pinned_rooms must be a list of room row numbers.', 'data': None},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+        # planning takes a while on a large round; only the result is
+        # written, in a short transaction
+        plan = optimizer.plan_batch(batch, pinned=pinned, pinned_rooms=pinned_rooms)
+        if plan is None:
+            return Response(
+                {'status': 'error', 'message': 'No path costs to plan the route on yet.', 'data': None},
+                status=status.HTTP_404_NOT_FOUND
+            )
+
+        if not dry_run:
+            planned = {slot_id for room in plan['rooms'] for slot_id in room['slots']}
+            with transaction.atomic():
+                slots = ScheduledSlots.objects.select_for_update().filter(batch=batch)
+                if set(slots.values_list('pk', flat=True)) != planned:
+                    return Response(
+                        {'status': 'error', 'message': 'The batch changed while planning, try again.', 'data': None},
+                        status=status.HTTP_409_CONFLICT
+                    )
+                if pinned is not None:
+                    slots.exclude(pk__in=pinned).update(order_pinned=False)
+                    slots.filter(pk__in=pinned).update(order_pinned=True)
+                if pinned_rooms is not None:
+                    slots.exclude(row_number__in=pinned_rooms).update(room_pinned=False)
+                    slots.filter(row_number__in=pinned_rooms).update(room_pinned=True)
+                optimizer.apply_plan(plan)
+
+        return Response({
+            'status': 'success',
+            'message': 'Room order proposed.' if dry_run else 'Room order optimized.',
+            'data': plan
+        })
+
+    except Exception as e:
+        logger.exception(f"Exception in optimize_room_order: {e}")
+        return Response({
+            'status': 'error',
+            'message': 'Internal server error.',
+            'data': None
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
     
 @api_view(["POST"])
 @permission_classes([AllowAny])
@@ -0,0 +1,158 @@
+"""
+Prometheus metrics for the HTTP views, the channel layer, the WebSocket
+consumers and the Celery tasks, scraped from /metrics.
+
+uvicorn and Celery run several processes. Set the PROMETHEUS_MULTIPROC_DIR
+environment variable to an empty directory (it must exist before they
+start) and /metrics aggregates every process; without it each process only
+reports its own metrics. Each container needs its own directory: metric
+files are named after process ids, which repeat across containers. The
+web processes are scraped from /metrics, which asks for the METRICS_TOKEN
+bearer token; a Celery worker serves the metrics of its pool on
+CELERY_METRICS_PORT instead.
+"""
+import hmac
+import os
+import time
+
+from celery.signals import task_postrun, task_prerun, worker_init, worker_process_shutdown
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+    start_http_server,
+)
+
+FAST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200)
+
+REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "Time to answer a request, per view.", ["view", "method", "status"],
+)
+REQUEST_QUERIES = Histogram(
+    "http_request_db_queries", "Database queries run by one request.", ["view"], buckets=QUERY_BUCKETS,
+)
+REQUEST_DB_SECONDS = Histogram(
+    "http_request_db_seconds", "Time one request spent in database queries.", ["view"], buckets=FAST_BUCKETS,
+)
+GROUP_SEND_SECONDS = Histogram(
+    "channel_layer_group_send_seconds", "Channel layer group_send latency, per group.", ["group"],
+    buckets=FAST_BUCKETS,
+)
+GROUP_MESSAGES = Counter(
+    "channel_layer_group_messages", "Messages sent to a channel layer group.", ["group"],
+)
+WEBSOCKET_CONNECTIONS = Gauge(
+    "websocket_connections", "Open WebSocket connections, per consumer class.", ["consumer"],
+    multiprocess_mode="livesum",
+)
+WEBSOCKET_DROPPED = Counter(
+    "websocket_dropped_messages", "Messages a slow client lost from its send queue.", ["consumer"],
+)
+TASK_SECONDS = Histogram(
+    "celery_task_duration_seconds", "Celery task run time.", ["task", "state"],
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 300),
+)
+SCHEDULE_LAG_SECONDS = Histogram(
+    "schedule_check_lag_seconds", "Delay between the minute a schedule check is due and its start.",
+    buckets=(0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60),
+)
+
+
+def _view_label(request):
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return "unmatched"
+    view = getattr(match.func, "view_class", match.func)
+    return f"{view.__module__}.{view.__name__}"
+
+
+def _group_label(group):
+    # per-robot groups ("<group>.<robot_id>") are counted under their shared name
+    return group.split(".", 1)[0]
+
+
+def observe_request(request, status, seconds, queries, db_seconds):
+    view = _view_label(request)
+    REQUEST_SECONDS.labels(view, request.method, status).observe(seconds)
+    REQUEST_QUERIES.labels(view).observe(queries)
+    REQUEST_DB_SECONDS.labels(view).observe(db_seconds)
+
+
+def observe_group_send(group, seconds):
+    group = _group_label(group)
+    GROUP_SEND_SECONDS.labels(group).observe(seconds)
+    GROUP_MESSAGES.labels(group).inc()
+
+
+def socket_opened(consumer):
+    WEBSOCKET_CONNECTIONS.labels(consumer).inc()
+
+
+def socket_closed(consumer, dropped=0):
+    WEBSOCKET_CONNECTIONS.labels(consumer).dec()
+    if dropped:
+        WEBSOCKET_DROPPED.labels(consumer).inc(dropped)
+
+
+def observe_schedule_lag(seconds):
+    SCHEDULE_LAG_SECONDS.observe(seconds)
+
+
+def _registry():
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return REGISTRY
+
+
+def _authorized(request):
+    token = settings.METRICS_TOKEN
+    if not token:
+        return False
+    scheme, _, credentials = request.headers.get("Authorization", "").partition(" ")
+    return scheme.lower() == "bearer" and hmac.compare_digest(credentials.encode(), token.encode())
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint, for callers with the METRICS_TOKEN bearer token."""
+    if not _authorized(request):
+        return HttpResponseForbidden("Metrics require the configured bearer token.")
+    return HttpResponse(generate_latest(_registry()), content_type=CONTENT_TYPE_LATEST)
+
+
+# ---- Celery ----
+_task_started = {}
+
+
+@task_prerun.connect
+def _task_prerun(task_id=None, **kwargs):
+    _task_started[task_id] = time.perf_counter()
+
+
+@task_postrun.connect
+def _task_postrun(task_id=None, task=None, state=None, **kwargs):
+    start = _task_started.pop(task_id, None)
+    if start is not None and task is not None:
+        TASK_SECONDS.labels(task.name, state or "UNKNOWN").observe(time.perf_counter() - start)
+
+
+@worker_init.connect
+def _worker_init(**kwargs):
+    # runs in the worker's main process, which outlives the pool processes it aggregates
+    if settings.CELERY_METRICS_PORT:
+        start_http_server(settings.CELERY_METRICS_PORT, registry=_registry())
+
+
+@worker_process_shutdown.connect
+def _worker_process_shutdown(pid=None, **kwargs):
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(pid or os.getpid())
@@ -1,4 +1,9 @@
 import threading
+import time
+
+from django.db import connection
+
+from utils import metrics
 
 _user = threading.local()
 
@@ -14,3 +19,36 @@ class CurrentUserMiddleware:
 
 def get_current_user():
     return getattr(_user, 'value', None)
+
+
+class QueryTimer:
+    """connection.execute_wrapper() hook counting queries and their time."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - start
+
+
+class MetricsMiddleware:
+    """Records latency and database usage of every request, per view."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        queries = QueryTimer()
+        start = time.perf_counter()
+        with connection.execute_wrapper(queries):
+            response = self.get_response(request)
+        metrics.observe_request(
+            request, response.status_code, time.perf_counter() - start, queries.count, queries.seconds
+        )
+        return response
@@ -0,0 +1,48 @@
+import hashlib
+
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from rest_framework.parsers import MultiPartParser
+
+
+class ChecksumUploadHandler(TemporaryFileUploadHandler):
+    """
+    Streams every uploaded file to a temporary file on disk, whatever its
+    size, and hashes it chunk by chunk on the way. The uploaded file gets
+    a `sha256` attribute (hex digest), so the file is never read back to
+    checksum it. Saving it to a FileField on local storage moves the
+    temporary file instead of copying it.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.hasher = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.hasher.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        file.sha256 = self.hasher.hexdigest()
+        return file
+
+
+class ChecksumMultiPartParser(MultiPartParser):
+    """MultiPartParser whose files go through ChecksumUploadHandler."""
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        request = parser_context["request"]
+        request.upload_handlers = [ChecksumUploadHandler(request._request)]
+        return super().parse(stream, media_type, parser_context)
+
+
+def file_checksum(file):
+    """sha256 hex digest of an uploaded file, from ChecksumUploadHandler when it saw it."""
+    digest = getattr(file, "sha256", None)
+    if digest:
+        return digest
+    hasher = hashlib.sha256()
+    for chunk in file.chunks():
+        hasher.update(chunk)
+    file.seek(0)
+    return hasher.hexdigest()
@@ -2,12 +2,12 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
 from rest_framework import status
+from django.db import transaction
 import logging
 from .models import Bp2CheckMeModel
 from .serializers import Bp2CheckMeSerializer
 from  privilagecontroller.views import hasFeatureAccess
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
+from robot_management import outbox
 from rest_framework.pagination import PageNumberPagination
 
 class ApparatusPagination(PageNumberPagination):
@@ -147,21 +147,21 @@ def robot_upsert_bp2_checkme(request):
         operation = "created"
 
         if serializer.is_valid():
-            instance = serializer.save()
-
-            channel_layer = get_channel_layer()
-            async_to_sync(channel_layer.group_send)(
-                "apparatus_value_group",
-                {
-                    "type": "apparatus_value_message",
-                    "payload": {
-                        "sys": instance.sys,
-                        'dia': instance.dia,
-                        'map': instance.map,
-                        'pulse_rate_note': instance.pulse_rate_note,
+            with transaction.atomic():
+                instance = serializer.save()
+
+                outbox.enqueue(
+                    "apparatus_value_group",
+                    {
+                        "type": "apparatus_value_message",
+                        "payload": {
+                            "sys": instance.sys,
+                            'dia': instance.dia,
+                            'map': instance.map,
+                            'pulse_rate_note': instance.pulse_rate_note,
+                        }
                     }
-                }
-            )
+                )
 
             return Response({
                 'status': 'success',